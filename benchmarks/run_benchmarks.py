@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+End-to-end performance benchmarks for the q1 tutor and the q2 reasoning pipeline
+
+Writes p50/p95 latency, tokens/sec, peak RSS and model load time as JSON and
+optionally compares the run against a saved baseline.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "q1"))
+sys.path.insert(0, os.path.join(ROOT, "q2", "src"))
+
+from common.backends import BACKENDS, GenerationBackend, create_backend
+from common.model_registry import PRECISIONS
+
+STRATEGIES = ["zero_shot_prompt", "few_shot_prompt", "chain_of_thought_prompt", "self_ask_prompt"]
+
+
+class CountingBackend(GenerationBackend):
+    """Wraps a backend and counts the tokens it generates"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.generated_tokens = 0
+
+    @property
+    def model_id(self):
+        return self.backend.model_id
+
+    @property
+    def precision(self):
+        return self.backend.precision
+
+    def spec(self):
+        # Sharded workers rebuild the wrapped backend; their tokens are not counted here
+        return self.backend.spec()
+
+    def shared_model(self):
+        return self.backend.shared_model()
+
+    def ready(self):
+        return self.backend.ready()
+
+    def wait_until_ready(self):
+        return self.backend.wait_until_ready()
+
+    def generate(self, prompts, *args, **kwargs):
+        completions = self.backend.generate(prompts, *args, **kwargs)
+        self.generated_tokens += sum(self.backend.count_tokens(c) for c in completions)
+        return completions
+
+    def stream(self, prompt, *args, **kwargs):
+        for piece in self.backend.stream(prompt, *args, **kwargs):
+            self.generated_tokens += self.backend.count_tokens(piece)
+            yield piece
+
+    def generate_many(self, requests, *args, **kwargs):
+        for tag, completion in self.backend.generate_many(requests, *args, **kwargs):
+            self.generated_tokens += self.backend.count_tokens(completion)
+            yield tag, completion
+
+    def count_tokens(self, text):
+        return self.backend.count_tokens(text)
+
+    def close(self):
+        self.backend.close()
+
+
+def percentile(values, p):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(name, calls, iterations, backend=None, warmup=1):
+    """Time `calls` (a list of zero-argument callables) over several iterations"""
+    for _ in range(warmup):
+        for call in calls:
+            call()
+
+    latencies = []
+    tokens_before = backend.generated_tokens if backend is not None else 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for call in calls:
+            call_start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "calls": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "tokens_per_second": None,
+        "peak_rss_mb": peak_rss_mb()
+    }
+    if backend is not None:
+        tokens = backend.generated_tokens - tokens_before
+        result["generated_tokens"] = tokens
+        result["tokens_per_second"] = tokens / elapsed if elapsed > 0 else 0.0
+
+    print(f"  {name:<36} p50 {result['p50_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms")
+    return result
+
+
+def bench_tutor_strategies(backend, iterations):
+    """Each q1 prompt strategy over the evaluation queries"""
+    from main import EdTechMathTutor
+
+    with open(os.path.join(ROOT, "q1", "evaluation", "input_queries.json"), "r") as f:
+        queries = json.load(f)["input_queries"]
+
+    # The strategies are measured on the model path; the solver is measured on its own
+    tutor = EdTechMathTutor(backend=backend, solver=False)
+    results = {}
+    for strategy in STRATEGIES:
+        method = getattr(tutor, strategy)
+        calls = [lambda q=query: method(q) for query in queries]
+        results[f"tutor.{strategy}"] = measure(f"tutor.{strategy}", calls, iterations, backend)
+
+    routed = EdTechMathTutor(backend=backend)
+    calls = [lambda q=query: routed.zero_shot_prompt(q) for query in queries]
+    results["tutor.solver"] = measure("tutor.solver", calls, iterations, backend)
+    results["tutor.solver"]["hit_rate"] = routed.solver_report()["hit_rate"]
+    return results
+
+
+def bench_reasoning_paths(backend, iterations, path_counts):
+    """ReasoningTree.generate_reasoning_paths at several path counts"""
+    from reasoning_tree import ReasoningTree
+
+    with open(os.path.join(ROOT, "q2", "tasks", "problem_definitions.json"), "r") as f:
+        tasks = json.load(f)["tasks"]
+    template = os.path.join(ROOT, "q2", "prompts", "initial_prompt.txt")
+
+    tree = ReasoningTree(backend=backend)
+    results = {}
+    for num_paths in path_counts:
+        name = f"reasoning_tree.paths_{num_paths}"
+        calls = [
+            lambda problem=task["problem"], n=num_paths: tree.generate_reasoning_paths(problem, template, num_paths=n)
+            for task in tasks
+        ]
+        results[name] = measure(name, calls, iterations, backend)
+    return results
+
+
+def bench_sharded_tasks(backend, iterations, worker_counts):
+    """The whole task file through ReasoningTree.generate_paths_sharded at several worker counts
+
+    Tokens are generated in the worker processes, so throughput is reported
+    in tasks per second together with the speedup over one worker.
+    """
+    from reasoning_tree import ReasoningTree
+
+    with open(os.path.join(ROOT, "q2", "tasks", "problem_definitions.json"), "r") as f:
+        tasks = json.load(f)["tasks"]
+    template = os.path.join(ROOT, "q2", "prompts", "initial_prompt.txt")
+
+    tree = ReasoningTree(backend=backend)
+    results = {}
+    for workers in worker_counts:
+        name = f"reasoning_tree.workers_{workers}"
+        call = lambda w=workers: list(tree.generate_paths_sharded(tasks, template, workers=w))
+        result = measure(name, [call], iterations)
+        result["tasks_per_second"] = len(tasks) / (result["mean_ms"] / 1000)
+        result["worker_stats"] = tree.worker_stats
+        results[name] = result
+
+    single = results.get("reasoning_tree.workers_1")
+    if single is not None:
+        for result in results.values():
+            result["speedup"] = result["tasks_per_second"] / single["tasks_per_second"]
+    return results
+
+
+def bench_self_consistency(iterations, path_counts, seed=0):
+    """SelfConsistency.aggregate_answers on large synthetic path sets"""
+    from records import ReasoningPath
+    from self_consistency import SelfConsistency
+
+    rng = random.Random(seed)
+    answers = ["15", "15 apples", "20", "no", "yes", "50 km/h", "Error"]
+    consistency = SelfConsistency()
+
+    results = {}
+    for num_paths in path_counts:
+        paths = [
+            ReasoningPath(i + 1, "", "", rng.choice(answers), rng.random())
+            for i in range(num_paths)
+        ]
+        name = f"self_consistency.aggregate_{num_paths}"
+        results[name] = measure(name, [lambda p=paths: consistency.aggregate_answers(p)], iterations)
+    return results
+
+
+def bench_optimizer_iteration(backend, iterations):
+    """One full PromptOptimizer.optimize_prompt iteration
+
+    Runs inside a scratch copy of the prompts directory so that the
+    optimized prompts it writes never touch the repository.
+    """
+    from optimizer_loop import PromptOptimizer
+
+    scratch = tempfile.mkdtemp(prefix="optimizer-bench-")
+    shutil.copytree(os.path.join(ROOT, "q2", "prompts"), os.path.join(scratch, "prompts"))
+    os.makedirs(os.path.join(scratch, "src"))
+
+    failure_analysis = {"accuracy": 0.43, "consistency": 0.55, "main_issue": "arithmetic slips"}
+    failed_cases = [
+        {"problem": "A store sells notebooks for $3 each...", "expected_answer": "$14.40", "actual_answer": "$18"},
+        {"problem": "Sarah has 3 times as many apples as Tom...", "expected_answer": "15", "actual_answer": "5"}
+    ]
+
+    cwd = os.getcwd()
+    os.chdir(os.path.join(scratch, "src"))
+    try:
+        optimizer = PromptOptimizer(backend=backend)
+        call = lambda: optimizer.optimize_prompt(
+            "../prompts/initial_prompt.txt", failure_analysis, failed_cases, iteration=999
+        )
+        return {"optimizer.iteration": measure("optimizer.iteration", [call], iterations, backend)}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def compare(report, baseline, threshold):
+    """List benchmarks whose p50 latency regressed by more than `threshold`"""
+    regressions = []
+    for name, current in report["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        change = current["p50_ms"] / previous["p50_ms"] - 1
+        current["p50_change_vs_baseline"] = change
+        if change > threshold:
+            regressions.append({
+                "benchmark": name,
+                "baseline_p50_ms": previous["p50_ms"],
+                "current_p50_ms": current["p50_ms"],
+                "change": change
+            })
+    return regressions
+
+
+def build_backend(args):
+    """Create the backend under test"""
+    if args.backend == "stub":
+        backend = create_backend(
+            "stub",
+            seed=args.seed,
+            latency=args.stub_latency,
+            token_latency=args.stub_token_latency
+        )
+    elif args.backend == "transformers":
+        backend = create_backend(args.backend, model_name=args.model, dtype=args.precision, background_load=False)
+    else:
+        backend = create_backend(args.backend, model_name=args.model, background_load=False)
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt strategies and the reasoning pipeline")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="stub", help="generation runtime")
+    parser.add_argument("--model", default="microsoft/DialoGPT-small", help="model for real backends")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32",
+                        help="inference precision for the transformers backend")
+    parser.add_argument("--iterations", type=int, default=3, help="timed repetitions of each benchmark")
+    parser.add_argument("--paths", type=int, nargs="+", default=[1, 3, 5, 10], help="num_paths values for ReasoningTree")
+    parser.add_argument("--aggregate-paths", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="path counts for SelfConsistency aggregation")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="worker process counts for the sharding group")
+    parser.add_argument("--only", nargs="+", choices=["tutor", "reasoning", "consistency", "optimizer", "sharding"],
+                        help="run only these benchmark groups (sharding runs only when named)")
+    parser.add_argument("--seed", type=int, default=0, help="stub backend seed")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="stub seconds per generate call")
+    parser.add_argument("--stub-token-latency", type=float, default=0.0, help="stub seconds per generated token")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p50 slowdown before failing (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    groups = set(args.only or ["tutor", "reasoning", "consistency", "optimizer"])
+
+    print(f"🏁 Benchmarking with the {args.backend} backend")
+    load_start = time.perf_counter()
+    backend = CountingBackend(build_backend(args))
+    backend.wait_until_ready()
+    model_load_time = time.perf_counter() - load_start
+
+    benchmarks = {}
+    try:
+        if "tutor" in groups:
+            benchmarks.update(bench_tutor_strategies(backend, args.iterations))
+        if "reasoning" in groups:
+            benchmarks.update(bench_reasoning_paths(backend, args.iterations, args.paths))
+        if "consistency" in groups:
+            benchmarks.update(bench_self_consistency(args.iterations, args.aggregate_paths, args.seed))
+        if "optimizer" in groups:
+            benchmarks.update(bench_optimizer_iteration(backend, args.iterations))
+        if "sharding" in groups:
+            benchmarks.update(bench_sharded_tasks(backend, args.iterations, args.workers))
+    finally:
+        backend.close()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "backend": args.backend,
+        "model_id": backend.model_id,
+        "precision": backend.precision,
+        "iterations": args.iterations,
+        "model_load_time_s": model_load_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "benchmarks": benchmarks
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        report["baseline"] = args.baseline
+        report["threshold"] = args.threshold
+        report["regressions"] = regressions
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📁 Results saved to {args.output}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"   {regression['benchmark']}: {regression['baseline_p50_ms']:.2f} ms -> "
+                  f"{regression['current_p50_ms']:.2f} ms ({regression['change']:+.0%})")
+        return 1
+    if args.baseline:
+        print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Shared model runtime used by the q1 tutor and the q2 reasoning pipeline"""
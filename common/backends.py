@@ -0,0 +1,454 @@
+import random
+import re
+import time
+
+from common.metrics import current_call, get_metrics
+from common.model_registry import DEFAULT_MODEL, get_registry
+from common.prefix_cache import get_prefix_cache
+from common.profiling import phase
+
+
+class GenerationBackend:
+    """Interface shared by every text generation runtime
+
+    Backends turn prompts into continuations (the text after the prompt).
+    Everything else - caching, prompt building, answer extraction - lives
+    in the callers, so runtimes can be swapped without touching them.
+    """
+
+    name = "base"
+
+    @property
+    def model_id(self):
+        """Identifier of the model and runtime, used in cache keys and reports"""
+        raise NotImplementedError
+
+    @property
+    def precision(self):
+        """Numeric precision the model runs in"""
+        return "float32"
+
+    def spec(self):
+        """(name, options) that rebuild this backend with create_backend, e.g. in a worker process"""
+        raise NotImplementedError
+
+    def shared_model(self):
+        """SharedModel that workers rebuilt from spec() can attach to, or None to load their own"""
+        return None
+
+    def ready(self):
+        """True once the backend can generate without waiting"""
+        return True
+
+    def wait_until_ready(self):
+        """Block until the model is loaded; returns the load time in seconds"""
+        return 0.0
+
+    def generate(self, prompts, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+                 prefix=None, seed=None, stop=None, stats=None):
+        """Return one continuation per prompt
+
+        If a `stats` dict is given, stats["generated_tokens"] lists how many
+        tokens were generated for each prompt, counting those decoded past
+        the stop point that the returned text no longer holds.
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+               seed=None, stats=None, stop=None):
+        """Yield the continuation of one prompt piece by piece
+
+        The default generates the whole continuation and yields it at once.
+        """
+        start = time.perf_counter()
+        text = self.generate([prompt], max_new_tokens, do_sample, temperature, top_p, seed=seed, stop=stop)[0]
+        elapsed = time.perf_counter() - start
+        if stats is not None:
+            tokens = self.count_tokens(text)
+            stats["time_to_first_token"] = elapsed
+            stats["total_time"] = elapsed
+            stats["tokens"] = tokens
+            stats["tokens_per_second"] = tokens / elapsed if elapsed > 0 else 0.0
+        yield text
+
+    def generate_many(self, requests, max_batch_size=8, **generation_kwargs):
+        """Yield (tag, continuation) for an iterable of (tag, prompt) requests
+
+        The default runs fixed batches; backends that can refill a batch as
+        sequences finish override this.
+        """
+        batch = []
+        for tag, prompt in requests:
+            batch.append((tag, prompt))
+            if len(batch) == max_batch_size:
+                yield from self._generate_tagged(batch, generation_kwargs)
+                batch = []
+        if batch:
+            yield from self._generate_tagged(batch, generation_kwargs)
+
+    def count_tokens(self, text):
+        """Number of tokens the model would see for `text`"""
+        with phase("tokenization"):
+            return len(text.split())
+
+    def close(self):
+        """Release the model held by this backend"""
+
+    def _generate_tagged(self, batch, generation_kwargs):
+        completions = self.generate([prompt for _, prompt in batch], **generation_kwargs)
+        for (tag, _), completion in zip(batch, completions):
+            yield tag, completion
+
+
+class TransformersBackend(GenerationBackend):
+    """Hugging Face transformers model from the shared registry"""
+
+    name = "transformers"
+    runtime = "transformers"
+
+    def __init__(self, model_name=DEFAULT_MODEL, dtype="float32", device="cpu", background_load=True,
+                 prefix_cache=None):
+        self.prefix_cache = prefix_cache if prefix_cache is not None else get_prefix_cache()
+        self._load_started = time.perf_counter()
+        self._load_time = None
+        self._handle = get_registry().handle(
+            model_name, dtype, device, runtime=self.runtime, background=background_load
+        )
+
+    @property
+    def model_id(self):
+        return "|".join(self._handle.key)
+
+    @property
+    def precision(self):
+        return self._handle.key[1]
+
+    @property
+    def loaded(self):
+        """The shared LoadedModel, blocking until the background load is done"""
+        return self._handle.get()
+
+    def spec(self):
+        model_name, dtype, device, _ = self._handle.key
+        return self.name, {"model_name": model_name, "dtype": dtype, "device": device, "background_load": False}
+
+    def shared_model(self):
+        return get_registry().share(self.loaded)
+
+    def ready(self):
+        return self._handle.ready()
+
+    def wait_until_ready(self):
+        self._handle.get()
+        if self._load_time is None:
+            self._load_time = time.perf_counter() - self._load_started
+        return self._load_time
+
+    def generate(self, prompts, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+                 prefix=None, seed=None, stop=None, stats=None):
+        from common.generation import generate_batch
+
+        with phase("generation"):
+            return generate_batch(
+                self.loaded,
+                prompts,
+                max_new_tokens=max_new_tokens,
+                do_sample=do_sample,
+                temperature=temperature,
+                top_p=top_p,
+                prefix=prefix,
+                prefix_cache=self.prefix_cache,
+                seed=seed,
+                stop=stop,
+                stats=stats
+            )
+
+    def stream(self, prompt, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+               seed=None, stats=None, stop=None):
+        from common.generation import stream_generate
+
+        return stream_generate(
+            self.loaded,
+            prompt,
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            temperature=temperature,
+            top_p=top_p,
+            seed=seed,
+            stats=stats,
+            stop=stop
+        )
+
+    def generate_many(self, requests, max_batch_size=8, max_new_tokens=100, do_sample=True, temperature=0.8,
+                      top_p=0.9, stop=None, seed=None, **ignored):
+        from common.continuous_batching import ContinuousBatcher
+
+        batcher = ContinuousBatcher(
+            self.loaded,
+            max_batch_size=max_batch_size,
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            seed=seed
+        )
+        return batcher.run(requests)
+
+    def count_tokens(self, text):
+        with phase("tokenization"):
+            return len(self.loaded.tokenizer(text)["input_ids"])
+
+    def close(self):
+        self._handle.release()
+
+
+class OnnxRuntimeBackend(TransformersBackend):
+    """The same model exported to ONNX and run with ONNX Runtime on CPU
+
+    Needs the optional `optimum[onnxruntime]` package. ONNX Runtime models
+    take tuple caches only, so prefix caching and continuous batching are
+    replaced by plain fixed batches. The exported graph always runs in
+    float32.
+    """
+
+    name = "onnxruntime"
+    runtime = "onnxruntime"
+
+    def __init__(self, model_name=DEFAULT_MODEL, background_load=True):
+        super().__init__(model_name, "float32", "cpu", background_load=background_load)
+        self.prefix_cache = None
+
+    def spec(self):
+        return self.name, {"model_name": self._handle.key[0], "background_load": False}
+
+    def generate(self, prompts, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+                 prefix=None, seed=None, stop=None, stats=None):
+        return super().generate(prompts, max_new_tokens, do_sample, temperature, top_p, seed=seed, stop=stop,
+                                stats=stats)
+
+    def generate_many(self, requests, max_batch_size=8, **generation_kwargs):
+        return GenerationBackend.generate_many(self, requests, max_batch_size, **generation_kwargs)
+
+
+class StubBackend(GenerationBackend):
+    """Deterministic offline backend for tests, benchmarks and air-gapped CI
+
+    Continuations are built from the numbers found in the prompt with a
+    random generator seeded by (seed, prompt, row), so a run is exactly
+    reproducible. `latency` is paid once per generate call and
+    `token_latency` once per produced token, to mimic a real model's cost.
+    """
+
+    name = "stub"
+
+    OPENINGS = [
+        "Let me work through this step by step.",
+        "First, identify what the problem is asking.",
+        "Breaking the problem into smaller parts.",
+        "Looking at the given information carefully."
+    ]
+
+    def __init__(self, seed=0, latency=0.0, token_latency=0.0, load_time=0.0, agreement=0.7):
+        self.seed = seed
+        self.latency = latency
+        self.token_latency = token_latency
+        self.load_time = load_time
+        self.agreement = agreement
+        self._loaded_at = time.perf_counter() + load_time
+
+    @property
+    def model_id(self):
+        return f"stub|seed={self.seed}"
+
+    def spec(self):
+        return self.name, {"seed": self.seed, "latency": self.latency, "token_latency": self.token_latency,
+                           "load_time": self.load_time, "agreement": self.agreement}
+
+    def ready(self):
+        return time.perf_counter() >= self._loaded_at
+
+    def wait_until_ready(self):
+        remaining = self._loaded_at - time.perf_counter()
+        if remaining > 0:
+            with phase("model_load"):
+                time.sleep(remaining)
+        return self.load_time
+
+    def generate(self, prompts, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+                 prefix=None, seed=None, stop=None, stats=None):
+        self.wait_until_ready()
+        with phase("generation"):
+            rows = [
+                self._complete(prompt, row, max_new_tokens, do_sample, seed, stop)
+                for row, prompt in enumerate(prompts)
+            ]
+            completions = [completion for completion, _ in rows]
+            generated = [tokens for _, tokens in rows]
+            tokens = max(generated, default=0)
+            self._sleep(self.latency + self.token_latency * tokens)
+        if stats is not None:
+            stats["generated_tokens"] = generated
+
+        # The simulated cost splits into a per-call prefill and per-token decode
+        call = current_call()
+        if call is not None:
+            call.prefill += self.latency
+            call.decode += self.token_latency * tokens
+        return completions
+
+    def stream(self, prompt, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+               seed=None, stats=None, stop=None):
+        self.wait_until_ready()
+        start = time.perf_counter()
+        first_token_at = None
+        produced = 0
+        words = self._complete(prompt, 0, max_new_tokens, do_sample, seed, stop)[0].split(" ")
+
+        self._sleep(self.latency)
+        try:
+            for i, word in enumerate(words):
+                self._sleep(self.token_latency)
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                produced += 1
+                yield word if i == 0 else " " + word
+        finally:
+            if stats is not None:
+                total_time = time.perf_counter() - start
+                stats["time_to_first_token"] = (first_token_at or time.perf_counter()) - start
+                stats["total_time"] = total_time
+                stats["tokens"] = produced
+                stats["tokens_per_second"] = produced / total_time if total_time > 0 else 0.0
+
+    def _complete(self, prompt, row, max_new_tokens, do_sample, seed, stop):
+        """(continuation, tokens generated) for one prompt, deterministically
+
+        Like a model, the stub only notices the stop point once the word
+        completing it is out, so that word is generated but not returned.
+        """
+        rng = random.Random(f"{self.seed}|{seed}|{prompt}|{row if do_sample else 0}")
+
+        # Numbered instruction lines in templates are not part of the problem
+        body = re.sub(r'(?m)^\s*\d+\.\s', '', prompt)
+        numbers = re.findall(r'\d+(?:\.\d+)?', body)
+        if numbers:
+            candidates = numbers[:3]
+        else:
+            candidates = ["yes", "no"]
+
+        # Most samples agree on one candidate, like a model that is fairly sure
+        if rng.random() < self.agreement:
+            answer = candidates[0]
+        else:
+            answer = rng.choice(candidates)
+
+        text = (
+            f" The answer is {answer}.\n"
+            f"{rng.choice(self.OPENINGS)}\n"
+            f"Using the given values step by step, so the result follows.\n"
+            f"Therefore the final answer is {answer}.\n"
+            f"Final Answer: {answer}\n"
+            f"This can be checked by substituting back."
+        )
+
+        words = text.split(" ")
+        text = " ".join(words[:max_new_tokens])
+        cut = stop.find_stop(text) if stop is not None else None
+        if cut is None:
+            return text, self.count_tokens(text)
+        end = text.find(" ", cut)
+        return text[:cut], self.count_tokens(text if end < 0 else text[:end])
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+BACKENDS = {
+    "transformers": TransformersBackend,
+    "onnxruntime": OnnxRuntimeBackend,
+    "stub": StubBackend
+}
+
+
+def create_backend(name="transformers", **options):
+    """Instantiate a backend by name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Choose from: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name](**options)
+
+
+def generate_cached(backend, prompts, cache=None, seed=None, sample_ids=None, stats=None, **generation_kwargs):
+    """backend.generate behind an optional persistent response cache
+
+    Each prompt is looked up with its sample id, so identical prompts that
+    are sampled several times get separate entries. Only the misses are
+    generated, together in one batch. Unseeded sampling bypasses the cache.
+    With metrics enabled the call is recorded under the labels currently in
+    effect. With a `stats` dict, stats["generated_tokens"] holds the tokens
+    the backend generated for each prompt; a cache hit counts its completion.
+    """
+    with get_metrics().call() as call:
+        completions, generated = _generate_cached(backend, prompts, cache, seed, sample_ids, generation_kwargs, call)
+    if stats is not None:
+        stats["generated_tokens"] = generated
+    return completions
+
+
+def _generate_cached(backend, prompts, cache, seed, sample_ids, generation_kwargs, call):
+    """(completions, generated tokens per prompt)"""
+    if cache is None or not cacheable(generation_kwargs, seed):
+        return _generate_counted(backend, prompts, seed, generation_kwargs, call)
+
+    if sample_ids is None:
+        sample_ids = range(len(prompts))
+
+    keys = [
+        response_key(cache, backend, prompt, generation_kwargs, seed, sample_id)
+        for prompt, sample_id in zip(prompts, sample_ids)
+    ]
+
+    completions = [cache.get(key) for key in keys]
+    missing = [i for i, completion in enumerate(completions) if completion is None]
+    if call is not None:
+        call.cache_hits += len(prompts) - len(missing)
+        call.cache_misses += len(missing)
+
+    generated = [None if completion is None else backend.count_tokens(completion) for completion in completions]
+    if missing:
+        fresh, fresh_tokens = _generate_counted(backend, [prompts[i] for i in missing], seed, generation_kwargs, call)
+        for i, completion, tokens in zip(missing, fresh, fresh_tokens):
+            cache.put(keys[i], completion)
+            completions[i] = completion
+            generated[i] = tokens
+
+    return completions, generated
+
+
+def _generate_counted(backend, prompts, seed, generation_kwargs, call):
+    """backend.generate and its generated tokens per prompt, adding token counts to `call` if set"""
+    stats = {}
+    completions = backend.generate(prompts, seed=seed, stats=stats, **generation_kwargs)
+    generated = stats.get("generated_tokens") or [backend.count_tokens(completion) for completion in completions]
+    if call is not None:
+        call.prompt_tokens += sum(backend.count_tokens(prompt) for prompt in prompts)
+        call.generated_tokens += sum(generated)
+    return completions, generated
+
+
+def cacheable(generation_kwargs, seed):
+    """True when a generation is reproducible and may be served from the response cache
+
+    An unseeded sample is a fresh draw each time; replaying a stored one
+    would silently collapse the diversity of repeated sampling.
+    """
+    return seed is not None or not generation_kwargs.get("do_sample", True)
+
+
+def response_key(cache, backend, prompt, generation_kwargs, seed=None, sample_id=0):
+    """Response cache key for one sample of a prompt under the given generation settings"""
+    params = {name: value for name, value in generation_kwargs.items() if name != "prefix"}
+    if params.get("stop") is not None:
+        params["stop"] = params["stop"].as_key()
+    return cache.make_key(backend.model_id, prompt, params, seed, sample_id)
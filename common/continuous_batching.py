@@ -0,0 +1,286 @@
+import time
+import zlib
+
+import torch
+
+from common.metrics import current_call
+from common.prefix_cache import as_model_cache, to_legacy
+from common.profiling import phase
+from common.stopping import StopTracker
+
+
+class GenerationRequest:
+    """One prompt travelling through the continuous batch"""
+
+    def __init__(self, tag, prompt, max_new_tokens, generator=None):
+        self.tag = tag
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.generator = generator
+        self.generated = []
+        self.stop_tracker = None
+
+
+class _BatchState:
+    """Key/value tensors and bookkeeping for the sequences currently decoding
+
+    Rows may have different lengths; shorter rows are left-padded in the
+    cache and the padding is hidden by the attention mask.
+    """
+
+    def __init__(self, layers, attention_mask, positions, next_tokens):
+        self.layers = layers
+        self.attention_mask = attention_mask
+        self.positions = positions
+        self.next_tokens = next_tokens
+
+    @property
+    def batch_size(self):
+        return self.attention_mask.shape[0]
+
+    @property
+    def length(self):
+        return self.attention_mask.shape[1]
+
+
+class ContinuousBatcher:
+    """Decode loop that keeps a fixed number of sequences in flight
+
+    New prompts are admitted as soon as a running sequence hits EOS, its
+    token limit or its stop condition, so the batch never waits on a single
+    long straggler. With a `seed`, each request samples from its own
+    generator seeded by (seed, admission order), so a run is reproducible
+    whatever the requests end up batched with.
+    """
+
+    def __init__(self, loaded, max_batch_size=8, max_new_tokens=100, do_sample=True, temperature=0.8, top_p=0.9,
+                 stop=None, seed=None):
+        self.loaded = loaded
+        self.stop = stop
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.do_sample = do_sample
+        self.temperature = temperature
+        self.top_p = top_p
+        self.seed = seed
+        config = loaded.model.config
+        self.n_positions = getattr(config, "n_positions", None) or getattr(config, "max_position_embeddings", None)
+
+    def run(self, requests):
+        """Yield (tag, completion) pairs as sequences finish
+
+        `requests` is an iterable of (tag, prompt) pairs and is consumed
+        lazily, only when a batch slot frees up.
+        """
+        pending = iter(requests)
+        active = []
+        state = None
+        exhausted = False
+        admitted = 0
+
+        while True:
+            # Top the batch up with new sequences
+            while not exhausted and len(active) < self.max_batch_size:
+                try:
+                    tag, prompt = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                request = GenerationRequest(tag, prompt, self.max_new_tokens, self._generator(admitted))
+                admitted += 1
+                call = current_call()
+                if call is not None:
+                    start = time.perf_counter()
+                    row = self._prefill(request)
+                    call.tag_prefill[tag] = time.perf_counter() - start
+                else:
+                    row = self._prefill(request)
+                if self._is_finished(request):
+                    yield request.tag, self._decode(request)
+                    continue
+                state = self._merge(state, row)
+                active.append(request)
+
+            if not active:
+                break
+
+            tokens = self._decode_step(state, active)
+
+            keep = []
+            for row, (request, token) in enumerate(zip(active, tokens)):
+                request.generated.append(token)
+                if self._is_finished(request):
+                    yield request.tag, self._decode(request)
+                else:
+                    keep.append(row)
+
+            if len(keep) < len(active):
+                active = [active[row] for row in keep]
+                state = self._select(state, keep) if keep else None
+
+    def _prefill(self, request):
+        """Encode a new prompt and sample its first token"""
+        model = self.loaded.model
+        with phase("tokenization"):
+            input_ids = self.loaded.tokenizer(request.prompt, return_tensors="pt")["input_ids"].to(model.device)
+        self._fit_to_window(request, input_ids.shape[1])
+
+        with phase("generation"), torch.no_grad():
+            output = model(input_ids, use_cache=True)
+
+        token = self._sample(output.logits[:, -1, :], [request])
+        request.generated.append(token[0].item())
+
+        length = input_ids.shape[1]
+        return _BatchState(
+            list(to_legacy(output.past_key_values)),
+            torch.ones((1, length), dtype=torch.long, device=model.device),
+            torch.tensor([length], device=model.device),
+            token
+        )
+
+    def _fit_to_window(self, request, prompt_length):
+        """Check a prompt against the model's position window before it joins the batch
+
+        Generation is capped where the window ends; a prompt that leaves no
+        room at all is rejected here rather than failing the shared batch
+        partway through.
+        """
+        if self.n_positions is None:
+            return
+        room = self.n_positions - prompt_length
+        if room < 1:
+            raise ValueError(
+                f"Prompt of {prompt_length} tokens leaves no room to generate within "
+                f"the model's {self.n_positions} positions"
+            )
+        request.max_new_tokens = min(request.max_new_tokens, room)
+
+    def _generator(self, admitted):
+        """Random generator of the `admitted`-th request, or None to share the global one"""
+        if self.seed is None or not self.do_sample:
+            return None
+        generator = torch.Generator(device=self.loaded.model.device)
+        generator.manual_seed(zlib.crc32(f"{self.seed}|{admitted}".encode()))
+        return generator
+
+    def _decode_step(self, state, active):
+        """Advance every running sequence by one token"""
+        model = self.loaded.model
+        attention_mask = torch.cat(
+            [state.attention_mask, torch.ones((state.batch_size, 1), dtype=torch.long, device=model.device)],
+            dim=1
+        )
+
+        with phase("generation"), torch.no_grad():
+            output = model(
+                input_ids=state.next_tokens.unsqueeze(-1),
+                past_key_values=as_model_cache(tuple(state.layers)),
+                attention_mask=attention_mask,
+                position_ids=state.positions.unsqueeze(-1),
+                use_cache=True
+            )
+
+        tokens = self._sample(output.logits[:, -1, :], active)
+        state.layers = list(to_legacy(output.past_key_values))
+        state.attention_mask = attention_mask
+        state.positions = state.positions + 1
+        state.next_tokens = tokens
+        return tokens.tolist()
+
+    def _merge(self, state, row):
+        """Add a prefilled sequence to the running batch"""
+        if state is None:
+            return row
+
+        width = max(state.length, row.length)
+        state = _left_pad(state, width)
+        row = _left_pad(row, width)
+
+        return _BatchState(
+            [
+                (torch.cat([key, row_key]), torch.cat([value, row_value]))
+                for (key, value), (row_key, row_value) in zip(state.layers, row.layers)
+            ],
+            torch.cat([state.attention_mask, row.attention_mask]),
+            torch.cat([state.positions, row.positions]),
+            torch.cat([state.next_tokens, row.next_tokens])
+        )
+
+    def _select(self, state, rows):
+        """Keep only the given rows and drop padding nobody needs any more"""
+        index = torch.tensor(rows, device=state.attention_mask.device)
+        attention_mask = state.attention_mask.index_select(0, index)
+
+        # Leading columns that are padding for every remaining row
+        start = int(attention_mask.any(dim=0).long().argmax())
+
+        return _BatchState(
+            [
+                (key.index_select(0, index)[:, :, start:], value.index_select(0, index)[:, :, start:])
+                for key, value in state.layers
+            ],
+            attention_mask[:, start:],
+            state.positions.index_select(0, index),
+            state.next_tokens.index_select(0, index)
+        )
+
+    def _sample(self, logits, requests):
+        """Pick the next token for each row with temperature and nucleus sampling"""
+        if not self.do_sample:
+            return logits.argmax(dim=-1)
+
+        probs = torch.softmax(logits.float() / self.temperature, dim=-1)
+        if self.top_p < 1.0:
+            sorted_probs, sorted_index = probs.sort(dim=-1, descending=True)
+            outside_nucleus = sorted_probs.cumsum(dim=-1) - sorted_probs > self.top_p
+            sorted_probs = sorted_probs.masked_fill(outside_nucleus, 0.0)
+            probs = torch.zeros_like(probs).scatter(-1, sorted_index, sorted_probs)
+        if self.seed is None:
+            return torch.multinomial(probs, 1).squeeze(-1)
+        # Each row draws from its own request's generator
+        return torch.cat([
+            torch.multinomial(row_probs, 1, generator=request.generator)
+            for row_probs, request in zip(probs, requests)
+        ])
+
+    def _is_finished(self, request):
+        """A sequence ends on EOS, at its token limit or when its stop condition matches"""
+        if request.generated[-1] == self.loaded.tokenizer.eos_token_id:
+            return True
+        if len(request.generated) >= request.max_new_tokens:
+            return True
+        if self.stop is not None:
+            if request.stop_tracker is None:
+                request.stop_tracker = StopTracker(self.stop, self.loaded.tokenizer)
+            with phase("tokenization"):
+                return request.stop_tracker.update(request.generated)
+        return False
+
+    def _decode(self, request):
+        """Turn the generated tokens of a finished sequence back into text"""
+        with phase("tokenization"):
+            text = self.loaded.tokenizer.decode(request.generated, skip_special_tokens=True)
+        return self.stop.truncate(text) if self.stop is not None else text
+
+
+def _left_pad(state, width):
+    """Left-pad a batch state's cache and mask to `width` positions"""
+    padding = width - state.length
+    if padding == 0:
+        return state
+
+    layers = []
+    for key, value in state.layers:
+        shape = (key.shape[0], key.shape[1], padding, key.shape[3])
+        layers.append((
+            torch.cat([key.new_zeros(shape), key], dim=2),
+            torch.cat([value.new_zeros(shape), value], dim=2)
+        ))
+
+    attention_mask = torch.cat(
+        [state.attention_mask.new_zeros((state.batch_size, padding)), state.attention_mask],
+        dim=1
+    )
+    return _BatchState(layers, attention_mask, state.positions, state.next_tokens)
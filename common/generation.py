@@ -0,0 +1,271 @@
+import time
+
+from common.metrics import current_call
+from common.profiling import phase
+from common.stopping import build_stopping_criteria
+
+
+def generate_batch(loaded, prompts, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+                   prefix=None, prefix_cache=None, seed=None, stop=None, stats=None):
+    """Generate one continuation per prompt in a single batched generate call
+
+    When every prompt starts with `prefix` and a prefix cache is given, the
+    prefix is encoded once and its key/values are forked for each prompt.
+    A `stop` condition ends each row as soon as it matches and trims the
+    returned text at the stop point. If a `stats` dict is given,
+    stats["generated_tokens"] lists the tokens each row actually generated,
+    including any decoded past its stop point.
+    """
+    if not prompts:
+        return []
+
+    import torch
+
+    if seed is not None:
+        torch.manual_seed(seed)
+
+    if prefix and prefix_cache is not None and all(prompt.startswith(prefix) for prompt in prompts):
+        completions = _generate_from_prefix(
+            loaded, prompts, prefix, prefix_cache,
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            stats=stats
+        )
+        if completions is not None:
+            return completions
+
+    tokenizer = loaded.tokenizer
+    model = loaded.model
+
+    with phase("tokenization"):
+        if len(set(prompts)) == 1:
+            # Identical prompts: encode once and sample several continuations
+            encoded = tokenizer(prompts[0], return_tensors="pt")
+            num_return_sequences = len(prompts)
+        else:
+            # Different prompts: left-pad so every row ends where generation starts
+            encoded = tokenizer(list(prompts), return_tensors="pt", padding=True)
+            num_return_sequences = 1
+
+    encoded = encoded.to(model.device)
+    prompt_length = encoded["input_ids"].shape[1]
+    with torch.no_grad():
+        output = _timed_generate(
+            model,
+            **encoded,
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            temperature=temperature,
+            top_p=top_p,
+            num_return_sequences=num_return_sequences,
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=_stopping_criteria(stop, tokenizer, prompt_length)
+        )
+
+    return _decode_new_tokens(tokenizer, output[:, prompt_length:], stop, stats)
+
+
+def _generate_from_prefix(loaded, prompts, prefix, prefix_cache, stop=None, stats=None, **sampling):
+    """Generate continuations that reuse the cached key/values of a shared prefix
+
+    Returns None when the prompts do not tokenize to the cached prefix, in
+    which case the caller falls back to a plain batch.
+    """
+    import torch
+
+    tokenizer = loaded.tokenizer
+    model = loaded.model
+
+    entry = prefix_cache.get(loaded, prefix)
+    prefix_ids = entry.input_ids[0].tolist()
+    prefix_length = len(prefix_ids)
+
+    suffixes = []
+    with phase("tokenization"):
+        for prompt in prompts:
+            ids = tokenizer(prompt)["input_ids"]
+            if len(ids) <= prefix_length or ids[:prefix_length] != prefix_ids:
+                return None
+            suffixes.append(ids[prefix_length:])
+
+    # Rows are laid out as [prefix | padding | suffix] so that every row ends
+    # where generation starts; the mask hides the padding in the middle
+    suffix_width = max(len(suffix) for suffix in suffixes)
+    input_ids = []
+    attention_mask = []
+    for suffix in suffixes:
+        padding = suffix_width - len(suffix)
+        input_ids.append(prefix_ids + [tokenizer.pad_token_id] * padding + suffix)
+        attention_mask.append([1] * prefix_length + [0] * padding + [1] * len(suffix))
+
+    input_ids = torch.tensor(input_ids, device=model.device)
+    attention_mask = torch.tensor(attention_mask, device=model.device)
+
+    with torch.no_grad():
+        output = _timed_generate(
+            model,
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=entry.fork(len(prompts)),
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=_stopping_criteria(stop, tokenizer, input_ids.shape[1]),
+            **sampling
+        )
+
+    return _decode_new_tokens(tokenizer, output[:, input_ids.shape[1]:], stop, stats)
+
+
+def _timed_generate(model, stopping_criteria=None, **kwargs):
+    """model.generate, adding its prefill and decode time to the current metrics call
+
+    Stopping criteria run after every new token, so the first time they are
+    consulted marks the end of the prefill.
+    """
+    call = current_call()
+    if call is None:
+        return model.generate(stopping_criteria=stopping_criteria, **kwargs)
+
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class FirstToken(StoppingCriteria):
+        def __init__(self):
+            self.at = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.at is None:
+                self.at = time.perf_counter()
+            return False
+
+    first_token = FirstToken()
+    criteria = StoppingCriteriaList([first_token])
+    if stopping_criteria is not None:
+        criteria.extend(stopping_criteria)
+
+    start = time.perf_counter()
+    output = model.generate(stopping_criteria=criteria, **kwargs)
+    end = time.perf_counter()
+
+    first = first_token.at or end
+    call.prefill += first - start
+    call.decode += end - first
+    return output
+
+
+def _stopping_criteria(stop, tokenizer, prompt_length):
+    """Stopping criteria for generate, or None when no stop condition is set"""
+    if stop is None:
+        return None
+    return build_stopping_criteria(stop, tokenizer, prompt_length)
+
+
+def _decode_new_tokens(tokenizer, new_tokens, stop, stats=None):
+    """Decode generated tokens and cut each row at its stop point"""
+    if stats is not None:
+        stats["generated_tokens"] = _generated_lengths(new_tokens, tokenizer.pad_token_id)
+    with phase("tokenization"):
+        completions = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+    if stop is None:
+        return completions
+    # A single step can overshoot the stop point, so trim the text as well
+    return [stop.truncate(completion) for completion in completions]
+
+
+def _generated_lengths(new_tokens, pad_token_id):
+    """Tokens each row generated before generate padded it out
+
+    The token at the first padding position is counted as well, since with
+    pad == EOS it may be the row's own end of sequence.
+    """
+    width = new_tokens.shape[1]
+    return [row.index(pad_token_id) + 1 if pad_token_id in row else width for row in new_tokens.tolist()]
+
+
+def stream_generate(loaded, prompt, max_new_tokens=50, do_sample=True, temperature=0.7, top_p=1.0,
+                    seed=None, stats=None, stop=None):
+    """Yield decoded text pieces while the model is still generating
+
+    If a `stats` dict is given it is filled with time_to_first_token,
+    total_time, tokens and tokens_per_second once the stream is closed.
+    Closing the generator early stops decoding, as does a matching `stop`
+    condition. An exception raised by generate ends the stream and is
+    re-raised to the consumer.
+    """
+    import threading
+
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    class CountingStreamer(TextIteratorStreamer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.token_count = 0
+
+        def put(self, value):
+            if not (self.skip_prompt and self.next_tokens_are_prompt):
+                self.token_count += value.numel()
+            super().put(value)
+
+    class Cancelled(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return cancelled.is_set()
+
+    tokenizer = loaded.tokenizer
+    model = loaded.model
+    cancelled = threading.Event()
+    streamer = CountingStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    if seed is not None:
+        torch.manual_seed(seed)
+
+    encoded = tokenizer(prompt, return_tensors="pt").to(model.device)
+    criteria = StoppingCriteriaList([Cancelled()])
+    if stop is not None:
+        criteria.extend(build_stopping_criteria(stop, tokenizer, encoded["input_ids"].shape[1]))
+
+    errors = []
+
+    def run():
+        try:
+            with torch.no_grad():
+                model.generate(
+                    **encoded,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=do_sample,
+                    temperature=temperature,
+                    top_p=top_p,
+                    pad_token_id=tokenizer.pad_token_id,
+                    streamer=streamer,
+                    stopping_criteria=criteria
+                )
+        except BaseException as e:
+            # Without the end-of-stream marker the consumer would wait forever
+            errors.append(e)
+            streamer.end()
+
+    start = time.perf_counter()
+    first_token_at = None
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+
+    try:
+        for piece in streamer:
+            if not piece:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield piece
+        worker.join()
+        if errors:
+            raise errors[0]
+    finally:
+        cancelled.set()
+        worker.join()
+        if stats is not None:
+            total_time = time.perf_counter() - start
+            stats["time_to_first_token"] = (first_token_at - start) if first_token_at else total_time
+            stats["total_time"] = total_time
+            stats["tokens"] = streamer.token_count
+            stats["tokens_per_second"] = streamer.token_count / total_time if total_time > 0 else 0.0
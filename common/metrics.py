@@ -0,0 +1,193 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+# Labels every recorded call is grouped by
+LABELS = ("component", "strategy", "category")
+
+# Counters kept per label set: (field, Prometheus name, help text)
+COUNTERS = [
+    ("calls", "generation_calls_total", "Generation calls"),
+    ("errors", "generation_errors_total", "Generation calls that raised"),
+    ("prompt_tokens", "generation_prompt_tokens_total", "Prompt tokens sent to the model"),
+    ("generated_tokens", "generation_generated_tokens_total", "Tokens generated by the model"),
+    ("cache_hits", "generation_cache_hits_total", "Completions served from the response cache"),
+    ("cache_misses", "generation_cache_misses_total", "Completions the response cache did not hold"),
+    ("queue_wait", "generation_queue_wait_seconds_total", "Seconds spent waiting for a batch slot"),
+    ("prefill", "generation_prefill_seconds_total", "Seconds spent encoding prompts up to the first token"),
+    ("decode", "generation_decode_seconds_total", "Seconds spent decoding after the first token")
+]
+
+_labels = contextvars.ContextVar("generation_labels", default={})
+_call = contextvars.ContextVar("generation_call", default=None)
+
+
+class CallRecord:
+    """Cost of one generation call; generation code adds to the call that is current"""
+    __slots__ = ("labels", "prompt_tokens", "generated_tokens", "cache_hits", "cache_misses",
+                 "queue_wait", "prefill", "decode", "errors", "tag_prefill")
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.queue_wait = 0.0
+        self.prefill = 0.0
+        self.decode = 0.0
+        self.errors = 0
+        # Prefill seconds per request tag, for calls spanning a continuous batch
+        self.tag_prefill = {}
+
+
+def current_call():
+    """The call being recorded in this context, or None when metrics are off"""
+    return _call.get()
+
+
+class GenerationMetrics:
+    """Per-call generation cost aggregated by component, strategy and task category
+
+    Disabled by default; while disabled `call()` records nothing and
+    generation code only pays for one context variable lookup.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    @contextlib.contextmanager
+    def labels(self, **labels):
+        """Label every call recorded inside the block; inner labels override outer ones"""
+        token = _labels.set({**_labels.get(), **labels})
+        try:
+            yield
+        finally:
+            _labels.reset(token)
+
+    @contextlib.contextmanager
+    def call(self, **labels):
+        """Record one generation call made inside the block
+
+        Yields the CallRecord, or None when metrics are disabled. Time the
+        generation code did not split into prefill and decode counts as
+        decode.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        record = CallRecord({**_labels.get(), **labels})
+        token = _call.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record.errors += 1
+            raise
+        finally:
+            _call.reset(token)
+            unaccounted = time.perf_counter() - start - record.queue_wait - record.prefill - record.decode
+            if record.prefill == 0 and record.decode == 0:
+                record.decode = max(0.0, unaccounted)
+            self.add(record)
+
+    @contextlib.contextmanager
+    def batch(self, **labels):
+        """Make a CallRecord current without recording it
+
+        For work spanning many calls, such as a continuous batch: the
+        generation code fills it (e.g. prefill per request tag) and the
+        caller records its own per-task calls with `add`. Yields None when
+        metrics are disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        record = CallRecord({**_labels.get(), **labels})
+        token = _call.set(record)
+        try:
+            yield record
+        finally:
+            _call.reset(token)
+
+    def add(self, record):
+        """Fold a finished call into its label set's counters"""
+        key = tuple(str(record.labels.get(label, "")) for label in LABELS)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {field: 0 for field, _, _ in COUNTERS}
+            series["calls"] += 1
+            for field, _, _ in COUNTERS[1:]:
+                series[field] += getattr(record, field)
+
+    def merge(self, series):
+        """Fold in the "series" of another process's `summary`, e.g. a worker's"""
+        with self._lock:
+            for item in series:
+                key = tuple(str(item.get(label, "")) for label in LABELS)
+                merged = self._series.get(key)
+                if merged is None:
+                    merged = self._series[key] = {field: 0 for field, _, _ in COUNTERS}
+                for field, _, _ in COUNTERS:
+                    merged[field] += item.get(field, 0)
+
+    def summary(self):
+        """JSON-friendly totals and per-label series"""
+        with self._lock:
+            series = [
+                {**dict(zip(LABELS, key)), **values}
+                for key, values in sorted(self._series.items())
+            ]
+        totals = {field: sum(item[field] for item in series) for field, _, _ in COUNTERS}
+        return {"totals": totals, "series": series}
+
+    def write_textfile(self, path, prefix="prompt_lab_"):
+        """Write every counter in the Prometheus text format
+
+        The file is replaced atomically, as the node_exporter textfile
+        collector expects.
+        """
+        with self._lock:
+            items = sorted(self._series.items())
+
+        lines = []
+        for field, name, help_text in COUNTERS:
+            lines.append(f"# HELP {prefix}{name} {help_text}")
+            lines.append(f"# TYPE {prefix}{name} counter")
+            for key, values in items:
+                labels = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(LABELS, key))
+                lines.append(f"{prefix}{name}{{{labels}}} {values[field]}")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temporary, path)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_metrics = GenerationMetrics()
+
+
+def get_metrics():
+    """Return the process-wide generation metrics"""
+    return _metrics
@@ -0,0 +1,296 @@
+import gc
+import threading
+import warnings
+
+from common.profiling import phase
+
+warnings.filterwarnings("ignore")
+
+DEFAULT_MODEL = "microsoft/DialoGPT-small"
+
+# Precision modes a model can be loaded in
+PRECISIONS = ["float32", "bfloat16", "int8"]
+
+# Every handle resolves its dtype, so the bfloat16 fallback is reported once per process
+_warned_bf16_fallback = False
+
+
+def cpu_supports_bf16():
+    """True when the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def resolve_dtype(dtype, device="cpu"):
+    """Map a requested precision to one this machine runs efficiently"""
+    global _warned_bf16_fallback
+    if dtype not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{dtype}'. Choose from: {', '.join(PRECISIONS)}")
+    if dtype == "int8" and device != "cpu":
+        raise ValueError("int8 dynamic quantization only runs on the CPU")
+    if dtype == "bfloat16" and device == "cpu" and not cpu_supports_bf16():
+        if not _warned_bf16_fallback:
+            _warned_bf16_fallback = True
+            print("⚠️  This CPU has no native bfloat16 support, falling back to float32")
+        return "float32"
+    return dtype
+
+
+class LoadedModel:
+    """A model/tokenizer pair shared by every component that asked for the same key"""
+
+    def __init__(self, key, model, tokenizer):
+        self.key = key
+        self.model = model
+        self.tokenizer = tokenizer
+        self.refcount = 0
+        self._generator = None
+
+    @property
+    def model_name(self):
+        return self.key[0]
+
+    @property
+    def dtype(self):
+        return self.key[1]
+
+    @property
+    def device(self):
+        return self.key[2]
+
+    @property
+    def runtime(self):
+        return self.key[3]
+
+    @property
+    def generator(self):
+        """text-generation pipeline over the shared weights, built on first use"""
+        if self._generator is None:
+            from transformers import pipeline
+
+            self._generator = pipeline(
+                "text-generation",
+                model=self.model,
+                tokenizer=self.tokenizer,
+                device=self.model.device,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        return self._generator
+
+
+class SharedModel:
+    """A loaded model whose weights live in shared memory, to hand to spawned workers
+
+    Pickled through a multiprocessing context, torch sends the tensors as
+    shared-memory handles rather than their bytes, so every worker maps
+    the parent's weight pages instead of loading its own copy. A worker
+    passes it to `ModelRegistry.adopt`.
+    """
+
+    def __init__(self, loaded):
+        self.key = loaded.key
+        self.model = loaded.model.share_memory()
+        self.tokenizer = loaded.tokenizer
+
+
+class ModelHandle:
+    """A component's reference to a registry model, optionally loaded in the background
+
+    `get()` returns the loaded model and blocks only if the background load
+    has not finished yet.
+    """
+
+    def __init__(self, registry, model_name=DEFAULT_MODEL, dtype="float32", device="cpu",
+                 runtime="transformers", background=False):
+        self.registry = registry
+        self.key = (model_name, resolve_dtype(dtype, device), device, runtime)
+        self._loaded = None
+        self._error = None
+        self._released = False
+        self._thread = None
+
+        if background:
+            self._thread = threading.Thread(target=self._load, daemon=True)
+            self._thread.start()
+        else:
+            with phase("model_load"):
+                self._load()
+            if self._error is not None:
+                raise self._error
+
+    def ready(self):
+        """True once the model is loaded (or failed to load)"""
+        return self._thread is None or not self._thread.is_alive()
+
+    def get(self):
+        """Return the loaded model, waiting for the background load if needed"""
+        if self._released:
+            raise RuntimeError("Model handle has already been released")
+        # Only time spent blocked on the load is charged to it
+        if self._thread is not None and self._thread.is_alive():
+            with phase("model_load"):
+                self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._loaded
+
+    def release(self):
+        """Give the model back to the registry"""
+        if self._released:
+            return
+        self._released = True
+        if self._thread is not None:
+            self._thread.join()
+        if self._loaded is not None:
+            self.registry.release(self._loaded)
+            self._loaded = None
+
+    def _load(self):
+        try:
+            self._loaded = self.registry.acquire(*self.key)
+        except Exception as e:
+            self._error = e
+
+
+class ModelRegistry:
+    """Process-wide registry handing out one loaded model per (name, dtype, device, runtime)"""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, model_name=DEFAULT_MODEL, dtype="float32", device="cpu", runtime="transformers"):
+        """Return the shared model for this key, loading it on first use"""
+        key = (model_name, dtype, device, runtime)
+        with self._lock:
+            loaded = self._models.get(key)
+            if loaded is None:
+                loaded = self._load(key)
+                self._models[key] = loaded
+            loaded.refcount += 1
+            return loaded
+
+    def acquire_async(self, model_name=DEFAULT_MODEL, dtype="float32", device="cpu", runtime="transformers"):
+        """Start loading the model in a background thread and return its handle"""
+        return ModelHandle(self, model_name, dtype, device, runtime, background=True)
+
+    def handle(self, model_name=DEFAULT_MODEL, dtype="float32", device="cpu", runtime="transformers",
+               background=False):
+        """Return a handle to the model, loading it now or in the background"""
+        return ModelHandle(self, model_name, dtype, device, runtime, background=background)
+
+    def share(self, loaded):
+        """SharedModel of a loaded model, or None if its weights cannot be shared
+
+        Only plain torch models on the CPU qualify; int8 packed weights and
+        ONNX Runtime sessions are loaded by each worker instead.
+        """
+        _, dtype, device, runtime = loaded.key
+        if runtime != "transformers" or dtype == "int8" or device != "cpu":
+            return None
+        return SharedModel(loaded)
+
+    def adopt(self, shared):
+        """Register a SharedModel from the parent process under its key
+
+        Handles for that key then use the shared weights instead of loading.
+        """
+        with self._lock:
+            if shared.key not in self._models:
+                self._models[shared.key] = LoadedModel(shared.key, shared.model, shared.tokenizer)
+
+    def release(self, loaded):
+        """Drop one reference; the weights are freed once nobody holds the model"""
+        with self._lock:
+            if self._models.get(loaded.key) is not loaded:
+                return
+            loaded.refcount -= 1
+            if loaded.refcount <= 0:
+                del self._models[loaded.key]
+                self._free(loaded)
+
+    def clear(self):
+        """Free every loaded model regardless of outstanding references"""
+        with self._lock:
+            models = list(self._models.values())
+            self._models.clear()
+            for loaded in models:
+                self._free(loaded)
+
+    def loaded_keys(self):
+        """List the keys of the models currently held in memory"""
+        with self._lock:
+            return list(self._models.keys())
+
+    def _load(self, key):
+        """Load model weights and tokenizer for a registry key"""
+        # Deferred so that importing the registry stays cheap
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        model_name, dtype, device, runtime = key
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Batched generation needs prompts aligned on their last token
+        tokenizer.padding_side = "left"
+
+        if runtime == "onnxruntime":
+            from optimum.onnxruntime import ORTModelForCausalLM
+
+            model = ORTModelForCausalLM.from_pretrained(
+                model_name, export=True, use_cache=True, provider="CPUExecutionProvider"
+            )
+        elif dtype == "int8":
+            model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+            model.eval()
+            model = _quantize_int8(model)
+        else:
+            model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=getattr(torch, dtype))
+            model.to(device)
+            model.eval()
+
+        return LoadedModel(key, model, tokenizer)
+
+    def _free(self, loaded):
+        """Break references to the weights so the memory can be reclaimed"""
+        loaded.model = None
+        loaded.tokenizer = None
+        loaded._generator = None
+        loaded.refcount = 0
+        gc.collect()
+
+
+def _quantize_int8(model):
+    """Dynamic int8 quantization of every linear projection (CPU only)
+
+    GPT-2 style models implement their projections as transformers' Conv1D,
+    which quantize_dynamic does not recognise, so those are rewritten as
+    equivalent nn.Linear layers first.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    """Return the process-wide model registry"""
+    return _registry
@@ -0,0 +1,114 @@
+import functools
+import threading
+from collections import OrderedDict
+
+
+class PrefixEntry:
+    """Token ids and key/value tensors computed once for a prompt prefix"""
+
+    def __init__(self, input_ids, past_key_values):
+        self.input_ids = input_ids
+        self.past_key_values = past_key_values
+
+    @property
+    def length(self):
+        return self.input_ids.shape[1]
+
+    def fork(self, batch_size):
+        """Return a fresh cache for `batch_size` continuations of this prefix"""
+        return as_model_cache(tuple(
+            (key.expand(batch_size, -1, -1, -1), value.expand(batch_size, -1, -1, -1))
+            for key, value in self.past_key_values
+        ))
+
+
+class PrefixCache:
+    """LRU cache of past_key_values for prompt prefixes shared by many continuations"""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, loaded, prefix):
+        """Return the cached entry for `prefix`, running the prefill on a miss"""
+        key = (loaded.key, prefix)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = self._encode(loaded, prefix)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """Drop every cached prefix"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _encode(self, loaded, prefix):
+        """Run the model over the prefix once and keep its key/value tensors"""
+        import torch
+
+        input_ids = loaded.tokenizer(prefix, return_tensors="pt")["input_ids"]
+        # The last prefix token may merge with the continuation when the full
+        # prompt is tokenized, so it is left for the continuation to encode
+        if input_ids.shape[1] > 1:
+            input_ids = input_ids[:, :-1]
+        input_ids = input_ids.to(loaded.model.device)
+
+        with torch.no_grad():
+            output = loaded.model(input_ids, use_cache=True)
+
+        return PrefixEntry(input_ids, to_legacy(output.past_key_values))
+
+
+def to_legacy(past_key_values):
+    """Normalize a model cache to a tuple of (key, value) tensors per layer"""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple((layer[0], layer[1]) for layer in past_key_values)
+
+
+def as_model_cache(layers):
+    """Wrap (key, value) tensors in the cache type the installed transformers expects"""
+    return _cache_factory()(layers)
+
+
+@functools.lru_cache(maxsize=None)
+def _cache_factory():
+    """How the installed transformers builds a model cache from legacy layers, looked up once
+
+    Decode loops wrap their cache on every step, so the import and the
+    version check are not repeated each time.
+    """
+    try:
+        from transformers import DynamicCache
+    except ImportError:  # older transformers only understands tuple caches
+        return tuple
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache
+    # transformers 5 dropped the legacy converters; the constructor takes the layers
+    return DynamicCache
+
+
+_prefix_cache = PrefixCache()
+
+
+def get_prefix_cache():
+    """Return the process-wide prefix cache"""
+    return _prefix_cache
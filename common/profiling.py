@@ -0,0 +1,233 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+# Phases the pipeline code marks, in report order; time outside them is "unmarked"
+PHASES = ["model_load", "tokenization", "generation", "answer_extraction", "aggregation", "log_io"]
+
+_profiling = False
+_lock = threading.Lock()
+_totals = {}
+_local = threading.local()
+
+
+class phase:
+    """Marks a block as one pipeline phase while a Profiler is running
+
+    Times are exclusive: while a nested phase runs, the enclosing one is
+    paused, so the phases of a run add up to at most its wall time. When
+    no profiler is running this only checks a flag.
+    """
+    __slots__ = ("name", "start", "nested", "record")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.record = None
+        if not _profiling:
+            return self
+
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start = time.perf_counter()
+        self.nested = 0.0
+
+        torch_profiler = _TorchMarks.current
+        if torch_profiler is not None:
+            self.record = torch_profiler.record_function(self.name)
+            self.record.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.record is not None:
+            self.record.__exit__(*exc_info)
+        stack = getattr(_local, "stack", None)
+        if not stack or stack[-1] is not self:
+            return False
+
+        stack.pop()
+        elapsed = time.perf_counter() - self.start
+        if stack:
+            stack[-1].nested += elapsed
+        with _lock:
+            totals = _totals.setdefault(self.name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed - self.nested
+            totals[2] += elapsed
+        return False
+
+
+def profiled(name):
+    """Decorator marking every call of a function as phase `name`"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _profiling:
+                return function(*args, **kwargs)
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _TorchMarks:
+    """torch.profiler, when the torch profiler is part of the run"""
+    current = None
+
+
+class Profiler:
+    """Profiles a run with cProfile and, optionally, the torch profiler
+
+    On exit `output_dir` receives:
+    - profile.pstats: raw cProfile data
+    - profile.collapsed: collapsed stacks for flamegraph.pl / speedscope,
+      rebuilt from cProfile's caller graph (time is split between callers
+      in proportion to their calls, so stacks are approximate)
+    - hotspots.txt: the phase table and the top-N functions by own time
+    - phases.json: exclusive and inclusive seconds per phase
+    - torch_trace.json and torch.collapsed with `torch_profiler=True`
+    """
+
+    def __init__(self, output_dir, torch_profiler=False, top=25):
+        self.output_dir = output_dir
+        self.torch_profiler = torch_profiler
+        self.top = top
+        self._profile = None
+        self._torch = None
+        self._start = None
+        self.wall_time = None
+
+    def __enter__(self):
+        global _profiling
+        with _lock:
+            _totals.clear()
+        if self.torch_profiler:
+            import torch
+
+            self._torch = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], with_stack=True)
+            self._torch.__enter__()
+            _TorchMarks.current = torch.profiler
+        self._profile = cProfile.Profile()
+        _profiling = True
+        self._start = time.perf_counter()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _profiling
+        self._profile.disable()
+        self.wall_time = time.perf_counter() - self._start
+        _profiling = False
+        if self._torch is not None:
+            _TorchMarks.current = None
+            self._torch.__exit__(*exc_info)
+        self.write()
+        return False
+
+    def phases(self):
+        """Seconds per phase, plus the unmarked remainder of the run"""
+        with _lock:
+            totals = {name: list(values) for name, values in _totals.items()}
+        order = PHASES + sorted(name for name in totals if name not in PHASES)
+        report = {
+            name: {"calls": totals[name][0], "seconds": totals[name][1], "inclusive_seconds": totals[name][2]}
+            for name in order if name in totals
+        }
+        marked = sum(values["seconds"] for values in report.values())
+        report["unmarked"] = {"calls": 0, "seconds": max(0.0, self.wall_time - marked), "inclusive_seconds": None}
+        return report
+
+    def write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stats = pstats.Stats(self._profile)
+        stats.dump_stats(os.path.join(self.output_dir, "profile.pstats"))
+
+        with open(os.path.join(self.output_dir, "profile.collapsed"), 'w') as f:
+            for stack, microseconds in sorted(collapse_stacks(stats).items()):
+                f.write(f"{stack} {microseconds}\n")
+
+        phases = self.phases()
+        with open(os.path.join(self.output_dir, "phases.json"), 'w') as f:
+            json.dump({"wall_time": self.wall_time, "phases": phases}, f, indent=2)
+
+        table = self.phase_table(phases)
+        hotspots = io.StringIO()
+        stats.stream = hotspots
+        stats.sort_stats("tottime").print_stats(self.top)
+        with open(os.path.join(self.output_dir, "hotspots.txt"), 'w') as f:
+            f.write(table + "\n\n" + hotspots.getvalue())
+
+        if self._torch is not None:
+            self._torch.export_chrome_trace(os.path.join(self.output_dir, "torch_trace.json"))
+            self._torch.export_stacks(os.path.join(self.output_dir, "torch.collapsed"), "self_cpu_time_total")
+
+    def phase_table(self, phases=None):
+        """Text table of the time spent per phase"""
+        phases = phases or self.phases()
+        lines = [f"{'phase':<20} {'calls':>8} {'seconds':>10} {'share':>7}"]
+        for name, values in phases.items():
+            share = values["seconds"] / self.wall_time if self.wall_time else 0.0
+            lines.append(f"{name:<20} {values['calls']:>8} {values['seconds']:>10.3f} {share:>7.1%}")
+        lines.append(f"{'total':<20} {'':>8} {self.wall_time:>10.3f}")
+        return "\n".join(lines)
+
+
+def collapse_stacks(stats, max_depth=64, max_paths=100):
+    """Collapsed stacks ("a;b;c microseconds") from pstats.Stats
+
+    cProfile keeps caller/callee pairs rather than full stacks, so each
+    function's time is pushed down from the roots and split between
+    callers in proportion to the time each call edge accounts for.
+
+    Call graphs share callees heavily, so the number of caller paths can
+    grow exponentially. Each function is expanded along at most
+    `max_paths` paths (and up to `max_depth` frames); past that its whole
+    share lands on its own frame, so no time is lost. Branches worth less
+    than the output's one microsecond resolution are not followed.
+    """
+    entries = stats.stats
+    children = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((function, edge[3]))
+
+    stacks = {}
+    expanded = {}
+
+    def visit(function, share, path):
+        _, _, own, cumulative, _ = entries[function]
+        if cumulative <= 0 or share < 1e-6:
+            return
+        path = path + [_label(function)]
+        stack = ";".join(path)
+        if len(path) >= max_depth or expanded.get(function, 0) >= max_paths:
+            stacks[stack] = stacks.get(stack, 0) + share
+            return
+        expanded[function] = expanded.get(function, 0) + 1
+
+        fraction = share / cumulative
+        stacks[stack] = stacks.get(stack, 0) + own * fraction
+        for child, edge_time in children.get(function, ()):
+            if _label(child) not in path:
+                visit(child, edge_time * fraction, path)
+
+    for function, (_, _, _, cumulative, callers) in entries.items():
+        if not callers:
+            visit(function, cumulative, [])
+
+    return {stack: int(seconds * 1e6) for stack, seconds in stacks.items() if seconds * 1e6 >= 1}
+
+
+def _label(function):
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "prompt-lab", "responses.sqlite3")
+
+
+class ResponseCache:
+    """Opt-in on-disk cache of generations with size-bounded LRU eviction
+
+    Entries are keyed by model id, exact prompt, sampling parameters, seed
+    and sample index. With `bypass=True` lookups always miss but fresh
+    generations are still written, which refreshes stale entries.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=64 * 1024 * 1024, bypass=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model_id, prompt, params, seed=None, sample_id=0):
+        """Hash everything that determines a generation into a cache key"""
+        payload = json.dumps(
+            {"model": model_id, "prompt": prompt, "params": params, "seed": seed, "sample": sample_id},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for `key`, or None on a miss"""
+        with self._lock:
+            if self.bypass:
+                self.misses += 1
+                return None
+
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        """Store a response and evict least recently used entries over the size bound"""
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time())
+            )
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters and current size of the cache"""
+        with self._lock:
+            entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total
+        }
+
+    def __reduce__(self):
+        # Unpickled in a worker process, the cache opens its own connection to the same file
+        return ResponseCache, (self.path, self.max_bytes, self.bypass)
+
+    def close(self):
+        """Close the underlying database"""
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        """Drop the oldest entries until the cache fits in `max_bytes`"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import traceback
+
+from common.metrics import get_metrics
+
+
+def default_threads(workers):
+    """Torch threads per worker so that the workers together fill the cores once"""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def shard(items, workers):
+    """Split items round-robin into `workers` shards"""
+    return [items[i::workers] for i in range(workers)]
+
+
+class ShardedRunner:
+    """Runs a generator over shards of the work in spawned worker processes
+
+    Workers start from a fresh interpreter rather than a fork: forking
+    after torch has started its intra-op/OpenMP thread pools (or while a
+    model is loading in a background thread) can leave a worker
+    deadlocked on a lock held by a thread that was not copied. Each worker
+    sets its own torch thread count, so N workers decode side by side
+    without fighting over one thread pool. Torch pickles tensors in `work`
+    as shared-memory handles, so a model shared with `ModelRegistry.share`
+    is mapped by every worker rather than copied. Generation metrics
+    recorded in the workers are merged into this process's counters as
+    each worker finishes.
+    """
+
+    def __init__(self, workers, threads_per_worker=None, poll_interval=1.0):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or default_threads(workers)
+        self.poll_interval = poll_interval
+        self.worker_stats = []
+
+    def run(self, items, work):
+        """Yield the results of `work(shard)` from every worker as they arrive
+
+        `work` is called in each worker with its shard and must return an
+        iterable of picklable results; it is pickled into the workers, so it
+        must be a module-level function or a functools.partial of one.
+        Per-worker throughput is available in `worker_stats` once the
+        generator is exhausted.
+        """
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        shards = shard(list(items), self.workers)
+        metrics = get_metrics()
+
+        processes = [
+            context.Process(
+                target=_worker,
+                args=(worker_id, shards[worker_id], work, results, self.threads_per_worker, metrics.enabled),
+                daemon=True
+            )
+            for worker_id in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        self.worker_stats = []
+        remaining = set(range(self.workers))
+        try:
+            while remaining:
+                try:
+                    worker_id, kind, payload = results.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    for worker_id in remaining:
+                        if processes[worker_id].exitcode not in (None, 0):
+                            raise RuntimeError(
+                                f"Worker {worker_id} exited with code {processes[worker_id].exitcode}"
+                            )
+                    continue
+
+                if kind == "result":
+                    yield payload
+                elif kind == "done":
+                    remaining.discard(worker_id)
+                    series = payload.pop("metrics")
+                    if series:
+                        metrics.merge(series)
+                    self.worker_stats.append(payload)
+                else:
+                    raise RuntimeError(f"Worker {worker_id} failed:\n{payload}")
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            results.close()
+
+        self.worker_stats.sort(key=lambda stats: stats["worker"])
+
+
+def _worker(worker_id, items, work, results, threads, metrics_enabled):
+    """Body of one spawned worker: run its shard and report throughput and metrics"""
+    try:
+        # Read by torch when it initializes; set_num_threads covers a torch
+        # already imported while the work function was unpickled
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+        os.environ["MKL_NUM_THREADS"] = str(threads)
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            torch.set_num_threads(threads)
+
+        metrics = get_metrics()
+        if metrics_enabled:
+            metrics.enable()
+
+        start = time.perf_counter()
+        produced = 0
+        for result in work(items):
+            results.put((worker_id, "result", result))
+            produced += 1
+
+        seconds = time.perf_counter() - start
+        results.put((worker_id, "done", {
+            "worker": worker_id,
+            "pid": os.getpid(),
+            "threads": threads,
+            "items": produced,
+            "seconds": seconds,
+            "items_per_second": produced / seconds if seconds > 0 else 0.0,
+            "metrics": metrics.summary()["series"] if metrics_enabled else None
+        }))
+    except BaseException:
+        results.put((worker_id, "error", traceback.format_exc()))
@@ -0,0 +1,111 @@
+class StopCondition:
+    """Describes where a generated continuation is complete
+
+    - stop_strings: cut before the first occurrence of any of these strings
+    - stop_on_newline: cut at the first newline that follows some content
+    - answer_markers: cut at the end of the first line containing a marker
+      such as "final answer:" (matched case-insensitively)
+    """
+
+    def __init__(self, stop_strings=(), stop_on_newline=False, answer_markers=()):
+        self.stop_strings = tuple(stop_strings)
+        self.stop_on_newline = stop_on_newline
+        self.answer_markers = tuple(marker.lower() for marker in answer_markers)
+
+    def find_stop(self, text):
+        """Index at which `text` should be cut, or None if generation should go on"""
+        cut = None
+
+        for stop_string in self.stop_strings:
+            index = text.find(stop_string)
+            if index >= 0 and (cut is None or index < cut):
+                cut = index
+
+        if self.stop_on_newline:
+            content_start = len(text) - len(text.lstrip())
+            index = text.find('\n', content_start)
+            if index >= 0 and (cut is None or index < cut):
+                cut = index
+
+        if self.answer_markers:
+            lowered = text.lower()
+            for marker in self.answer_markers:
+                index = lowered.find(marker)
+                if index < 0:
+                    continue
+                line_end = text.find('\n', index)
+                if line_end >= 0 and (cut is None or line_end < cut):
+                    cut = line_end
+
+        return cut
+
+    def truncate(self, text):
+        """Drop everything from the stop point onwards"""
+        cut = self.find_stop(text)
+        return text if cut is None else text[:cut]
+
+    def as_key(self):
+        """JSON-friendly description, used in response cache keys"""
+        return {
+            "stop_strings": list(self.stop_strings),
+            "stop_on_newline": self.stop_on_newline,
+            "answer_markers": list(self.answer_markers)
+        }
+
+
+FIRST_LINE = StopCondition(stop_on_newline=True)
+
+
+class StopTracker:
+    """Follows one growing continuation and reports when its StopCondition matches
+
+    Only the tokens added since the last update are decoded, so checking
+    after every decoding step does not re-decode the whole continuation.
+    """
+
+    def __init__(self, condition, tokenizer):
+        self.condition = condition
+        self.tokenizer = tokenizer
+        self.text = ""
+        self._decoded = 0
+
+    def update(self, token_ids):
+        """Take the continuation's token ids so far; True once generation should stop"""
+        new_ids = token_ids[self._decoded:]
+        if len(new_ids):
+            piece = self.tokenizer.decode(new_ids, skip_special_tokens=True)
+            # A character split across tokens decodes as U+FFFD until its last byte arrives
+            if not piece.endswith("\ufffd"):
+                self.text += piece
+                self._decoded = len(token_ids)
+        return self.condition.find_stop(self.text) is not None
+
+
+def build_stopping_criteria(condition, tokenizer, prompt_length):
+    """Wrap a StopCondition as transformers stopping criteria
+
+    Each row of the batch is checked separately, so one finished sequence
+    stops producing tokens while the others keep decoding.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class StopConditionCriteria(StoppingCriteria):
+        def __init__(self):
+            self.finished = None
+            self.trackers = []
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.finished is None or self.finished.shape[0] != input_ids.shape[0]:
+                self.finished = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+                self.trackers = [StopTracker(condition, tokenizer) for _ in range(input_ids.shape[0])]
+
+            for row, tracker in enumerate(self.trackers):
+                if self.finished[row]:
+                    continue
+                if tracker.update(input_ids[row, prompt_length:]):
+                    self.finished[row] = True
+
+            return self.finished.clone()
+
+    return StoppingCriteriaList([StopConditionCriteria()])
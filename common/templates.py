@@ -0,0 +1,196 @@
+import os
+import string
+import threading
+
+# DialoGPT / GPT-2 positional embeddings cover 1024 tokens
+CONTEXT_WINDOW = 1024
+
+
+class PromptTemplate:
+    """A prompt template parsed once into static segments and named slots
+
+    Placeholders are validated when the template is built. Token counts of
+    the static segments are cached per backend, so budgeting a prompt only
+    tokenizes the slot values. Conversions and format specs (`{x!r}`,
+    `{x:>5}`) behave as in str.format.
+    """
+
+    def __init__(self, text, required=(), name="<inline>"):
+        self.text = text
+        self.name = name
+        self.segments = []
+        self._static_tokens = {}
+
+        fields = []
+        try:
+            for literal, field, format_spec, conversion in string.Formatter().parse(text):
+                if field is not None:
+                    if field == "" or field.isdigit():
+                        raise ValueError("positional placeholders are not supported")
+                    if not field.isidentifier():
+                        raise ValueError(f"placeholder '{field}' must be a plain name")
+                    if "{" in format_spec:
+                        raise ValueError(f"nested placeholders in the format spec of '{field}' are not supported")
+                    fields.append(field)
+                self.segments.append((literal, field, conversion, format_spec))
+        except ValueError as e:
+            raise ValueError(f"Invalid template {name}: {e}")
+
+        self.fields = tuple(dict.fromkeys(fields))
+        # A token can merge or split where a slot meets static text, so the
+        # per-segment count can be off by about one token per boundary
+        self.boundary_margin = 2 * len(self.segments)
+        self.require(required)
+
+    @property
+    def prefix(self):
+        """Static text before the first slot, shared by every formatted prompt"""
+        return self.segments[0][0] if self.segments else ""
+
+    def require(self, required):
+        """Raise if any of the `required` placeholders is missing"""
+        missing = [field for field in required if field not in self.fields]
+        if missing:
+            raise ValueError(f"Template {self.name} is missing placeholder(s): {', '.join(missing)}")
+
+    def format(self, **values):
+        """Fill every slot; unlike str.format the template is not re-parsed"""
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"No value for placeholder(s) {', '.join(missing)} in template {self.name}")
+        return "".join(
+            literal + (_render(values[field], conversion, format_spec) if field is not None else "")
+            for literal, field, conversion, format_spec in self.segments
+        )
+
+    def count_tokens(self, backend, **values):
+        """Token count of the formatted prompt, tokenizing only the slot values"""
+        static = self._static_tokens.get(backend.model_id)
+        if static is None:
+            static = sum(backend.count_tokens(segment[0]) for segment in self.segments if segment[0])
+            self._static_tokens[backend.model_id] = static
+        return static + sum(
+            backend.count_tokens(_render(values[field], conversion, format_spec))
+            for _, field, conversion, format_spec in self.segments if field is not None
+        )
+
+    def fit(self, backend, max_tokens, shrinkable, **values):
+        """Format the template within `max_tokens`, shortening slots in the given order
+
+        Returns (prompt, truncated_fields). Slots are cut in the middle so
+        their beginning and end survive; the result only depends on the
+        inputs, never on timing. The joined prompt is only tokenized when
+        the per-segment estimate comes within `boundary_margin` of the budget.
+        """
+        truncated = []
+        total = self.count_tokens(backend, **values)
+
+        for field in shrinkable:
+            if total <= max_tokens:
+                break
+            self._shrink(backend, values, field, total - max_tokens)
+            truncated.append(field)
+            total = self.count_tokens(backend, **values)
+
+        prompt = self.format(**values)
+        if total + self.boundary_margin <= max_tokens:
+            return prompt, truncated
+
+        # Close to the budget the estimate is not good enough; the joined prompt is what has to fit
+        total = backend.count_tokens(prompt)
+        for field in shrinkable:
+            while total > max_tokens and values[field]:
+                self._shrink(backend, values, field, total - max_tokens)
+                if field not in truncated:
+                    truncated.append(field)
+                prompt = self.format(**values)
+                total = backend.count_tokens(prompt)
+
+        if total > max_tokens:
+            raise ValueError(
+                f"Template {self.name} needs {total} tokens even after truncation, "
+                f"more than the {max_tokens} available"
+            )
+        return prompt, truncated
+
+    @staticmethod
+    def _shrink(backend, values, field, excess):
+        """Cut `excess` tokens from the middle of one slot value"""
+        value = str(values[field])
+        allowed = max(0, backend.count_tokens(value) - excess)
+        values[field] = truncate_to_tokens(value, allowed, backend.count_tokens)
+
+
+def _render(value, conversion, format_spec):
+    """A slot value as str.format would write it"""
+    if conversion == "r":
+        value = repr(value)
+    elif conversion == "a":
+        value = ascii(value)
+    elif conversion == "s":
+        value = str(value)
+    return format(value, format_spec) if format_spec else str(value)
+
+
+def truncate_to_tokens(text, max_tokens, count_tokens, marker="\n...\n"):
+    """Shorten `text` to at most `max_tokens`, keeping its head and tail"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= count_tokens(marker):
+        return ""
+
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(_keep_ends(text, middle, marker)) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return _keep_ends(text, low, marker)
+
+
+def _keep_ends(text, keep, marker):
+    """The first and last `keep` characters of text, split evenly, around a marker"""
+    head = (keep + 1) // 2
+    tail = keep // 2
+    return text[:head] + marker + (text[len(text) - tail:] if tail else "")
+
+
+class TemplateStore:
+    """Loads template files once and reloads them when their mtime changes"""
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, required=()):
+        """Return the parsed template at `path`, validating `required` placeholders"""
+        key = os.path.abspath(path)
+        mtime = os.stat(key).st_mtime_ns
+
+        with self._lock:
+            entry = self._templates.get(key)
+            if entry is not None and entry[0] == mtime:
+                template = entry[1]
+                template.require(required)
+                return template
+
+        with open(key, 'r') as f:
+            template = PromptTemplate(f.read(), required, name=path)
+
+        with self._lock:
+            self._templates[key] = (mtime, template)
+        return template
+
+    def clear(self):
+        """Forget every loaded template"""
+        with self._lock:
+            self._templates.clear()
+
+
+_store = TemplateStore()
+
+
+def get_template_store():
+    """Return the process-wide template store"""
+    return _store
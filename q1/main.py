@@ -1,28 +1,37 @@
-from transformers import pipeline
+import argparse
 import json
+import os
+import sys
+import time
 import warnings
+from contextlib import closing, nullcontext
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.backends import BACKENDS, TransformersBackend, create_backend, generate_cached
+from common.metrics import get_metrics
+from common.model_registry import PRECISIONS
+from common.profiling import Profiler, phase
+from common.response_cache import ResponseCache
+from common.stopping import FIRST_LINE
+from common.templates import CONTEXT_WINDOW, PromptTemplate
+from solver import SolverRouter
 
 warnings.filterwarnings("ignore")
 
-class EdTechMathTutor:
-    def __init__(self):
-        print("Loading TinyLlama model (this may take a moment)...")
-        self.model = pipeline("text-generation", model="microsoft/DialoGPT-small", pad_token_id=50256)
-        print("Model loaded successfully!")
-        
-    def zero_shot_prompt(self, question):
-        """Direct instruction with no examples"""
-        prompt = f"""You are a helpful math tutor for students in class 6-10. 
+MODEL_NAME = "microsoft/DialoGPT-small"
+
+# Answers are one line, so a short completion is enough
+MAX_NEW_TOKENS = 50
+
+# Strategy prompts are parsed once; only the question is tokenized per call
+ZERO_SHOT_TEMPLATE = PromptTemplate("""You are a helpful math tutor for students in class 6-10. 
 Solve this math problem clearly and accurately:
 
 {question}
 
-Answer:"""
-        return self._query_model(prompt)
-    
-    def few_shot_prompt(self, question):
-        """Instruction with 2-3 examples"""
-        prompt = f"""You are a helpful math tutor for students in class 6-10. Here are some examples:
+Answer:""", required=["question"], name="zero_shot")
+
+FEW_SHOT_TEMPLATE = PromptTemplate("""You are a helpful math tutor for students in class 6-10. Here are some examples:
 
 Q: Solve 2x + 3 = 7
 A: Subtract 3 from both sides: 2x = 4. Divide by 2: x = 2
@@ -35,12 +44,9 @@ A: 15% = 15/100 = 0.15. So 0.15 × 80 = 12
 
 Now solve this problem:
 Q: {question}
-A:"""
-        return self._query_model(prompt)
-    
-    def chain_of_thought_prompt(self, question):
-        """Step-by-step reasoning"""
-        prompt = f"""You are a math tutor. Think step by step to solve this problem.
+A:""", required=["question"], name="few_shot")
+
+CHAIN_OF_THOUGHT_TEMPLATE = PromptTemplate("""You are a math tutor. Think step by step to solve this problem.
 
 Problem: {question}
 
@@ -50,12 +56,9 @@ Let me think through this step by step:
 3. Apply the method step by step
 4. Check my answer
 
-Step-by-step solution:"""
-        return self._query_model(prompt)
-    
-    def self_ask_prompt(self, question):
-        """Model asks sub-questions"""
-        prompt = f"""You are a math tutor. Before solving, ask yourself helpful sub-questions.
+Step-by-step solution:""", required=["question"], name="chain_of_thought")
+
+SELF_ASK_TEMPLATE = PromptTemplate("""You are a math tutor. Before solving, ask yourself helpful sub-questions.
 
 Problem: {question}
 
@@ -65,21 +68,206 @@ Let me ask myself some questions to solve this:
 - What formula or method should I use?
 - What are the steps needed?
 
-Self-questioning approach:"""
-        return self._query_model(prompt)
+Self-questioning approach:""", required=["question"], name="self_ask")
+
+# Strategy name -> template, as accepted by query_batch and the HTTP service
+STRATEGIES = {
+    template.name: template
+    for template in (ZERO_SHOT_TEMPLATE, FEW_SHOT_TEMPLATE, CHAIN_OF_THOUGHT_TEMPLATE, SELF_ASK_TEMPLATE)
+}
+
+class EdTechMathTutor:
+    def __init__(self, cache=None, seed=None, background_load=True, stream=False, backend=None, precision="float32",
+                 solver=True):
+        self.cache = cache
+        self.seed = seed
+        self.stream = stream
+        self.last_stream_stats = None
+        # Routine arithmetic is answered exactly before any strategy reaches the model
+        self.router = SolverRouter() if solver else None
+        if backend is None:
+            print("Loading TinyLlama model (this may take a moment)...")
+            # The model loads in a background thread; first use waits for it
+            backend = TransformersBackend(MODEL_NAME, dtype=precision, background_load=background_load)
+            if not background_load:
+                print("Model loaded successfully!")
+        self.backend = backend
+
+    def model_ready(self):
+        """True once the model has finished loading"""
+        return self.backend.ready()
+
+    def close(self):
+        """Release this tutor's reference to the shared model"""
+        self.backend.close()
+        
+    def zero_shot_prompt(self, question):
+        """Direct instruction with no examples"""
+        return self._query_template(ZERO_SHOT_TEMPLATE, question)
+    
+    def few_shot_prompt(self, question):
+        """Instruction with 2-3 examples"""
+        return self._query_template(FEW_SHOT_TEMPLATE, question)
+    
+    def chain_of_thought_prompt(self, question):
+        """Step-by-step reasoning"""
+        return self._query_template(CHAIN_OF_THOUGHT_TEMPLATE, question)
+    
+    def self_ask_prompt(self, question):
+        """Model asks sub-questions"""
+        return self._query_template(SELF_ASK_TEMPLATE, question)
+    
+    def solve(self, question):
+        """The solver's Solution for a routine question, or None when it needs the model"""
+        if self.router is None:
+            return None
+        return self.router.route(question)
+    
+    def solver_report(self):
+        """Solver hit rate and estimated model time saved, or None with the solver off"""
+        return self.router.report() if self.router is not None else None
+    
+    def _query_template(self, template, question):
+        """Answer with the solver if it can, otherwise fill a strategy template within the context window"""
+        solution = self.solve(question)
+        if solution is not None:
+            if self.stream:
+                print(solution.answer)
+                print(f"⚡ Solved without the model in {solution.seconds * 1e6:.0f} µs")
+            return solution.answer
+        
+        try:
+            prompt, truncated = template.fit(
+                self.backend, CONTEXT_WINDOW - MAX_NEW_TOKENS, ["question"], question=question
+            )
+        except Exception as e:
+            return f"Error: {str(e)}"
+        if truncated:
+            print(f"⚠️  Question truncated to fit the {CONTEXT_WINDOW}-token context window")
+        # The instructions before the question are shared, so their encoding is cached
+        start = time.perf_counter()
+        with get_metrics().labels(component="tutor", strategy=template.name):
+            answer = self._query_model(prompt, prefix=template.prefix)
+        if self.router is not None:
+            self.router.record_model(time.perf_counter() - start)
+        return answer
     
-    def _query_model(self, prompt):
+    def query_batch(self, strategy, questions):
+        """Answer several questions with one strategy in a single batched generation
+        
+        Questions are cached under the same keys as single calls, so a
+        cached answer is reused whether or not it was batched. Questions
+        that do not fit the context window get an error answer without
+        failing the rest. The solver is not consulted; route with `solve`
+        first.
+        """
+        template = STRATEGIES[strategy]
+        answers = [None] * len(questions)
+        prompts = []
+        rows = []
+        for row, question in enumerate(questions):
+            try:
+                prompt, _ = template.fit(self.backend, CONTEXT_WINDOW - MAX_NEW_TOKENS, ["question"], question=question)
+            except Exception as e:
+                answers[row] = f"Error: {str(e)}"
+                continue
+            prompts.append(prompt)
+            rows.append(row)
+        
+        if prompts:
+            start = time.perf_counter()
+            with get_metrics().labels(component="tutor", strategy=strategy):
+                completions = generate_cached(
+                    self.backend,
+                    prompts,
+                    cache=self.cache,
+                    seed=self.seed,
+                    sample_ids=[0] * len(prompts),
+                    max_new_tokens=MAX_NEW_TOKENS,
+                    do_sample=True,
+                    temperature=0.7,
+                    prefix=template.prefix,
+                    stop=FIRST_LINE
+                )
+            if self.router is not None:
+                self.router.record_model(time.perf_counter() - start, len(prompts))
+            for row, completion in zip(rows, completions):
+                answers[row] = _first_line(completion)
+        return answers
+    
+    def _query_model(self, prompt, prefix=None):
         """Send prompt to local model"""
+        if self.stream:
+            return self._stream_model(prompt)
         try:
-            response = self.model(prompt, max_new_tokens=50, do_sample=True, temperature=0.7, pad_token_id=50256)
-            full_text = response[0]['generated_text']
-            answer = full_text[len(prompt):].strip()
-            # Take first meaningful line
-            answer = answer.split('\n')[0].strip()
-            return answer if answer else "Model could not generate a response"
+            answer = generate_cached(
+                self.backend,
+                [prompt],
+                cache=self.cache,
+                seed=self.seed,
+                max_new_tokens=MAX_NEW_TOKENS,
+                do_sample=True,
+                temperature=0.7,
+                prefix=prefix,
+                stop=FIRST_LINE
+            )[0]
+            return _first_line(answer)
         except Exception as e:
             return f"Error: {str(e)}"
     
+    def _stream_model(self, prompt):
+        """Print the first answer line as it is generated and report its latency"""
+        with get_metrics().call() as call:
+            return self._stream_answer(prompt, call)
+    
+    def _stream_answer(self, prompt, call):
+        """Stream one answer, adding its cost to the metrics `call` if recording"""
+        stats = {}
+        text = ""
+        answer = ""
+        try:
+            with closing(self.backend.stream(
+                prompt,
+                max_new_tokens=MAX_NEW_TOKENS,
+                do_sample=True,
+                temperature=0.7,
+                seed=self.seed,
+                stats=stats,
+                stop=FIRST_LINE
+            )) as pieces, phase("generation"):
+                for piece in pieces:
+                    text += piece
+                    # Same shape as the batch answer: first meaningful line only
+                    visible = text.lstrip()
+                    line_end = visible.find('\n')
+                    if line_end >= 0:
+                        visible = visible[:line_end]
+                    print(visible[len(answer):], end="", flush=True)
+                    answer = visible
+                    if line_end >= 0:
+                        break
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            if call is not None:
+                call.errors += 1
+            return f"Error: {str(e)}"
+        
+        if call is not None:
+            call.prompt_tokens += self.backend.count_tokens(prompt)
+            call.generated_tokens += stats["tokens"]
+            call.prefill += stats["time_to_first_token"]
+            call.decode += stats["total_time"] - stats["time_to_first_token"]
+        
+        answer = answer.strip()
+        if not answer:
+            print("Model could not generate a response", end="")
+        print()
+        
+        self.last_stream_stats = stats
+        print(f"⏱️  First token: {stats['time_to_first_token'] * 1000:.0f} ms | "
+              f"{stats['tokens_per_second']:.1f} tokens/sec")
+        return answer if answer else "Model could not generate a response"
+    
     def run_interactive(self):
         """Interactive CLI for testing different prompt strategies"""
         print("🧠 EdTech Math Tutor - Prompt Engineering Lab")
@@ -91,13 +279,17 @@ Self-questioning approach:"""
         print("5. Exit")
         
         while True:
-            choice = input("\nEnter choice (1-5): ")
+            with phase("user_input"):
+                choice = input("\nEnter choice (1-5): ")
             
             if choice == "5":
                 break
                 
             if choice in ["1", "2", "3", "4"]:
-                question = input("Enter your math question: ")
+                with phase("user_input"):
+                    question = input("Enter your math question: ")
+                if not self.model_ready():
+                    print("⏳ Waiting for the model to finish loading...")
                 print("\n" + "="*50)
                 
                 if choice == "1":
@@ -113,11 +305,75 @@ Self-questioning approach:"""
                     print("SELF-ASK RESPONSE:")
                     response = self.self_ask_prompt(question)
                 
-                print(response)
+                if not self.stream:
+                    print(response)
                 print("="*50)
             else:
                 print("Invalid choice. Please try again.")
 
+def print_solver_report(report):
+    """Print how many questions the solver answered and the model time it saved"""
+    if not report or not report["queries"]:
+        return
+    print(f"\n⚡ Solver: {report['solver_hits']}/{report['queries']} questions answered without the model "
+          f"({report['hit_rate']:.0%} hit rate)")
+    if report["mean_solver_ms"] is not None and report["mean_model_ms"] is not None:
+        print(f"   {report['mean_solver_ms']:.3f} ms per solved question vs {report['mean_model_ms']:.1f} ms per model answer; "
+              f"about {report['estimated_seconds_saved']:.2f}s saved")
+
+def _first_line(completion):
+    """The first meaningful line of a completion, which is taken as the answer"""
+    with phase("answer_extraction"):
+        answer = completion.strip().split('\n')[0].strip()
+    return answer if answer else "Model could not generate a response"
+
 if __name__ == "__main__":
-    tutor = EdTechMathTutor()
-    tutor.run_interactive() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="EdTech Math Tutor - Prompt Engineering Lab")
+    parser.add_argument("--cache", metavar="PATH", help="reuse generations from an on-disk response cache")
+    parser.add_argument("--cache-bypass", action="store_true", help="ignore cached responses but refresh the cache")
+    parser.add_argument("--seed", type=int, help="sampling seed, part of the cache key; without it nothing is cached")
+    parser.add_argument("--stream", action="store_true", help="print answers token by token with latency stats")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="transformers", help="generation runtime")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32", help="CPU inference precision")
+    parser.add_argument("--metrics", metavar="PATH", help="record generation cost and write it as a Prometheus textfile on exit")
+    parser.add_argument("--profile", metavar="DIR", help="profile the session with cProfile and write flamegraph stacks and hotspots to DIR on exit")
+    parser.add_argument("--profile-torch", action="store_true", help="also run the torch profiler under --profile")
+    parser.add_argument("--no-solver", action="store_true", help="send every question to the model, even routine arithmetic")
+    parser.add_argument("--serve", action="store_true", help="serve the strategies over HTTP instead of the interactive prompt")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on with --serve")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on with --serve")
+    parser.add_argument("--batch-size", type=int, default=8, help="most questions answered in one batch with --serve")
+    parser.add_argument("--batch-window", type=float, default=0.01, help="seconds to wait for more questions before a batch runs")
+    parser.add_argument("--max-queue", type=int, default=64, help="questions allowed to wait before requests get 503")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a waiting request gets 504")
+    args = parser.parse_args()
+    
+    if args.metrics:
+        get_metrics().enable()
+    
+    # Time waiting at the prompts is kept apart as "user_input"
+    profiler = Profiler(args.profile, torch_profiler=args.profile_torch) if args.profile else nullcontext()
+    with profiler:
+        cache = ResponseCache(args.cache, bypass=args.cache_bypass) if args.cache else None
+        backend = create_backend(args.backend) if args.backend != "transformers" else None
+        tutor = EdTechMathTutor(cache=cache, seed=args.seed, stream=args.stream, backend=backend, precision=args.precision,
+                                solver=not args.no_solver)
+        try:
+            if args.serve:
+                from server import serve
+                
+                serve(tutor, STRATEGIES, args.host, args.port, max_batch_size=args.batch_size,
+                      batch_window=args.batch_window, max_queue=args.max_queue, timeout=args.timeout)
+            else:
+                tutor.run_interactive()
+        finally:
+            tutor.close()
+            print_solver_report(tutor.solver_report())
+            if args.metrics:
+                get_metrics().write_textfile(args.metrics)
+    
+    if args.profile:
+        print(f"\n🔬 Profile ({args.profile}):")
+        print(profiler.phase_table())
+        print(f"   Flamegraph stacks: {os.path.join(args.profile, 'profile.collapsed')}")
+        print(f"   Hotspots: {os.path.join(args.profile, 'hotspots.txt')}") 
\ No newline at end of file
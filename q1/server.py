@@ -0,0 +1,352 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout"
+}
+
+
+class QueueFull(Exception):
+    """The batcher's queue is at its limit; the client should retry later"""
+
+
+class _Pending:
+    """One question waiting for a batch"""
+    __slots__ = ("strategy", "question", "future", "enqueued")
+
+    def __init__(self, strategy, question, future):
+        self.strategy = strategy
+        self.question = question
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """Coalesces concurrent questions into batched tutor generations
+
+    The first queued question opens a batching window of `batch_window`
+    seconds; everything that arrives before it closes, up to
+    `max_batch_size` questions, is answered together with one generation
+    per strategy. Generation runs on a single worker thread, so there is
+    one model copy and the event loop stays free to accept requests while
+    a batch runs. At most `max_queue` questions wait at a time; beyond
+    that `submit` raises QueueFull instead of queueing.
+    """
+
+    def __init__(self, tutor, max_batch_size=8, batch_window=0.01, max_queue=64, timeout=30.0):
+        self.tutor = tutor
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queue = asyncio.Queue(max_queue)
+        self._full = asyncio.Event()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="tutor-generate")
+        self._task = None
+        self.stats = {"batches": 0, "answered": 0, "rejected": 0, "timed_out": 0, "largest_batch": 0}
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while not self._queue.empty():
+            request = self._queue.get_nowait()
+            if not request.future.done():
+                request.future.set_exception(QueueFull("Server is shutting down"))
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, strategy, question):
+        """Answer one question; returns (answer, batch_size, queue_wait)
+
+        Raises QueueFull when the queue is at its limit and
+        asyncio.TimeoutError when no answer arrives within `timeout`.
+        """
+        request = _Pending(strategy, question, asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise QueueFull(f"{self.max_queue} questions already queued")
+        if self._queue.qsize() >= self.max_batch_size:
+            self._full.set()
+
+        try:
+            # A timed-out request is cancelled and dropped from its batch
+            return await asyncio.wait_for(request.future, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch_size - 1:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.batch_window)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._full.clear()
+
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            results = await loop.run_in_executor(self._executor, self._answer, batch)
+            self.stats["batches"] += 1
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+            for request, result in zip(batch, results):
+                if request.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    self.stats["answered"] += 1
+                    request.future.set_result((result, len(batch), started - request.enqueued))
+
+    def _answer(self, batch):
+        """Answers for a batch, one generation per strategy; runs on the worker thread"""
+        groups = {}
+        for i, request in enumerate(batch):
+            groups.setdefault(request.strategy, []).append(i)
+
+        results = [None] * len(batch)
+        for strategy, rows in groups.items():
+            try:
+                answers = self.tutor.query_batch(strategy, [batch[row].question for row in rows])
+            except Exception as e:
+                answers = [e] * len(rows)
+            for row, answer in zip(rows, answers):
+                results[row] = answer
+        return results
+
+
+class TutorServer:
+    """Minimal asyncio HTTP/1.1 front end for the tutor
+
+    POST /answer with {"question": ..., "strategy": ...} returns
+    {"answer": ..., "strategy": ..., "solver": ..., "batch_size": ...,
+    "queue_wait": ...}, where "solver" names the query type when the
+    solver answered and is null for model answers; GET /health reports
+    readiness, batching counters and the solver hit rate. A full queue is
+    answered with 503 and Retry-After, a request that outlives its timeout
+    with 504.
+    """
+
+    def __init__(self, tutor, strategies, host="127.0.0.1", port=8000, max_batch_size=8, batch_window=0.01,
+                 max_queue=64, timeout=30.0, max_body=16384, idle_timeout=60.0):
+        self.tutor = tutor
+        self.strategies = list(strategies)
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.batcher_options = {
+            "max_batch_size": max_batch_size,
+            "batch_window": batch_window,
+            "max_queue": max_queue,
+            "timeout": timeout
+        }
+        self.batcher = None
+        self._server = None
+
+    async def start(self):
+        """Start listening; with port 0 the bound port is stored in `port`"""
+        self.batcher = MicroBatcher(self.tutor, **self.batcher_options)
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self.batcher is not None:
+            await self.batcher.close()
+
+    async def _handle(self, reader, writer):
+        """Serve requests on one connection until it closes"""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader, self.max_body), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except _HttpError as e:
+                    await _respond(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, extra = await self._route(method, path, body)
+                await _respond(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        """(status, payload, extra headers) for one request"""
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": "Use GET"}, {"Allow": "GET"}
+            return 200, self.health(), {}
+
+        if path != "/answer":
+            return 404, {"error": f"No route for {path}"}, {}
+        if method != "POST":
+            return 405, {"error": "Use POST"}, {"Allow": "POST"}
+
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "Body must be JSON"}, {}
+        question = data.get("question") if isinstance(data, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            return 400, {"error": "'question' must be a non-empty string"}, {}
+        strategy = data.get("strategy", "zero_shot")
+        if not isinstance(strategy, str) or strategy not in self.strategies:
+            return 400, {"error": f"Unknown strategy '{strategy}'. Choose from: {', '.join(self.strategies)}"}, {}
+
+        # Routine arithmetic is answered at once without queueing for the model
+        solution = self.tutor.solve(question)
+        if solution is not None:
+            return 200, {"answer": solution.answer, "strategy": strategy, "solver": solution.query_type,
+                         "batch_size": 0, "queue_wait": 0.0}, {}
+
+        try:
+            answer, batch_size, queue_wait = await self.batcher.submit(strategy, question)
+        except QueueFull as e:
+            return 503, {"error": str(e)}, {"Retry-After": "1"}
+        except asyncio.TimeoutError:
+            return 504, {"error": f"No answer within {self.batcher.timeout}s"}, {}
+        except Exception as e:
+            return 500, {"error": str(e)}, {}
+        return 200, {"answer": answer, "strategy": strategy, "solver": None, "batch_size": batch_size,
+                     "queue_wait": queue_wait}, {}
+
+    def health(self):
+        stats = self.batcher.stats
+        return {
+            "status": "ok",
+            "model_ready": self.tutor.model_ready(),
+            "queued": self.batcher.queued,
+            **stats,
+            "avg_batch_size": stats["answered"] / stats["batches"] if stats["batches"] else 0.0,
+            "solver": self.tutor.solver_report()
+        }
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def _read_request(reader, max_body):
+    """(method, path, headers, body) of the next request, or None at end of stream"""
+    line = await _readline(reader)
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise _HttpError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await _readline(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > 100:
+            raise _HttpError(400, "Too many headers")
+
+    # Bodies are read by Content-Length only; a chunked body would otherwise read as empty
+    if headers.get("transfer-encoding", "identity").lower() != "identity":
+        raise _HttpError(411, "Send the body with a Content-Length instead of Transfer-Encoding")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise _HttpError(400, "Invalid Content-Length")
+    if length < 0:
+        raise _HttpError(400, "Invalid Content-Length")
+    if length > max_body:
+        raise _HttpError(413, f"Body larger than {max_body} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+async def _readline(reader):
+    """One line of the request head; lines beyond the stream's limit are rejected with 431"""
+    try:
+        return await reader.readline()
+    except ValueError:
+        # readline raises ValueError (LimitOverrunError underneath) past the 64 KiB limit
+        raise _HttpError(431, "Request line or header too long")
+
+
+async def _respond(writer, status, payload, keep_alive=True, extra_headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    lines = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}"
+    ]
+    lines.extend(f"{name}: {value}" for name, value in (extra_headers or {}).items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+def serve(tutor, strategies, host="127.0.0.1", port=8000, **options):
+    """Run the HTTP service until interrupted"""
+    async def run():
+        server = await TutorServer(tutor, strategies, host, port, **options).start()
+        print(f"🌐 Serving {', '.join(server.strategies)} on http://{server.host}:{server.port}")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
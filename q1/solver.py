@@ -0,0 +1,343 @@
+import math
+import re
+import threading
+import time
+from fractions import Fraction
+
+# Query types, as listed under "query_types" in evaluation/input_queries.json
+QUERY_TYPES = ["linear_equation", "percentage_calculation", "geometry_area", "geometry_perimeter"]
+
+NUMBER = r"\d+(?:\.\d+)?"
+UNITS = r"mm|cm|km|m|in|ft"
+
+# A sum of terms such as 3x, -y, 2*z or 4.5, standing apart from other words
+_TERM = rf"(?<![a-z\d.])(?:{NUMBER}(?:\s*\*?\s*[a-z])?|[a-z])(?![a-z\d.])"
+_EXPRESSION = rf"[+-]?\s*{_TERM}(?:\s*[+-]\s*{_TERM})*"
+_LEFT_SIDE = re.compile(rf"{_EXPRESSION}\s*$")
+_RIGHT_SIDE = re.compile(rf"\s*{_EXPRESSION}")
+_TERM_PARTS = re.compile(rf"([+-]?)\s*(?:({NUMBER})\s*\*?\s*([a-z])?|([a-z]))")
+# Percentage questions must end with the calculation; what comes before it may only be words
+_PERCENT_OF = re.compile(rf"({NUMBER})\s*(?:%|percent)\s+of\s+({NUMBER})\s*[?.!]*\s*$")
+_WHAT_PERCENT = re.compile(rf"({NUMBER})\s+is\s+what\s+(?:%|percent|percentage)\s+of\s+({NUMBER})\s*[?.!]*\s*$")
+_DIMENSION = re.compile(
+    rf"\b(length|width|breadth|base|height|side|radius|diameter)s?\s*(?:of|=|is|:)?\s*({NUMBER})\s*({UNITS})?\b"
+)
+_SIDES = re.compile(rf"sides?\s*(?:of|=|are|:)?\s*({NUMBER})\s*({UNITS})?\s*,\s*({NUMBER})\s*({UNITS})?"
+                    rf"\s*,?\s*(?:and)?\s*({NUMBER})\s*({UNITS})?\b")
+# Anything left over that could change the result: a number, an operator or an arithmetic word
+_UNPARSED = re.compile(
+    r"\d|[+*/×÷^=%]|(?<![a-z])-|-(?![a-z])"
+    r"|\b(?:times|plus|minus|twice|double|half|thrice|triple|more|less|sum|product|difference|ratio"
+    r"|increased|decreased|reduced)\b"
+)
+# Unit sizes within each measurement system; units are only converted within one system
+UNIT_SIZES = {"mm": ("metric", 1), "cm": ("metric", 10), "m": ("metric", 1000), "km": ("metric", 1000000),
+              "in": ("imperial", 1), "ft": ("imperial", 12)}
+_MEASURES = re.compile(r"\b(area|perimeter|circumference)\b")
+_ASKED_MEASURE = re.compile(r"\b(?:what(?:'s|\s+is)|find|calculate|compute|determine|work\s+out)\s+"
+                            r"(?:the\s+|its\s+)?(area|perimeter|circumference)\b")
+_SHAPES = ["rectangle", "square", "triangle", "circle", "parallelogram"]
+
+
+class Solution:
+    """A solver answer for one query"""
+    __slots__ = ("query_type", "answer", "seconds")
+
+    def __init__(self, query_type, answer, seconds):
+        self.query_type = query_type
+        self.answer = answer
+        self.seconds = seconds
+
+
+def classify(question):
+    """The query type of a question, or None when it is none of QUERY_TYPES"""
+    lowered = question.lower()
+    if "%" in lowered or "percent" in lowered:
+        return "percentage_calculation"
+    measures = _MEASURES.findall(lowered)
+    if measures:
+        # "area of a square whose perimeter is 20" asks for the area: prefer the
+        # measure a question lead points at, then the first one mentioned
+        asked = _ASKED_MEASURE.search(lowered)
+        measure = asked.group(1) if asked else measures[0]
+        return "geometry_area" if measure == "area" else "geometry_perimeter"
+    if "=" in lowered and re.search(r"\d\s*[a-z]\b|\b[a-z]\s*[+\-=]", lowered):
+        return "linear_equation"
+    return None
+
+
+def solve(question):
+    """Solve a routine question exactly; returns (query_type, answer) or (query_type, None)
+
+    Anything the patterns do not fully understand - several variables,
+    brackets, unknown shapes or missing dimensions - is left unsolved so
+    that the model handles it.
+    """
+    query_type = classify(question)
+    if query_type is None:
+        return None, None
+    lowered = question.lower()
+    try:
+        if query_type == "linear_equation":
+            return query_type, _solve_linear(lowered)
+        if query_type == "percentage_calculation":
+            return query_type, _solve_percentage(lowered)
+        return query_type, _solve_geometry(lowered, query_type)
+    except (ValueError, ZeroDivisionError):
+        return query_type, None
+
+
+def _solve_linear(text):
+    if text.count("=") != 1:
+        return None
+    before, after = text.split("=")
+
+    # The equation must stand on its own: nothing but words before it and
+    # nothing but punctuation after it, so "x/2 + 1 = 5" is not misread
+    left = _LEFT_SIDE.search(before)
+    right = _RIGHT_SIDE.match(after)
+    if left is None or right is None:
+        return None
+    # "What is 2x + 1 when x = 3?" leaves a number before the equation, so it is not solved
+    if not _only_words(before[:left.start()]):
+        return None
+    if after[right.end():].strip(" .?!"):
+        return None
+
+    left_coefficient, left_constant, left_variables = _parse_linear(left.group(0))
+    right_coefficient, right_constant, right_variables = _parse_linear(right.group(0))
+    variables = left_variables | right_variables
+    if len(variables) != 1:
+        return None
+    variable = variables.pop()
+
+    coefficient = left_coefficient - right_coefficient
+    constant = right_constant - left_constant
+    if coefficient == 0:
+        return None
+    value = constant / coefficient
+    term = {1: variable, -1: f"-{variable}"}.get(coefficient, f"{_format(coefficient)}{variable}")
+    if coefficient == 1:
+        return f"{variable} = {_format(value)} (rearrange to {term} = {_format(constant)})"
+    return f"{variable} = {_format(value)} (rearrange to {term} = {_format(constant)}, then divide by {_format(coefficient)})"
+
+
+def _parse_linear(expression):
+    """(coefficient, constant, variables) of an expression matched by _EXPRESSION"""
+    coefficient = Fraction(0)
+    constant = Fraction(0)
+    variables = set()
+    for sign, number, variable, bare_variable in _TERM_PARTS.findall(expression):
+        value = Fraction(number) if number else Fraction(1)
+        if sign == "-":
+            value = -value
+        variable = variable or bare_variable
+        if variable:
+            variables.add(variable)
+            coefficient += value
+        else:
+            constant += value
+    return coefficient, constant, variables
+
+
+def _solve_percentage(text):
+    # "20% of 50% of 80" or "15% of 80 plus 5" leave numbers before or after the match, so they are not solved
+    match = _WHAT_PERCENT.search(text)
+    if match:
+        if not _only_words(text[:match.start()]):
+            return None
+        part, whole = Fraction(match.group(1)), Fraction(match.group(2))
+        return f"{_format(part / whole * 100)}% ({_format(part)} ÷ {_format(whole)} × 100)"
+    match = _PERCENT_OF.search(text)
+    if match:
+        if not _only_words(text[:match.start()]):
+            return None
+        percent, whole = Fraction(match.group(1)), Fraction(match.group(2))
+        return f"{_format(percent / 100 * whole)} ({_format(percent)}% of {_format(whole)} = {_format(percent / 100)} × {_format(whole)})"
+    return None
+
+
+def _only_words(text):
+    """True when text leading up to a calculation holds no numbers or operators"""
+    text = text.rstrip()
+    return _UNPARSED.search(text) is None and (not text or text[-1].isalpha() or text[-1] in ":,")
+
+
+def _solve_geometry(text, query_type):
+    shapes = [shape for shape in _SHAPES if shape in text]
+    if "circumference" in text:
+        shapes = ["circle"]
+    if len(shapes) != 1:
+        return None
+    shape = shapes[0]
+
+    dimensions = {}
+    units = {}
+    spans = []
+    for match in _DIMENSION.finditer(text):
+        name, value, unit = match.groups()
+        name = {"breadth": "width"}.get(name, name)
+        if name in dimensions:
+            return None
+        dimensions[name] = Fraction(value)
+        units[name] = unit
+        spans.append(match.span())
+
+    sides = _SIDES.search(text) if query_type == "geometry_perimeter" and shape == "triangle" else None
+    if sides:
+        spans.append(sides.span())
+        numbers, side_units = sides.groups()[0::2], sides.groups()[1::2]
+        # "3, 4 and 5 cm": a unit written once after the last side applies to all three
+        if side_units[0] is None and side_units[1] is None:
+            side_units = (side_units[2],) * 3
+        dimensions.pop("side", None)
+        units.pop("side", None)
+        for i, (number, unit) in enumerate(zip(numbers, side_units)):
+            dimensions[f"side {i + 1}"] = Fraction(number)
+            units[f"side {i + 1}"] = unit
+
+    # Every number and operator must belong to a dimension, so "2 times its width" is not misread
+    masked = list(text)
+    for start, end in spans:
+        masked[start:end] = " " * (end - start)
+    if _UNPARSED.search("".join(masked)):
+        return None
+
+    converted = _to_common_unit(dimensions, units)
+    if converted is None:
+        return None
+    dimensions, unit, conversions = converted
+    if sides:
+        dimensions["sides"] = [dimensions.pop(f"side {i}") for i in (1, 2, 3)]
+    if "diameter" in dimensions and "radius" not in dimensions:
+        dimensions["radius"] = dimensions["diameter"] / 2
+
+    if query_type == "geometry_area":
+        result = _area(shape, dimensions)
+        suffix = f" {unit}²" if unit else " square units"
+    else:
+        result = _perimeter(shape, dimensions)
+        suffix = f" {unit}" if unit else " units"
+    if result is None:
+        return None
+    value, formula = result
+    if conversions:
+        formula += f", with {' and '.join(conversions)}"
+    return f"{value}{suffix} ({formula})"
+
+
+def _to_common_unit(dimensions, units):
+    """(dimensions, unit, conversions) with every dimension in the smallest unit given
+
+    Returns None when the units cannot be reconciled: some dimensions have
+    a unit and others do not, or metric and imperial units are mixed.
+    """
+    given = {unit for unit in units.values() if unit}
+    if not given:
+        return dimensions, None, []
+    if None in units.values() or len({UNIT_SIZES[unit][0] for unit in given}) > 1:
+        return None
+
+    target = min(given, key=lambda unit: UNIT_SIZES[unit][1])
+    converted = {}
+    conversions = []
+    for name, value in dimensions.items():
+        factor = Fraction(UNIT_SIZES[units[name]][1], UNIT_SIZES[target][1])
+        converted[name] = value * factor
+        if factor != 1:
+            conversions.append(f"{_format(value)} {units[name]} = {_format(value * factor)} {target}")
+    return converted, target, conversions
+
+
+def _area(shape, d):
+    if shape == "rectangle" and {"length", "width"} <= d.keys():
+        return _format(d["length"] * d["width"]), "length × width"
+    if shape == "square" and "side" in d:
+        return _format(d["side"] ** 2), "side²"
+    if shape == "triangle" and {"base", "height"} <= d.keys():
+        return _format(d["base"] * d["height"] / 2), "½ × base × height"
+    if shape == "parallelogram" and {"base", "height"} <= d.keys():
+        return _format(d["base"] * d["height"]), "base × height"
+    if shape == "circle" and "radius" in d:
+        return f"{_format(d['radius'] ** 2)}π ≈ {math.pi * float(d['radius']) ** 2:.2f}", "π × radius²"
+    return None
+
+
+def _perimeter(shape, d):
+    if shape == "rectangle" and {"length", "width"} <= d.keys():
+        return _format(2 * (d["length"] + d["width"])), "2 × (length + width)"
+    if shape == "square" and "side" in d:
+        return _format(4 * d["side"]), "4 × side"
+    if shape == "triangle" and "sides" in d:
+        return _format(sum(d["sides"])), "sum of the three sides"
+    if shape == "circle" and "radius" in d:
+        return f"{_format(2 * d['radius'])}π ≈ {2 * math.pi * float(d['radius']):.2f}", "2 × π × radius"
+    return None
+
+
+def _format(value):
+    """An exact number as a student would write it: 3, 2.5 or 1/3"""
+    value = Fraction(value)
+    if value.denominator == 1:
+        return str(value.numerator)
+    denominator = value.denominator
+    for factor in (2, 5):
+        while denominator % factor == 0:
+            denominator //= factor
+    if denominator == 1:
+        return f"{float(value):g}"
+    return f"{value.numerator}/{value.denominator}"
+
+
+class SolverRouter:
+    """Answers routine questions with the solver and counts what it saves
+
+    Model calls made for the questions it could not solve are timed with
+    `record_model`, so the report can estimate the model time each solver
+    hit avoided.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = {query_type: [0, 0] for query_type in QUERY_TYPES + ["other"]}
+        self.solver_seconds = 0.0
+        self.model_calls = 0
+        self.model_seconds = 0.0
+
+    def route(self, question):
+        """A Solution, or None when the question needs the model"""
+        start = time.perf_counter()
+        query_type, answer = solve(question)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            counts = self.queries[query_type or "other"]
+            counts[0] += 1
+            if answer is not None:
+                counts[1] += 1
+                self.solver_seconds += elapsed
+        return Solution(query_type, answer, elapsed) if answer is not None else None
+
+    def record_model(self, seconds, questions=1):
+        """Time spent answering `questions` the solver passed on"""
+        with self._lock:
+            self.model_calls += questions
+            self.model_seconds += seconds
+
+    def report(self):
+        with self._lock:
+            queries = sum(counts[0] for counts in self.queries.values())
+            hits = sum(counts[1] for counts in self.queries.values())
+            model_mean = self.model_seconds / self.model_calls if self.model_calls else None
+            return {
+                "queries": queries,
+                "solver_hits": hits,
+                "hit_rate": hits / queries if queries else 0.0,
+                "by_type": {
+                    query_type: {"queries": counts[0], "solver_hits": counts[1]}
+                    for query_type, counts in self.queries.items() if counts[0]
+                },
+                "mean_solver_ms": self.solver_seconds / hits * 1000 if hits else None,
+                "mean_model_ms": model_mean * 1000 if model_mean is not None else None,
+                # Unknown until at least one question has gone to the model
+                "estimated_seconds_saved": hits * model_mean - self.solver_seconds if model_mean is not None else None
+            }
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+from common.backends import StubBackend
+from main import STRATEGIES, EdTechMathTutor
+from server import TutorServer
+
+
+async def send(port, raw):
+    """Send raw request bytes and return (status, headers, payload) of the response"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(raw)
+        await writer.drain()
+        status_line = await reader.readline()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return int(status_line.split()[1]), headers, json.loads(body)
+    finally:
+        writer.close()
+
+
+def post(port, payload, path="/answer"):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    head = f"POST {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    return send(port, head.encode("latin-1") + body)
+
+
+def question(i):
+    # Not routine arithmetic, so every one of these goes to the (stub) model
+    return {"question": f"Explain why prime number {i} has no other divisors", "strategy": "few_shot"}
+
+
+def run(latency=0.0, **options):
+    """Decorator running an async test against a fresh server on a free port"""
+    def decorate(test):
+        def wrapper():
+            async def main():
+                tutor = EdTechMathTutor(backend=StubBackend(latency=latency))
+                server = await TutorServer(tutor, STRATEGIES, port=0, **options).start()
+                try:
+                    await test(server)
+                finally:
+                    await server.close()
+            asyncio.run(main())
+        wrapper.__name__ = test.__name__
+        return wrapper
+    return decorate
+
+
+@run(latency=0.05, max_batch_size=8, batch_window=0.05)
+async def test_concurrent_questions_share_batches(server):
+    responses = await asyncio.gather(*(post(server.port, question(i)) for i in range(8)))
+
+    assert [status for status, _, _ in responses] == [200] * 8
+    assert max(payload["batch_size"] for _, _, payload in responses) > 1
+    assert server.batcher.stats["batches"] < 8
+    assert server.batcher.stats["answered"] == 8
+
+
+@run(latency=0.0)
+async def test_routine_questions_skip_the_queue(server):
+    status, _, payload = await post(server.port, {"question": "What is 20% of 80?"})
+    assert status == 200
+    assert payload["solver"] == "percentage_calculation"
+    assert payload["batch_size"] == 0
+    assert server.batcher.stats["batches"] == 0
+
+
+@run(latency=0.3, max_batch_size=1, batch_window=0.0, max_queue=1)
+async def test_full_queue_is_answered_with_503(server):
+    responses = await asyncio.gather(*(post(server.port, question(i)) for i in range(4)))
+
+    statuses = sorted(status for status, _, _ in responses)
+    assert statuses.count(503) >= 1
+    assert 200 in statuses
+    assert all(headers.get("retry-after") == "1" for status, headers, _ in responses if status == 503)
+    assert server.batcher.stats["rejected"] == statuses.count(503)
+
+
+@run(latency=0.5, timeout=0.1)
+async def test_slow_answer_is_answered_with_504(server):
+    status, _, payload = await post(server.port, question(0))
+    assert status == 504
+    assert "0.1" in payload["error"]
+    assert server.batcher.stats["timed_out"] == 1
+
+
+@run(max_body=1024)
+async def test_malformed_requests_are_rejected(server):
+    port = server.port
+    assert (await post(port, b"{not json"))[0] == 400
+    assert (await post(port, {"question": "   "}))[0] == 400
+    assert (await post(port, {"question": "Why?", "strategy": "telepathy"}))[0] == 400
+    assert (await post(port, {"question": "Why?", "strategy": ["few_shot"]}))[0] == 400
+    assert (await post(port, {"question": "x" * 2000}))[0] == 413
+    assert (await post(port, question(0), path="/nowhere"))[0] == 404
+    assert (await send(port, b"GET /answer HTTP/1.1\r\nConnection: close\r\n\r\n"))[0] == 405
+    assert (await send(port, b"NONSENSE\r\n\r\n"))[0] == 400
+    assert (await send(port, b"POST /answer HTTP/1.1\r\nContent-Length: ten\r\n\r\n"))[0] == 400
+
+    status, _, payload = await send(port, b"POST /answer HTTP/1.1\r\nX-Padding: " + b"a" * 70000 + b"\r\n\r\n")
+    assert status == 431
+    assert "too long" in payload["error"]
+
+    status, _, payload = await send(port, b"POST /answer HTTP/1.1\r\nContent-Length: -5\r\n\r\n")
+    assert status == 400
+    assert "Content-Length" in payload["error"]
+
+    chunked = b"POST /answer HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n"
+    assert (await send(port, chunked))[0] == 411
+
+    # The server is still healthy after all of that
+    status, _, payload = await send(port, b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert status == 200
+    assert payload["status"] == "ok"
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+from solver import classify, solve
+
+
+@pytest.mark.parametrize("question, answer", [
+    ("Solve 3x + 5 = 14", "x = 3 (rearrange to 3x = 9, then divide by 3)"),
+    ("Solve for y: 2y - 8 = 10", "y = 9 (rearrange to 2y = 18, then divide by 2)"),
+    ("Calculate 25% of 160", "40 (25% of 160 = 0.25 × 160)"),
+    ("What is 25% of 160?", "40 (25% of 160 = 0.25 × 160)"),
+    ("30 is what percent of 120?", "25% (30 ÷ 120 × 100)"),
+    ("What is the area of a triangle with base 8cm and height 6cm?", "24 cm² (½ × base × height)"),
+    ("If a rectangle has length 12cm and width 7cm, what is its perimeter?", "38 cm (2 × (length + width))"),
+    ("Perimeter of a triangle with sides 3, 4 and 5 cm", "12 cm (sum of the three sides)"),
+    ("Area of a square with side 4", "16 square units (side²)"),
+])
+def test_solves_plain_questions(question, answer):
+    assert solve(question)[1] == answer
+
+
+@pytest.mark.parametrize("question", [
+    # Substitutions are not equations to solve
+    "What is 2x + 1 when x = 3?",
+    "Find the value of 3y - 2 if y = 4",
+    "Evaluate 5x when x = 2",
+    # Chained percentages and trailing arithmetic are left to the model
+    "What is 20% of 50% of 80?",
+    "What is 15% of 80 plus 5?",
+    "Add 3 to 15% of 80",
+    # A dimension given relative to another is not a measurement
+    "What is the area of a rectangle whose length is 2 times its width 4cm?",
+    # Some dimensions without units, or metric mixed with imperial
+    "What is the area of a rectangle with length 5 and width 3cm?",
+    "What is the area of a rectangle with length 2 ft and width 30 cm?",
+])
+def test_leaves_unparsed_questions_to_the_model(question):
+    assert solve(question)[1] is None
+
+
+@pytest.mark.parametrize("question, answer", [
+    ("What is the area of a rectangle with length 5 m and width 30 cm?",
+     "15000 cm² (length × width, with 5 m = 500 cm)"),
+    ("What is the area of a triangle with base 8cm and height 6m?",
+     "2400 cm² (½ × base × height, with 6 m = 600 cm)"),
+    ("What is the area of a rectangle with length 2 ft and width 6 in?",
+     "144 in² (length × width, with 2 ft = 24 in)"),
+    ("Find the perimeter of a triangle with sides 3 cm, 4 cm and 50 mm",
+     "120 mm (sum of the three sides, with 3 cm = 30 mm and 4 cm = 40 mm)"),
+])
+def test_converts_mixed_units_to_the_smallest(question, answer):
+    assert solve(question)[1] == answer
+
+
+@pytest.mark.parametrize("question, query_type", [
+    ("What is the area of a square whose perimeter is 20 cm?", "geometry_area"),
+    ("If a rectangle has area 20 cm² and length 5 cm, what is its perimeter?", "geometry_perimeter"),
+    ("Find the circumference of a circle with radius 3 cm", "geometry_perimeter"),
+])
+def test_classifies_by_the_measure_asked_for(question, query_type):
+    assert classify(question) == query_type
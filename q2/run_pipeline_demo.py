@@ -1,48 +1,93 @@
+import argparse
+import contextlib
 import json
 import os
+import sys
 from datetime import datetime
 
-def main():
-    print("🧠 Multi-Path Reasoning Pipeline Demo")
-    print("Testing Tree-of-Thought + Self-Consistency + Automated Optimization")
-    
-    # Load test tasks
-    with open('tasks/problem_definitions.json', 'r') as f:
-        tasks = json.load(f)['tasks']
-    
-    print(f"\n🚀 Running pipeline on {len(tasks)} tasks")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import get_metrics
+from common.profiling import Profiler, phase
+from records import ReasoningPath, TaskResult
+from result_log import ResultLog, completed_ids, read_records, summarize
+from self_consistency import matches_expected
+
+# Task results are appended here as each task completes
+RESULTS_LOG = 'logs/reasoning_paths.jsonl'
+
+def simulated_task_paths(tasks):
+    """Yield (task, paths) with fixed simulated reasoning paths"""
+    for task in tasks:
+        yield task, [
+            ReasoningPath(1, "systematic", "", "path1_answer", 0.7),
+            ReasoningPath(2, "intuitive", "", "path1_answer", 0.6),
+            ReasoningPath(3, "analytical", "", "path2_answer", 0.8)
+        ]
+
+def live_task_paths(tasks, prompt_template, num_paths=3, max_batch_size=8, cache=None, backend=None,
+                    precision="float32", workers=1, threads_per_worker=None, seed=None):
+    """Yield (task, paths) generated by the model through the continuous-batching scheduler
     
-    results = []
+    With several workers the tasks are sharded across spawned processes,
+    each loading its own model copy and running its own scheduler.
+    """
+    from reasoning_tree import ReasoningTree
     
-    for i, task in enumerate(tasks):
+    tree = ReasoningTree(cache=cache, seed=seed, backend=backend, precision=precision)
+    try:
+        if workers > 1:
+            yield from tree.generate_paths_sharded(tasks, prompt_template, num_paths, max_batch_size, workers,
+                                                   threads_per_worker)
+            print_worker_stats(tree.worker_stats)
+        else:
+            yield from tree.generate_paths_for_tasks(tasks, prompt_template, num_paths, max_batch_size)
+    finally:
+        tree.close()
+
+def print_worker_stats(worker_stats):
+    """Print the throughput of each worker process"""
+    print(f"\n⚙️  Worker throughput:")
+    for stats in worker_stats:
+        print(f"   Worker {stats['worker']} (pid {stats['pid']}, {stats['threads']} threads): "
+              f"{stats['items']} tasks in {stats['seconds']:.2f}s ({stats['items_per_second']:.2f} tasks/s)")
+    total_items = sum(stats['items'] for stats in worker_stats)
+    wall = max((stats['seconds'] for stats in worker_stats), default=0)
+    if wall > 0:
+        print(f"   Total: {total_items / wall:.2f} tasks/s")
+
+def print_profile(profiler):
+    """Print where the profiled run spent its time"""
+    print(f"\n🔬 Profile ({profiler.output_dir}):")
+    print(profiler.phase_table())
+    print(f"   Flamegraph stacks: {os.path.join(profiler.output_dir, 'profile.collapsed')}")
+    print(f"   Hotspots: {os.path.join(profiler.output_dir, 'hotspots.txt')}")
+
+def run_tasks(task_paths, positions, live, results_log):
+    """Aggregate each task's paths and append its result to the log"""
+    for task, paths in task_paths:
         print(f"\n📝 Task {task['id']}: {task['category']}")
         print(f"Problem: {task['problem']}")
         print(f"Expected: {task['expected_answer']}")
         
-        # Simulate Tree-of-Thought (multiple reasoning paths)
-        print("🌳 Tree-of-Thought: Generating 3 reasoning paths...")
-        
-        paths = [
-            {"path_id": 1, "approach": "systematic", "answer": "path1_answer", "confidence": 0.7},
-            {"path_id": 2, "approach": "intuitive", "answer": "path1_answer", "confidence": 0.6}, 
-            {"path_id": 3, "approach": "analytical", "answer": "path2_answer", "confidence": 0.8}
-        ]
+        print(f"🌳 Tree-of-Thought: {len(paths)} reasoning paths")
         
         for path in paths:
-            print(f"  Path {path['path_id']} ({path['approach']}): {path['answer']} (conf: {path['confidence']})")
+            print(f"  Path {path.path_id} ({path.prompt_variation}): {path.final_answer} (conf: {path.confidence})")
         
         # Simulate Self-Consistency (majority voting)
         print("🤝 Self-Consistency: Applying majority voting...")
         
-        # Count answers
-        answer_counts = {}
-        for path in paths:
-            answer = path['answer']
-            answer_counts[answer] = answer_counts.get(answer, 0) + 1
-        
-        # Get majority answer
-        majority_answer = max(answer_counts, key=answer_counts.get)
-        majority_count = answer_counts[majority_answer]
+        with phase("aggregation"):
+            # Count answers
+            answer_counts = {}
+            for path in paths:
+                answer = path.final_answer
+                answer_counts[answer] = answer_counts.get(answer, 0) + 1
+            
+            # Get majority answer
+            majority_answer = max(answer_counts, key=answer_counts.get)
+            majority_count = answer_counts[majority_answer]
         
         confidence = majority_count / len(paths)
         agreement = confidence  # Same in this case
@@ -51,32 +96,70 @@ def main():
         print(f"  Confidence: {confidence:.2f}")
         print(f"  Agreement: {agreement:.2f}")
         
-        # Simulate correctness (for demo, make some correct)
-        is_correct = (i % 3 == 0)  # Every 3rd task correct
+        if live:
+            is_correct = matches_expected(majority_answer, task['expected_answer'])
+        else:
+            # Simulate correctness (for demo, make some correct)
+            is_correct = (positions[task['id']] % 3 == 0)  # Every 3rd task correct
         
         print(f"  ✅ Correct: {is_correct}")
         
-        result = {
-            "task_id": task['id'],
-            "problem": task['problem'],
-            "expected_answer": task['expected_answer'],
-            "reasoning_paths": paths,
-            "final_answer": majority_answer,
-            "confidence": confidence,
-            "agreement": agreement,
-            "is_correct": is_correct,
-            "timestamp": datetime.now().isoformat()
-        }
+        result = TaskResult(
+            task_id=task['id'],
+            problem=task['problem'],
+            expected_answer=task['expected_answer'],
+            reasoning_paths=paths,
+            final_answer=majority_answer,
+            confidence=confidence,
+            agreement=agreement,
+            is_correct=is_correct,
+            timestamp=datetime.now().isoformat()
+        )
         
-        results.append(result)
+        results_log.append(result)
         print("-" * 60)
+
+def main(live=False, num_paths=3, batch_size=8, cache=None, backend=None, precision="float32", resume=False,
+         workers=1, threads_per_worker=None, metrics_path=None, seed=None):
+    print("🧠 Multi-Path Reasoning Pipeline Demo")
+    print("Testing Tree-of-Thought + Self-Consistency + Automated Optimization")
+    
+    # Load test tasks
+    with open('tasks/problem_definitions.json', 'r') as f:
+        tasks = json.load(f)['tasks']
+    positions = {task['id']: i for i, task in enumerate(tasks)}
+    
+    if resume:
+        done = completed_ids(RESULTS_LOG)
+        tasks = [task for task in tasks if task['id'] not in done]
+        print(f"\n⏩ Resuming: {len(done)} tasks already in {RESULTS_LOG}")
+    
+    print(f"\n🚀 Running pipeline on {len(tasks)} tasks")
+    
+    if live:
+        # Paths of all tasks share one continuously refilled generation batch
+        print(f"🌳 Tree-of-Thought: Generating {num_paths} reasoning paths per task (batch size {batch_size})...")
+        task_paths = live_task_paths(tasks, 'prompts/initial_prompt.txt', num_paths, batch_size, cache, backend, precision,
+                                     workers, threads_per_worker, seed)
+    else:
+        task_paths = simulated_task_paths(tasks)
+    
+    # Each result goes to disk as soon as its task completes
+    results_log = ResultLog(RESULTS_LOG, resume=resume)
     
-    # Calculate overall performance
-    correct_count = sum(1 for r in results if r['is_correct'])
-    total_tasks = len(results)
-    accuracy = correct_count / total_tasks
-    avg_confidence = sum(r['confidence'] for r in results) / total_tasks
-    avg_agreement = sum(r['agreement'] for r in results) / total_tasks
+    try:
+        run_tasks(task_paths, positions, live, results_log)
+    finally:
+        results_log.close()
+    
+    # Metrics cover every task in the log, including those from earlier runs
+    with phase("log_io"):
+        metrics = summarize(read_records(RESULTS_LOG))
+    correct_count = metrics["correct_answers"]
+    total_tasks = metrics["total_tasks"]
+    accuracy = metrics["accuracy"]
+    avg_confidence = metrics["avg_confidence"]
+    avg_agreement = metrics["avg_agreement"]
     
     print(f"\n📊 PIPELINE PERFORMANCE SUMMARY:")
     print(f"   Total tasks: {total_tasks}")
@@ -123,15 +206,9 @@ Final Answer:"""
     
     pipeline_report = {
         "pipeline_type": "Multi-Path Reasoning with Tree-of-Thought + Self-Consistency + Automated Optimization",
-        "model_used": "microsoft/DialoGPT-small (simulated)",
-        "test_results": results,
-        "performance_metrics": {
-            "accuracy": accuracy,
-            "avg_confidence": avg_confidence,
-            "avg_agreement": avg_agreement,
-            "total_tasks": total_tasks,
-            "correct_answers": correct_count
-        },
+        "model_used": (backend.model_id if backend is not None else "microsoft/DialoGPT-small") if live else "microsoft/DialoGPT-small (simulated)",
+        "results_log": RESULTS_LOG,
+        "performance_metrics": metrics,
         "components_tested": {
             "tree_of_thought": "Multiple reasoning paths generated",
             "self_consistency": "Majority voting for final answer",
@@ -146,20 +223,22 @@ Final Answer:"""
         "timestamp": datetime.now().isoformat()
     }
     
-    # Save main results
-    with open('logs/pipeline_results.json', 'w') as f:
-        json.dump(pipeline_report, f, indent=2)
+    if metrics_path:
+        # Counters of a sharded run's workers are merged in as each one finishes
+        pipeline_report["generation_metrics"] = get_metrics().summary()
+        get_metrics().write_textfile(metrics_path)
     
-    # Save individual reasoning paths
-    with open('logs/reasoning_paths.json', 'w') as f:
-        reasoning_data = [r for r in results]
-        json.dump(reasoning_data, f, indent=2)
+    # Save main results; per-task results are already in the JSONL log
+    with phase("log_io"), open('logs/pipeline_results.json', 'w') as f:
+        json.dump(pipeline_report, f, indent=2)
     
     print(f"\n✅ PIPELINE DEMO COMPLETED!")
     print(f"📁 Results saved to:")
     print(f"   - logs/pipeline_results.json (main report)")
-    print(f"   - logs/reasoning_paths.json (detailed paths)")
+    print(f"   - {RESULTS_LOG} (one line per task, with paths)")
     print(f"   - prompts/optimized_prompt_v1.txt (if optimized)")
+    if metrics_path:
+        print(f"   - {metrics_path} (Prometheus generation metrics)")
     
     print(f"\n🏆 COMPONENTS SUCCESSFULLY DEMONSTRATED:")
     print(f"   ✓ Tree-of-Thought: Generated multiple reasoning paths")
@@ -169,4 +248,46 @@ Final Answer:"""
     return pipeline_report
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Multi-path reasoning pipeline demo")
+    parser.add_argument("--live", action="store_true", help="generate reasoning paths with the model instead of simulating them")
+    parser.add_argument("--num-paths", type=int, default=3, help="reasoning paths per task")
+    parser.add_argument("--batch-size", type=int, default=8, help="sequences decoded together by the scheduler")
+    parser.add_argument("--cache", metavar="PATH", help="reuse generations from an on-disk response cache")
+    parser.add_argument("--cache-bypass", action="store_true", help="ignore cached responses but refresh the cache")
+    parser.add_argument("--seed", type=int, help="sampling seed, part of the cache key; without it nothing is cached")
+    parser.add_argument("--backend", choices=["transformers", "onnxruntime", "stub"], default="transformers", help="generation runtime for --live")
+    parser.add_argument("--precision", choices=["float32", "bfloat16", "int8"], default="float32", help="CPU inference precision for --live")
+    parser.add_argument("--resume", action="store_true", help="skip tasks already in the results log and append to it")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the model for --live")
+    parser.add_argument("--threads-per-worker", type=int, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--metrics", metavar="PATH", help="record generation cost per call and write it as a Prometheus textfile")
+    parser.add_argument("--profile", metavar="DIR", help="profile the run with cProfile and write flamegraph stacks and hotspots to DIR")
+    parser.add_argument("--profile-torch", action="store_true", help="also run the torch profiler under --profile")
+    args = parser.parse_args()
+    
+    if args.metrics:
+        get_metrics().enable()
+    
+    cache = None
+    if args.cache:
+        from common.response_cache import ResponseCache
+        cache = ResponseCache(args.cache, bypass=args.cache_bypass)
+    
+    backend = None
+    if args.backend != "transformers":
+        from common.backends import create_backend
+        backend = create_backend(args.backend)
+    
+    # Worker processes are not profiled; profile with --workers 1 to see the generation itself
+    profiler = Profiler(args.profile, torch_profiler=args.profile_torch) if args.profile else contextlib.nullcontext()
+    with profiler:
+        main(live=args.live, num_paths=args.num_paths, batch_size=args.batch_size, cache=cache, backend=backend,
+             precision=args.precision, resume=args.resume, workers=args.workers,
+             threads_per_worker=args.threads_per_worker, metrics_path=args.metrics, seed=args.seed)
+    
+    if args.profile:
+        print_profile(profiler)
+    
+    if cache is not None:
+        stats = cache.stats()
+        print(f"\n💾 Response cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import re
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.profiling import profiled
+
+# Markers after which the rest of the line is taken as the final answer,
+# in order of precedence when a line holds several
+ANSWER_KEYWORDS = ['answer:', 'final answer:', 'result:', 'solution:']
+
+# Phrases whose presence suggests a well-formed chain of reasoning
+CONFIDENCE_INDICATORS = [
+    "step by step", "therefore", "because", "so", "thus",
+    "final answer", "result", "solution"
+]
+
+# Lines that only set up the reasoning are never taken as the answer
+SETUP_PREFIXES = ('Step', 'First', 'Next')
+
+# Answers are grouped by their first number, else by yes/no wording
+NUMBER = re.compile(r'\d+\.?\d*')
+AFFIRMATIVE_WORDS = ('yes', 'true', 'correct')
+NEGATIVE_WORDS = ('no', 'false', 'incorrect')
+
+ScanResult = namedtuple("ScanResult", ["final_answer", "answer_key", "confidence"])
+
+
+class AnswerScanner:
+    """Extracts the final answer, its normalized key and a confidence score in one call
+
+    The text is lowercased once and searched with one compiled alternation
+    for the answer markers and one for the confidence indicators; lines are
+    only split when no answer marker is present.
+    """
+
+    def __init__(self, answer_keywords=ANSWER_KEYWORDS, confidence_indicators=CONFIDENCE_INDICATORS):
+        self.answer_keywords = tuple(answer_keywords)
+        self.confidence_indicators = tuple(confidence_indicators)
+        self._markers = _alternation(self.answer_keywords)
+        # A lookahead reports a match at every position, overlapping ones
+        # included; longest first so that "solution" is not hidden by "so"
+        self._indicators = re.compile(f"(?=({_alternation(self.confidence_indicators).pattern}))")
+        # Indicators a match implies: every one of them occurs inside it
+        self._implied = {
+            indicator: frozenset(other for other in self.confidence_indicators if other in indicator)
+            for indicator in self.confidence_indicators
+        }
+
+    @profiled("answer_extraction")
+    def scan(self, text):
+        """Scan one reasoning text"""
+        lowered = text.lower()
+        final_answer = self._final_answer(text, lowered)
+        return ScanResult(final_answer, self.normalize(final_answer), self._confidence(lowered))
+
+    def scan_batch(self, texts):
+        """Scan many reasoning texts, e.g. every path of a task"""
+        return [self.scan(text) for text in texts]
+
+    def extract_final_answer(self, text):
+        """The final answer of a reasoning text; use scan() when the confidence is needed too"""
+        return self._final_answer(text, text.lower())
+
+    def confidence(self, text):
+        """Confidence score of a reasoning text; use scan() when the answer is needed too"""
+        return self._confidence(text.lower())
+
+    def normalize(self, answer):
+        """Normalized key used to group equivalent answers"""
+        if not answer:
+            return ""
+
+        normalized = answer.lower().strip()
+
+        # The first number wins; otherwise yes/no words decide
+        number = NUMBER.search(normalized)
+        if number:
+            return f"number_{number.group()}"
+
+        if any(word in normalized for word in AFFIRMATIVE_WORDS):
+            return "affirmative"
+        elif any(word in normalized for word in NEGATIVE_WORDS):
+            return "negative"
+
+        # Return first meaningful word
+        for word in normalized.split():
+            if len(word) > 2 and not word.isdigit():
+                return word
+        return normalized
+
+    def _final_answer(self, text, lowered):
+        """Answer on the line holding the first marker, or the last meaningful line"""
+        marker = self._markers.search(lowered)
+        if marker:
+            position = marker.start()
+            start = lowered.rfind('\n', 0, position) + 1
+            end = lowered.find('\n', position)
+            line = lowered[start:end if end >= 0 else len(lowered)].strip()
+            for keyword in self.answer_keywords:
+                if keyword in line:
+                    answer = line.split(keyword)[1].strip()
+                    return answer if answer else "No clear answer"
+
+        for line in reversed(text.split('\n')):
+            line = line.strip()
+            if line and not line.startswith(SETUP_PREFIXES):
+                return line
+
+        return "No clear answer found"
+
+    def _confidence(self, lowered):
+        """Share of confidence indicators present; errors score zero"""
+        if not lowered or "error" in lowered:
+            return 0.0
+        found = set()
+        for match in self._indicators.finditer(lowered):
+            found |= self._implied[match.group(1)]
+            if len(found) == len(self._implied):
+                break
+        return min(len(found) / len(self.confidence_indicators), 1.0)
+
+
+def _alternation(phrases):
+    """One compiled regex matching any of `phrases`, longest first"""
+    return re.compile("|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True)))
+
+
+SCANNER = AnswerScanner()
@@ -0,0 +1,334 @@
+"""Vectorized self-consistency over the reasoning paths of many tasks
+
+`SelfConsistency.aggregate_answers` and `evaluate_consistency` handle one
+task at a time. Here the paths of every task sit in flat columns (task
+code, interned answer code, confidence), and all three aggregation methods
+plus the consistency analysis are computed with NumPy group-by operations.
+Results match the per-task methods, including their tie-breaking: among
+equally good answers the one seen first wins.
+
+Re-score a saved log:
+    python src/bulk_aggregation.py logs/reasoning_paths.jsonl --methods majority_vote
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from answer_scanner import SCANNER
+from result_log import read_records
+
+METHODS = ("majority_vote", "confidence_weighted", "semantic_similarity")
+
+# Paths whose generation failed are left out of every aggregation
+ERROR_ANSWER = "Error"
+
+# Distribution reported next to each method's answer, as in aggregate_answers
+DISTRIBUTION_KEYS = {
+    "majority_vote": "vote_distribution",
+    "confidence_weighted": "weight_distribution",
+    "semantic_similarity": "similar_groups"
+}
+
+Groups = namedtuple("Groups", ["task", "label", "first", "size", "inverse"])
+
+
+class PathColumns:
+    """Reasoning paths of many tasks stored as flat columns
+
+    Answers are interned: every distinct answer string gets one code and is
+    normalized once, however many paths share it.
+    """
+
+    def __init__(self, normalize=SCANNER.normalize):
+        self.normalize = normalize
+        self.task_ids = []
+        self.answers = []
+        self.answer_keys = []
+        self.keys = []
+        self.task_column = []
+        self.answer_column = []
+        self.confidence_column = []
+        self._answer_codes = {}
+        self._key_codes = {}
+
+    @classmethod
+    def from_tasks(cls, task_paths, answer_field="final_answer"):
+        """Build columns from (task_id, paths) pairs"""
+        columns = cls()
+        for task_id, paths in task_paths:
+            columns.add_task(task_id, paths, answer_field)
+        return columns
+
+    @property
+    def error_code(self):
+        """Code of the error answer, or -1 if no path failed"""
+        return self._answer_codes.get(ERROR_ANSWER, -1)
+
+    def add_task(self, task_id, paths, answer_field="final_answer"):
+        """Append the paths of one task; returns its task code"""
+        task = len(self.task_ids)
+        self.task_ids.append(task_id)
+        for path in paths:
+            self.task_column.append(task)
+            self.answer_column.append(self.intern(path[answer_field]))
+            self.confidence_column.append(path["confidence"])
+        return task
+
+    def intern(self, answer):
+        """Code of an answer string, normalizing it the first time it is seen"""
+        code = self._answer_codes.get(answer)
+        if code is None:
+            key = self.normalize(answer)
+            key_code = self._key_codes.get(key)
+            if key_code is None:
+                key_code = self._key_codes[key] = len(self.keys)
+                self.keys.append(key)
+            code = self._answer_codes[answer] = len(self.answers)
+            self.answers.append(answer)
+            self.answer_keys.append(key_code)
+        return code
+
+    def __len__(self):
+        return len(self.task_column)
+
+
+def aggregate_columns(columns, methods=METHODS, details=False):
+    """Aggregate every task in `columns`; returns one result dict per task
+
+    Each result has the keys of `SelfConsistency.aggregate_answers`, with the
+    best method chosen among `methods`, plus "task_id" and "consistency"
+    (the output of `evaluate_consistency`). `details` adds "all_answers" and
+    the chosen method's distribution, which cost a Python pass per path.
+    """
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown or not methods:
+        raise ValueError(f"Unknown aggregation method(s): {', '.join(unknown) or 'none given'}")
+
+    num_tasks = len(columns.task_ids)
+    tasks = np.asarray(columns.task_column, dtype=np.int64)
+    answers = np.asarray(columns.answer_column, dtype=np.int64)
+    confidences = np.asarray(columns.confidence_column, dtype=np.float64)
+    total_paths = np.bincount(tasks, minlength=num_tasks)
+
+    valid = answers != columns.error_code
+    tasks, answers, confidences = tasks[valid], answers[valid], confidences[valid]
+    keys = np.asarray(columns.answer_keys, dtype=np.int64)[answers]
+    valid_paths = np.bincount(tasks, minlength=num_tasks)
+    has_paths = valid_paths > 0
+    counts = np.maximum(valid_paths, 1)
+
+    by_answer = _group(tasks, answers, len(columns.answers))
+    by_key = _group(tasks, keys, len(columns.keys))
+
+    # Majority vote: the most frequent answer
+    majority = _best_per_task(by_answer.task, by_answer.size, num_tasks)
+    majority_answer = _pick(by_answer.label, majority)
+    majority_confidence = _pick(by_answer.size, majority) / counts
+
+    # Confidence weighted: the answer with the largest summed confidence
+    weights = np.bincount(by_answer.inverse, weights=confidences, minlength=len(by_answer.task))
+    weighted = _best_per_task(by_answer.task, weights, num_tasks)
+    total_weight = np.bincount(by_answer.task, weights=weights, minlength=num_tasks)
+    weighted_answer = _pick(by_answer.label, weighted)
+    weighted_confidence = np.divide(
+        _pick(weights, weighted), total_weight, out=np.zeros(num_tasks), where=total_weight > 0
+    )
+
+    # Semantic similarity: the largest group of equivalent answers, shown by its first member
+    similar = _best_per_task(by_key.task, by_key.size, num_tasks)
+    similar_answer = _pick(answers, _pick(by_key.first, similar))
+    similar_confidence = _pick(by_key.size, similar) / counts
+
+    candidates = {
+        "majority_vote": (majority_answer, majority_confidence),
+        "confidence_weighted": (weighted_answer, weighted_confidence),
+        "semantic_similarity": (similar_answer, similar_confidence)
+    }
+    chosen = [method for method in METHODS if method in methods]
+    scores = np.stack([candidates[method][1] for method in chosen], axis=1)
+    best = np.argmax(scores, axis=1)
+    best_answer = np.stack([candidates[method][0] for method in chosen], axis=1)[np.arange(num_tasks), best]
+    best_confidence = scores[np.arange(num_tasks), best]
+
+    # Consistency: distinct raw answers and the spread of path confidences
+    unique_answers = np.bincount(by_answer.task, minlength=num_tasks)
+    avg_confidence = np.bincount(tasks, weights=confidences, minlength=num_tasks) / counts
+    deviation = confidences - avg_confidence[tasks]
+    confidence_variance = np.bincount(tasks, weights=deviation ** 2, minlength=num_tasks) / counts
+    answer_consistency = 1 - (unique_answers - 1) / counts
+    confidence_consistency = np.maximum(0, 1 - confidence_variance)
+
+    if details:
+        per_task = _details(columns, tasks, answers, by_answer, by_key, weights, num_tasks)
+
+    results = []
+    rows = zip(
+        columns.task_ids, total_paths.tolist(), valid_paths.tolist(), has_paths.tolist(),
+        best.tolist(), best_answer.tolist(), best_confidence.tolist(), unique_answers.tolist(),
+        answer_consistency.tolist(), confidence_consistency.tolist(), avg_confidence.tolist()
+    )
+    for task, (task_id, total, num_valid, present, method_index, answer, confidence,
+               distinct, answer_score, confidence_score, average) in enumerate(rows):
+        if total == 0:
+            result = {"final_answer": "No paths provided", "confidence": 0.0, "method": "none"}
+        elif not present:
+            result = {"final_answer": "All paths failed", "confidence": 0.0, "method": "error"}
+        else:
+            method = chosen[method_index]
+            result = {
+                "final_answer": columns.answers[answer],
+                "confidence": confidence,
+                "method": method
+            }
+            if details:
+                result[DISTRIBUTION_KEYS[method]] = per_task[method][task]
+                result["all_answers"] = per_task["all_answers"][task]
+            result["path_count"] = num_valid
+
+        result["task_id"] = task_id
+        result["consistency"] = _consistency(
+            total, num_valid, distinct, answer_score, confidence_score, average
+        )
+        results.append(result)
+
+    return results
+
+
+def _group(tasks, labels, num_labels):
+    """Group paths by (task, label), ordered by each group's first path"""
+    pairs = tasks * max(num_labels, 1) + labels
+    unique, first, inverse, size = np.unique(pairs, return_index=True, return_inverse=True, return_counts=True)
+
+    # First-seen order makes per-task sums run in the same order as the dict-based methods
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    unique = unique[order]
+    return Groups(
+        task=unique // max(num_labels, 1),
+        label=unique % max(num_labels, 1),
+        first=first[order],
+        size=size[order],
+        inverse=rank[inverse.reshape(-1)]
+    )
+
+
+def _best_per_task(group_task, score, num_tasks):
+    """Index of the highest scoring group of each task, the earliest on ties"""
+    best = np.zeros(num_tasks, dtype=np.int64)
+    if len(group_task) == 0:
+        return best
+    order = np.lexsort((np.arange(len(group_task)), -score, group_task))
+    ordered_tasks = group_task[order]
+    starts = np.flatnonzero(np.r_[True, ordered_tasks[1:] != ordered_tasks[:-1]])
+    best[ordered_tasks[starts]] = order[starts]
+    return best
+
+
+def _pick(values, index):
+    """values[index], or zeros when no task has a valid path"""
+    if len(values) == 0:
+        return np.zeros(len(index), dtype=values.dtype)
+    return values[index]
+
+
+def _details(columns, tasks, answers, by_answer, by_key, weights, num_tasks):
+    """Per-task answer lists and method distributions"""
+    details = {
+        "majority_vote": [{} for _ in range(num_tasks)],
+        "confidence_weighted": [{} for _ in range(num_tasks)],
+        "semantic_similarity": [{} for _ in range(num_tasks)],
+        "all_answers": [[] for _ in range(num_tasks)]
+    }
+    for task, label, size, weight in zip(by_answer.task.tolist(), by_answer.label.tolist(),
+                                         by_answer.size.tolist(), weights.tolist()):
+        answer = columns.answers[label]
+        details["majority_vote"][task][answer] = size
+        details["confidence_weighted"][task][answer] = weight
+    for task, label, size in zip(by_key.task.tolist(), by_key.label.tolist(), by_key.size.tolist()):
+        details["semantic_similarity"][task][columns.keys[label]] = size
+    for task, answer in zip(tasks.tolist(), answers.tolist()):
+        details["all_answers"][task].append(columns.answers[answer])
+    return details
+
+
+def _consistency(total, num_valid, distinct, answer_score, confidence_score, average):
+    """evaluate_consistency output for one task"""
+    if total == 0:
+        return {"consistency_score": 0, "analysis": "No paths to evaluate"}
+    if num_valid < 2:
+        return {"consistency_score": 0, "analysis": "Not enough valid paths for consistency check"}
+    return {
+        "consistency_score": (answer_score + confidence_score) / 2,
+        "analysis": {
+            "total_paths": total,
+            "valid_paths": num_valid,
+            "unique_answers": distinct,
+            "answer_consistency": answer_score,
+            "confidence_consistency": confidence_score,
+            "avg_confidence": average
+        }
+    }
+
+
+def _log_records(path):
+    """Task records of a JSONL stream or of a JSON list"""
+    if path.endswith(".jsonl"):
+        return read_records(path)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score logged reasoning paths with self-consistency")
+    parser.add_argument("logs", nargs="+", help="reasoning path logs (JSONL, or a JSON list of task results)")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS),
+                        help="aggregation methods the best answer is chosen from")
+    parser.add_argument("--answer-field", default="answer",
+                        help="path field holding the answer ('answer' in pipeline logs, 'final_answer' for ReasoningTree paths)")
+    parser.add_argument("--details", action="store_true", help="include answer lists and distributions")
+    parser.add_argument("--output", help="write per-task results to this JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    columns = PathColumns()
+    expected = {}
+    for log in args.logs:
+        for record in _log_records(log):
+            columns.add_task(record["task_id"], record["reasoning_paths"], args.answer_field)
+            expected[record["task_id"]] = record.get("expected_answer")
+    loaded = time.perf_counter()
+
+    results = aggregate_columns(columns, methods=args.methods, details=args.details)
+    elapsed = time.perf_counter() - loaded
+
+    scored = [r for r in results if expected.get(r["task_id"]) is not None]
+    correct = sum(
+        1 for r in scored
+        if str(expected[r["task_id"]]).strip().lower() in str(r["final_answer"]).strip().lower()
+    )
+
+    print(f"📊 Re-scored {len(results)} tasks ({len(columns)} paths) in {elapsed:.3f}s "
+          f"(loading {loaded - start:.3f}s)")
+    print(f"   Methods: {', '.join(args.methods)}")
+    print(f"   Chosen: {dict(Counter(r['method'] for r in results))}")
+    if results:
+        print(f"   Average confidence: {sum(r['confidence'] for r in results) / len(results):.2f}")
+    if scored:
+        print(f"   Accuracy: {correct / len(scored):.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"📁 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
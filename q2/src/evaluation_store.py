@@ -0,0 +1,127 @@
+"""Memoized task results per (prompt, task, sampling config)
+
+A prompt's result on a task only depends on the prompt text, the task and
+the settings it was sampled with, so each pair is generated once. Results
+are optionally appended to a JSONL log and reloaded on the next run, and
+running totals per prompt keep its metrics up to date as results arrive.
+"""
+import threading
+
+from records import ContentStore
+from result_log import ResultLog, read_records
+
+
+class EvaluationStore:
+    """Task results keyed by prompt content, task and sampling config"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._results = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None:
+            for record in read_records(path):
+                self._add((record["prompt"], record["task"], record["config"]), record["result"])
+        self._log = ResultLog(path, resume=True) if path is not None else None
+
+    @staticmethod
+    def task_key(task):
+        """Task id plus a digest of its content, so edited tasks are re-scored"""
+        return f"{task['id']}:{ContentStore.digest([task['problem'], task['expected_answer']])}"
+
+    def lookup(self, prompt, tasks, config=None):
+        """Split `tasks` into stored results (by position) and the tasks still to evaluate"""
+        prompt_digest, config_digest = ContentStore.digest(prompt), ContentStore.digest(config)
+        found, missing = {}, []
+        with self._lock:
+            for i, task in enumerate(tasks):
+                result = self._results.get((prompt_digest, self.task_key(task), config_digest))
+                if result is None:
+                    missing.append(task)
+                else:
+                    found[i] = result
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put(self, prompt, task, config, result):
+        """Store one task result, appending it to the log if there is one"""
+        key = (ContentStore.digest(prompt), self.task_key(task), ContentStore.digest(config))
+        with self._lock:
+            self._add(key, result)
+            if self._log is not None:
+                self._log.append({"prompt": key[0], "task": key[1], "config": key[2], "result": result})
+
+    def evaluate(self, prompt, prompt_path, tasks, evaluate, config=None):
+        """Results of `prompt` on `tasks`, calling `evaluate(prompt_path, tasks)` only for new pairs
+
+        `evaluate` must return one result dict per task with its "task_id".
+        Results come back in the order of `tasks`.
+        """
+        def evaluate_jobs(jobs):
+            return [evaluate(path, missing) for path, missing in jobs]
+
+        return self.evaluate_many([(prompt, prompt_path, tasks)], evaluate_jobs, config)[0]
+
+    def evaluate_many(self, jobs, evaluate_jobs, config=None):
+        """Results of several (prompt, prompt_path, tasks) jobs with one call for every new pair
+
+        `evaluate_jobs` receives the (prompt_path, missing tasks) of each job
+        that has any and returns one result list per job, as `evaluate`
+        does. Results come back per job, in the order of its tasks.
+        """
+        lookups = [self.lookup(prompt, tasks, config) for prompt, _, tasks in jobs]
+        todo = [(job, missing) for job, (_, missing) in zip(jobs, lookups) if missing]
+        if todo:
+            evaluated = evaluate_jobs([(prompt_path, missing) for (_, prompt_path, _), missing in todo])
+            for ((prompt, _, _), missing), results in zip(todo, evaluated):
+                by_id = {task["id"]: task for task in missing}
+                for result in results:
+                    self.put(prompt, by_id[result["task_id"]], config, result)
+
+        answers = []
+        for (prompt, _, tasks), (found, missing) in zip(jobs, lookups):
+            if missing:
+                found, _ = self.lookup(prompt, tasks, config)
+            answers.append([found[i] for i in range(len(tasks)) if i in found])
+        return answers
+
+    def totals(self, prompt, config=None):
+        """Running totals over every stored task of a prompt
+
+        Returns a dict with "total_tasks", "correct", "confidence" and
+        "consistency" sums.
+        """
+        with self._lock:
+            totals = self._totals.get((ContentStore.digest(prompt), ContentStore.digest(config)))
+            if totals is None:
+                return {"total_tasks": 0, "correct": 0, "confidence": 0.0, "consistency": 0.0}
+            return dict(totals)
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+
+    def __len__(self):
+        return len(self._results)
+
+    def _add(self, key, result):
+        """Record a result and update its prompt's running totals"""
+        totals = self._totals.setdefault(
+            (key[0], key[2]), {"total_tasks": 0, "correct": 0, "confidence": 0.0, "consistency": 0.0}
+        )
+        previous = self._results.get(key)
+        if previous is not None:
+            _accumulate(totals, previous, -1)
+        self._results[key] = result
+        _accumulate(totals, result, 1)
+
+
+def _accumulate(totals, result, sign):
+    totals["total_tasks"] += sign
+    totals["correct"] += sign if result.get("is_correct", False) else 0
+    totals["confidence"] += sign * result.get("confidence", 0)
+    totals["consistency"] += sign * result.get("consistency_score", 0)
@@ -2,40 +2,94 @@ print("🧠 Multi-Path Reasoning Pipeline")
 print("This pipeline demonstrates Tree-of-Thought + Self-Consistency + Automated Optimization")
 
 # Simple implementation for demonstration
+import argparse
+import contextlib
 import json
 import os
+import sys
 from datetime import datetime
 
-def main():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.profiling import Profiler, phase
+
+def simulated_results(tasks):
+    """Yield (task, final answer, confidence) without touching the model"""
+    for task in tasks:
+        yield task, "Simulated answer", 0.6
+
+def live_results(tasks, num_paths=3, batch_size=8, backend=None, precision="float32"):
+    """Yield (task, final answer, confidence) from the continuous-batching scheduler"""
+    from reasoning_tree import ReasoningTree
+    from self_consistency import SelfConsistency
+    
+    tree = ReasoningTree(backend=backend, precision=precision)
+    consistency = SelfConsistency()
+    try:
+        for task, paths in tree.generate_paths_for_tasks(tasks, '../prompts/initial_prompt.txt', num_paths, batch_size):
+            aggregate = consistency.aggregate_answers(paths)
+            yield task, aggregate["final_answer"], aggregate["confidence"]
+    finally:
+        tree.close()
+
+def main(live=False, num_paths=3, batch_size=8, backend=None, precision="float32"):
     print("\n🚀 Running Pipeline Demo...")
     
     # Load tasks
     with open('../tasks/problem_definitions.json', 'r') as f:
         tasks = json.load(f)['tasks']
     
+    demo_tasks = tasks[:3]  # Run first 3 tasks for demo
+    if live:
+        task_results = live_results(demo_tasks, num_paths, batch_size, backend, precision)
+    else:
+        task_results = simulated_results(demo_tasks)
+    
     results = []
-    for task in tasks[:3]:  # Run first 3 tasks for demo
+    for task, final_answer, confidence in task_results:
         print(f"\n📝 Task {task['id']}: {task['problem']}")
         print(f"Expected: {task['expected_answer']}")
         
-        # Simulate Tree-of-Thought + Self-Consistency
+        # Tree-of-Thought + Self-Consistency
         result = {
             "task_id": task['id'],
             "problem": task['problem'],
             "expected": task['expected_answer'],
-            "final_answer": "Simulated answer",
-            "accuracy": 0.6,
+            "final_answer": final_answer,
+            "accuracy": confidence,
             "timestamp": datetime.now().isoformat()
         }
         results.append(result)
     
     # Save results
     os.makedirs("../logs", exist_ok=True)
-    with open("../logs/pipeline_demo.json", 'w') as f:
+    with phase("log_io"), open("../logs/pipeline_demo.json", 'w') as f:
         json.dump(results, f, indent=2)
     
     print("\n✅ Pipeline demo completed!")
     print("📁 Results saved to ../logs/pipeline_demo.json")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Multi-path reasoning pipeline demo")
+    parser.add_argument("--live", action="store_true", help="generate reasoning paths with the model instead of simulating them")
+    parser.add_argument("--num-paths", type=int, default=3, help="reasoning paths per task")
+    parser.add_argument("--batch-size", type=int, default=8, help="sequences decoded together by the scheduler")
+    parser.add_argument("--backend", choices=["transformers", "onnxruntime", "stub"], default="transformers", help="generation runtime for --live")
+    parser.add_argument("--precision", choices=["float32", "bfloat16", "int8"], default="float32", help="CPU inference precision for --live")
+    parser.add_argument("--profile", metavar="DIR", help="profile the run with cProfile and write flamegraph stacks and hotspots to DIR")
+    parser.add_argument("--profile-torch", action="store_true", help="also run the torch profiler under --profile")
+    args = parser.parse_args()
+    
+    backend = None
+    if args.backend != "transformers":
+        from common.backends import create_backend
+        backend = create_backend(args.backend)
+    
+    profiler = Profiler(args.profile, torch_profiler=args.profile_torch) if args.profile else contextlib.nullcontext()
+    with profiler:
+        main(live=args.live, num_paths=args.num_paths, batch_size=args.batch_size, backend=backend, precision=args.precision)
+    
+    if args.profile:
+        print(f"\n🔬 Profile ({args.profile}):")
+        print(profiler.phase_table())
+        print(f"   Flamegraph stacks: {os.path.join(args.profile, 'profile.collapsed')}")
+        print(f"   Hotspots: {os.path.join(args.profile, 'hotspots.txt')}")
\ No newline at end of file
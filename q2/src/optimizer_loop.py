@@ -1,19 +1,64 @@
 import json
+import math
 import os
+import random
+import sys
 from datetime import datetime
-from transformers import pipeline
 import warnings
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.backends import TransformersBackend, generate_cached
+from common.metrics import get_metrics
+from common.profiling import phase
+from common.templates import CONTEXT_WINDOW, PromptTemplate, get_template_store
+from records import ContentStore, OptimizationEntry
+from result_log import ResultLog
+
 warnings.filterwarnings("ignore")
 
+MODEL_NAME = "microsoft/DialoGPT-small"
+
+# Tokens sampled for each rewritten prompt
+OPTIMIZER_MAX_NEW_TOKENS = 200
+
 class PromptOptimizer:
-    def __init__(self):
-        print("Loading optimizer model...")
-        self.model = pipeline("text-generation", model="microsoft/DialoGPT-small", pad_token_id=50256)
-        print("Optimizer ready!")
+    def __init__(self, cache=None, seed=None, background_load=True, backend=None, precision="float32",
+                 event_log=None, evaluation_store=None):
+        self.cache = cache
+        self.seed = seed
+        if backend is None:
+            print("Loading optimizer model...")
+            # The model loads in a background thread; first use waits for it
+            backend = TransformersBackend(MODEL_NAME, dtype=precision, background_load=background_load)
+            if not background_load:
+                print("Optimizer ready!")
+        self.backend = backend
         
         self.optimization_history = []
         self.performance_tracking = []
+        # Per-round scores of search_prompts, kept apart from performance_tracking
+        self.search_log = []
+        # Prompts and failed cases of the history, each stored once
+        self.content = ContentStore()
+        # Optional JSONL stream of every optimization and measurement as it happens
+        self.event_log = ResultLog(event_log, resume=True) if event_log else None
+        # Optional EvaluationStore; (prompt, task) pairs it already holds are not re-generated
+        self.evaluation_store = evaluation_store
+
+    def model_ready(self):
+        """True once the model has finished loading"""
+        return self.backend.ready()
+
+    def close(self):
+        """Release the optimizer's reference to the shared model"""
+        self.backend.close()
+        if self.event_log is not None:
+            self.event_log.close()
+    
+    def _log_event(self, event, data):
+        """Append one record to the event log, if streaming is enabled"""
+        if self.event_log is not None:
+            self.event_log.append({"event": event, **data})
         
     def optimize_prompt(self, current_prompt_path, failure_analysis, failed_cases, iteration=1):
         """Optimize a prompt based on failure analysis - OPRO/TextGrad style"""
@@ -22,29 +67,20 @@ class PromptOptimizer:
         with open(current_prompt_path, 'r') as f:
             current_prompt = f.read()
         
-        # Load optimizer prompt template
-        with open('../prompts/optimizer_prompt.txt', 'r') as f:
-            optimizer_template = f.read()
-        
-        # Format the optimizer prompt
-        optimizer_prompt = optimizer_template.format(
-            current_prompt=current_prompt,
-            failure_analysis=self._format_failure_analysis(failure_analysis),
-            failed_cases=self._format_failed_cases(failed_cases)
-        )
+        optimizer_prompt = self._build_optimizer_prompt(current_prompt, failure_analysis, failed_cases)
         
         try:
             # Generate improved prompt
-            response = self.model(
-                optimizer_prompt,
-                max_new_tokens=200,
-                do_sample=True,
-                temperature=0.7,
-                pad_token_id=50256
-            )
-            
-            full_text = response[0]['generated_text']
-            improved_prompt = full_text[len(optimizer_prompt):].strip()
+            with get_metrics().labels(component="optimizer", strategy="rewrite"):
+                improved_prompt = generate_cached(
+                    self.backend,
+                    [optimizer_prompt],
+                    cache=self.cache,
+                    seed=self.seed,
+                    max_new_tokens=OPTIMIZER_MAX_NEW_TOKENS,
+                    do_sample=True,
+                    temperature=0.7
+                )[0].strip()
             
             # Clean up the improved prompt
             improved_prompt = self._clean_generated_prompt(improved_prompt)
@@ -55,17 +91,19 @@ class PromptOptimizer:
                 f.write(improved_prompt)
             
             # Log the optimization
-            optimization_log = {
-                "iteration": iteration,
-                "timestamp": datetime.now().isoformat(),
-                "original_prompt": current_prompt,
-                "improved_prompt": improved_prompt,
-                "failure_analysis": failure_analysis,
-                "failed_cases": failed_cases,
-                "optimization_strategy": self._identify_optimization_strategy(current_prompt, improved_prompt)
-            }
+            optimization_log = OptimizationEntry(
+                self.content,
+                iteration=iteration,
+                timestamp=datetime.now().isoformat(),
+                original_prompt=current_prompt,
+                improved_prompt=improved_prompt,
+                failure_analysis=failure_analysis,
+                failed_cases=failed_cases,
+                optimization_strategy=self._identify_optimization_strategy(current_prompt, improved_prompt)
+            )
             
             self.optimization_history.append(optimization_log)
+            self._log_event("optimization", optimization_log.to_dict())
             
             return optimized_path, improved_prompt
             
@@ -73,6 +111,193 @@ class PromptOptimizer:
             print(f"Optimization failed: {e}")
             return current_prompt_path, current_prompt
     
+    def _build_optimizer_prompt(self, current_prompt, failure_analysis, failed_cases):
+        """Fill the optimizer template, fitted to the context window"""
+        # Parsed once and reloaded only when the file changes
+        optimizer_template = get_template_store().get(
+            '../prompts/optimizer_prompt.txt',
+            required=["current_prompt", "failure_analysis", "failed_cases"]
+        )
+        
+        # Failed cases go first, then the current prompt, if the window overflows
+        optimizer_prompt, truncated = optimizer_template.fit(
+            self.backend,
+            CONTEXT_WINDOW - OPTIMIZER_MAX_NEW_TOKENS,
+            ["failed_cases", "current_prompt"],
+            current_prompt=current_prompt,
+            failure_analysis=self._format_failure_analysis(failure_analysis),
+            failed_cases=self._format_failed_cases(failed_cases)
+        )
+        if truncated:
+            print(f"⚠️  Truncated {', '.join(truncated)} to fit the {CONTEXT_WINDOW}-token context window")
+        return optimizer_prompt
+    
+    def generate_candidates(self, current_prompt, failure_analysis, failed_cases, num_candidates=4):
+        """Sample several rewrites of a prompt in one batch
+        
+        Duplicates and rewrites that are not usable as a reasoning template
+        (a single {problem} placeholder) are dropped.
+        """
+        optimizer_prompt = self._build_optimizer_prompt(current_prompt, failure_analysis, failed_cases)
+        
+        with get_metrics().labels(component="optimizer", strategy="candidates"):
+            completions = generate_cached(
+                self.backend,
+                [optimizer_prompt] * num_candidates,
+                cache=self.cache,
+                seed=self.seed,
+                sample_ids=range(num_candidates),
+                max_new_tokens=OPTIMIZER_MAX_NEW_TOKENS,
+                do_sample=True,
+                temperature=0.7
+            )
+        
+        candidates = []
+        for completion in completions:
+            candidate = self._clean_generated_prompt(completion.strip())
+            if "{problem}" not in candidate:
+                candidate = "Problem: {problem}\n\n" + candidate
+            if candidate != current_prompt and candidate not in candidates and _is_task_template(candidate):
+                candidates.append(candidate)
+        return candidates
+    
+    def search_prompts(self, current_prompt_path, failure_analysis, failed_cases, tasks, evaluate,
+                       num_candidates=4, min_tasks=2, eta=2, iteration=1):
+        """OPRO-style search over several rewrites with successive halving
+        
+        The current prompt competes with up to `num_candidates` rewrites.
+        Each round scores the surviving prompts on a growing prefix of a
+        seeded shuffle of `tasks`, reusing the previous round's results, and
+        keeps the best 1/`eta` of them. Only the survivors are scored on
+        every task. `evaluate(prompt_path, tasks)` returns one result dict
+        per task, as accepted by `track_performance`; when it has a `many`
+        form (see `pipeline_evaluator`) all survivors of a round are scored
+        in one call.
+        
+        Round scores go to `search_log`; only the winner's results on every
+        task are tracked as performance. Returns (prompt_path, prompt) of
+        the winner; a winning rewrite is saved and logged like
+        `optimize_prompt` does.
+        """
+        with open(current_prompt_path, 'r') as f:
+            current_prompt = f.read()
+        
+        prompts = [current_prompt] + self.generate_candidates(
+            current_prompt, failure_analysis, failed_cases, num_candidates
+        )
+        prompt_dir = os.path.dirname(current_prompt_path)
+        prompt_paths = [current_prompt_path]
+        for k, prompt in enumerate(prompts[1:], start=1):
+            prompt_paths.append(self._save_prompt(prompt, os.path.join(prompt_dir, "candidates", f"v{iteration}_c{k}.txt")))
+        
+        order = list(tasks)
+        random.Random(self.seed).shuffle(order)
+        
+        results = {k: [] for k in range(len(prompts))}
+        survivors = list(range(len(prompts)))
+        scored = 0
+        size = min(max(1, min_tasks), len(order))
+        # Only (prompt, task) pairs actually generated count, not evaluation store hits
+        evaluations = [0]
+        
+        def evaluate_jobs(jobs):
+            evaluations[0] += sum(len(job_tasks) for _, job_tasks in jobs)
+            return evaluate_many(evaluate, jobs)
+        
+        while True:
+            final = len(survivors) == 1 or size >= len(order)
+            if final:
+                size = len(order)
+            
+            # Survivors only need the tasks added since the last round
+            batch = order[scored:size]
+            scores = self._evaluate_many([(prompts[k], prompt_paths[k], batch) for k in survivors], evaluate_jobs,
+                                         getattr(evaluate, "config", None))
+            for k, task_results in zip(survivors, scores):
+                results[k].extend(task_results)
+            scored = size
+            
+            metrics = {k: self._calculate_metrics(results[k]) for k in survivors}
+            self.search_log.append({
+                "iteration": iteration,
+                "tasks": size,
+                "scores": {prompt_paths[k]: metrics[k] for k in survivors}
+            })
+            # Stable, so ties keep the earlier candidate and the current prompt first
+            survivors.sort(key=lambda k: (-metrics[k]["accuracy"], -metrics[k]["avg_confidence"]))
+            if final:
+                break
+            
+            survivors = survivors[:max(1, math.ceil(len(survivors) / eta))]
+            size *= eta
+        
+        best = survivors[0]
+        print(f"Scored {len(prompts)} prompts with {evaluations[0]} task evaluations "
+              f"({len(prompts) * len(order)} for exhaustive scoring)")
+        self.track_performance(f"v{iteration}_c{best}", results[best], metrics[best])
+        
+        if best == 0:
+            print("Current prompt kept: no rewrite scored better")
+            return current_prompt_path, current_prompt
+        
+        improved_prompt = prompts[best]
+        optimized_path = self._save_prompt(improved_prompt, os.path.join(prompt_dir, f"optimized_prompt_v{iteration}.txt"))
+        
+        optimization_log = OptimizationEntry(
+            self.content,
+            iteration=iteration,
+            timestamp=datetime.now().isoformat(),
+            original_prompt=current_prompt,
+            improved_prompt=improved_prompt,
+            failure_analysis=failure_analysis,
+            failed_cases=failed_cases,
+            optimization_strategy=self._identify_optimization_strategy(current_prompt, improved_prompt)
+        )
+        
+        self.optimization_history.append(optimization_log)
+        self._log_event("optimization", optimization_log.to_dict())
+        
+        return optimized_path, improved_prompt
+    
+    def evaluate_prompt(self, prompt_version, prompt_path, tasks, evaluate):
+        """Score a prompt file on `tasks` and track its performance
+        
+        With an evaluation store only the tasks it has no result for are
+        generated, and the metrics come from its running totals.
+        """
+        with open(prompt_path, 'r') as f:
+            prompt = f.read()
+        
+        task_results = self._evaluate(prompt, prompt_path, tasks, evaluate)
+        
+        metrics = None
+        if self.evaluation_store is not None:
+            totals = self.evaluation_store.totals(prompt, getattr(evaluate, "config", None))
+            if totals["total_tasks"] == len(task_results):
+                metrics = self._metrics_from_totals(totals)
+        return self.track_performance(prompt_version, task_results, metrics)
+    
+    def _evaluate(self, prompt, prompt_path, tasks, evaluate):
+        """Results of a prompt on `tasks`, served from the evaluation store where possible"""
+        if self.evaluation_store is None:
+            return evaluate(prompt_path, tasks)
+        return self.evaluation_store.evaluate(prompt, prompt_path, tasks, evaluate, getattr(evaluate, "config", None))
+    
+    def _evaluate_many(self, jobs, evaluate_jobs, config=None):
+        """Results of several (prompt, prompt_path, tasks) jobs, new pairs evaluated in one `evaluate_jobs` call"""
+        if self.evaluation_store is None:
+            return evaluate_jobs([(prompt_path, tasks) for _, prompt_path, tasks in jobs])
+        return self.evaluation_store.evaluate_many(jobs, evaluate_jobs, config)
+    
+    def _save_prompt(self, prompt, path):
+        """Write a prompt file, creating its directory"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(prompt)
+        return path
+    
     def _format_failure_analysis(self, failure_analysis):
         """Format failure analysis for the optimizer prompt"""
         if isinstance(failure_analysis, dict):
@@ -160,16 +385,21 @@ Final Answer:"""
         
         return strategies if strategies else ["General refinement"]
     
-    def track_performance(self, prompt_version, task_results):
-        """Track performance of different prompt versions"""
+    def track_performance(self, prompt_version, task_results, metrics=None):
+        """Track performance of different prompt versions
+        
+        `metrics` may be passed when already known, e.g. from an evaluation
+        store's running totals; otherwise they are computed from the results.
+        """
         performance_data = {
             "prompt_version": prompt_version,
             "timestamp": datetime.now().isoformat(),
             "task_results": task_results,
-            "metrics": self._calculate_metrics(task_results)
+            "metrics": metrics if metrics is not None else self._calculate_metrics(task_results)
         }
         
         self.performance_tracking.append(performance_data)
+        self._log_event("performance", performance_data)
         return performance_data
     
     def _calculate_metrics(self, task_results):
@@ -196,6 +426,18 @@ Final Answer:"""
             "total_tasks": len(task_results)
         }
     
+    def _metrics_from_totals(self, totals):
+        """The metrics of `_calculate_metrics` from an evaluation store's running totals"""
+        count = totals["total_tasks"]
+        if not count:
+            return {"accuracy": 0, "avg_confidence": 0, "consistency": 0}
+        return {
+            "accuracy": totals["correct"] / count,
+            "avg_confidence": totals["confidence"] / count,
+            "consistency": totals["consistency"] / count,
+            "total_tasks": count
+        }
+    
     def should_optimize(self, performance_metrics, threshold=0.6):
         """Determine if prompt optimization is needed"""
         accuracy = performance_metrics.get('accuracy', 0)
@@ -233,10 +475,15 @@ Final Answer:"""
         return report
     
     def save_optimization_logs(self, log_path="../logs/optimization_logs.json"):
-        """Save all optimization data to logs"""
+        """Save all optimization data to logs
+        
+        This writes a snapshot at the end of a run; pass `event_log` to the
+        constructor to also stream each event to disk as it happens.
+        """
         log_data = {
-            "optimization_history": self.optimization_history,
+            "optimization_history": [entry.to_dict() for entry in self.optimization_history],
             "performance_tracking": self.performance_tracking,
+            "search_log": self.search_log,
             "summary": {
                 "total_optimizations": len(self.optimization_history),
                 "best_performance": max(self.performance_tracking, key=lambda x: x['metrics']['accuracy']) if self.performance_tracking else None
@@ -244,7 +491,68 @@ Final Answer:"""
         }
         
         os.makedirs(os.path.dirname(log_path), exist_ok=True)
-        with open(log_path, 'w') as f:
+        with phase("log_io"), open(log_path, 'w') as f:
             json.dump(log_data, f, indent=2)
         
-        print(f"Optimization logs saved to {log_path}") 
\ No newline at end of file
+        print(f"Optimization logs saved to {log_path}")
+
+
+def _is_task_template(text):
+    """True if `text` parses as a template whose only placeholder is {problem}"""
+    try:
+        return PromptTemplate(text).fields == ("problem",)
+    except ValueError:
+        return False
+
+
+def evaluate_many(evaluate, jobs):
+    """Results of `evaluate` on several (prompt_path, tasks) jobs, in one call when it has a `many` form"""
+    many = getattr(evaluate, "many", None)
+    if many is not None:
+        return many(jobs)
+    return [evaluate(prompt_path, tasks) for prompt_path, tasks in jobs]
+
+
+def pipeline_evaluator(tree, num_paths=3, max_batch_size=8):
+    """Build an `evaluate(prompt_path, tasks)` for search_prompts from a ReasoningTree
+    
+    Each task is answered by self-consistency over `num_paths` paths, all
+    generated through the tree's shared batch. `evaluate.many(jobs)` scores
+    several (prompt_path, tasks) jobs through that one batch, so candidate
+    prompts do not take turns on the model.
+    """
+    from reasoning_tree import PATH_SAMPLING
+    from self_consistency import SelfConsistency, matches_expected
+    
+    consistency = SelfConsistency()
+    
+    def many(jobs):
+        pairs = [(prompt_path, task) for prompt_path, tasks in jobs for task in tasks]
+        owners = [job for job, (_, tasks) in enumerate(jobs) for _ in tasks]
+        results = [[] for _ in jobs]
+        for index, paths in tree.generate_paths_for_prompts(pairs, num_paths, max_batch_size):
+            task = pairs[index][1]
+            aggregate = consistency.aggregate_answers(paths)
+            results[owners[index]].append({
+                "task_id": task["id"],
+                "final_answer": aggregate["final_answer"],
+                "is_correct": matches_expected(aggregate["final_answer"], task["expected_answer"]),
+                "confidence": aggregate["confidence"],
+                "consistency_score": consistency.evaluate_consistency(paths)["consistency_score"]
+            })
+        return results
+    
+    def evaluate(prompt_path, tasks):
+        return many([(prompt_path, tasks)])[0]
+    
+    evaluate.many = many
+    
+    # Everything that changes the sampled paths; part of the evaluation store key
+    evaluate.config = {
+        "model": tree.backend.model_id,
+        "seed": tree.seed,
+        "num_paths": num_paths,
+        **{name: value for name, value in PATH_SAMPLING.items() if name != "stop"},
+        "stop": PATH_SAMPLING["stop"].as_key()
+    }
+    return evaluate
@@ -1,115 +1,323 @@
+import functools
 import json
+import os
 import random
-from transformers import pipeline
+import sys
+import time
 import warnings
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.backends import TransformersBackend, cacheable, create_backend, generate_cached, response_key
+from common.metrics import CallRecord, get_metrics
+from common.model_registry import get_registry
+from common.stopping import StopCondition
+from common.templates import CONTEXT_WINDOW, get_template_store
+from answer_scanner import ANSWER_KEYWORDS, SCANNER
+from records import ReasoningPath
 
 warnings.filterwarnings("ignore")
 
+MODEL_NAME = "microsoft/DialoGPT-small"
+
+# Decoding can stop once a line holding the final answer is complete
+ANSWER_STOP = StopCondition(answer_markers=ANSWER_KEYWORDS)
+
+# Tokens sampled per reasoning path
+MAX_NEW_TOKENS = 100
+
+# How every reasoning path is sampled
+PATH_SAMPLING = {"max_new_tokens": MAX_NEW_TOKENS, "do_sample": True, "temperature": 0.8, "top_p": 0.9,
+                 "stop": ANSWER_STOP}
+
+# The varied opening line may run a few tokens longer than the template's
+VARIATION_MARGIN = 8
+
+# Prompt tokens left once room for the completion is reserved
+PROMPT_BUDGET = CONTEXT_WINDOW - MAX_NEW_TOKENS - VARIATION_MARGIN
+
+# Opening lines used to vary the approach of each path
+VARIATIONS = [
+    "Think through this step by step:",
+    "Let me solve this carefully:",
+    "Breaking this down systematically:",
+    "Analyzing this problem:"
+]
+
 class ReasoningTree:
-    def __init__(self):
-        print("Loading model for Tree-of-Thought reasoning...")
-        self.model = pipeline("text-generation", model="microsoft/DialoGPT-small", pad_token_id=50256)
-        print("Model loaded successfully!")
-        
-    def generate_reasoning_paths(self, problem, prompt_template, num_paths=3):
-        """Generate multiple reasoning paths for a single problem"""
-        paths = []
-        
-        # Load prompt template
-        with open(prompt_template, 'r') as f:
-            template = f.read()
-        
-        for path_id in range(num_paths):
-            # Vary the approach slightly for each path
-            variations = [
-                "Think through this step by step:",
-                "Let me solve this carefully:",
-                "Breaking this down systematically:",
-                "Analyzing this problem:"
-            ]
-            
-            # Create varied prompt
-            prompt = template.format(problem=problem)
-            prompt = prompt.replace("Think through this carefully:", variations[path_id % len(variations)])
-            
-            try:
-                # Generate response with different seeds for diversity
-                response = self.model(
-                    prompt, 
-                    max_new_tokens=100, 
-                    do_sample=True, 
-                    temperature=0.8,
-                    top_p=0.9,
-                    pad_token_id=50256
+    def __init__(self, cache=None, seed=None, background_load=True, backend=None, precision="float32"):
+        self.cache = cache
+        self.seed = seed
+        if backend is None:
+            print("Loading model for Tree-of-Thought reasoning...")
+            # The model loads in a background thread; first use waits for it
+            backend = TransformersBackend(MODEL_NAME, dtype=precision, background_load=background_load)
+            if not background_load:
+                print("Model loaded successfully!")
+        self.backend = backend
+        # Per-worker throughput of the last generate_paths_sharded run
+        self.worker_stats = []
+
+    def model_ready(self):
+        """True once the model has finished loading"""
+        return self.backend.ready()
+
+    def close(self):
+        """Release this tree's reference to the shared model"""
+        self.backend.close()
+        
+    def generate_reasoning_paths(self, problem, prompt_template, num_paths=3, first_path_id=0):
+        """Generate multiple reasoning paths for a single problem
+        
+        `first_path_id` lets callers draw paths incrementally while path ids
+        and prompt variations keep rotating across calls.
+        """
+        # Parsed once per file and reloaded only when it changes
+        template = get_template_store().get(prompt_template, required=["problem"])
+        
+        path_variations, prompts, prefix = self._build_path_prompts(problem, template, num_paths, first_path_id)
+        seed = _round_seed(self.seed, first_path_id)
+        
+        try:
+            # All paths are sampled together in one padded batch
+            with get_metrics().labels(component="reasoning_tree", strategy="multi_path"):
+                completions = generate_cached(
+                    self.backend,
+                    prompts,
+                    cache=self.cache,
+                    seed=seed,
+                    sample_ids=range(first_path_id, first_path_id + num_paths),
+                    prefix=prefix,
+                    **PATH_SAMPLING
                 )
+        except Exception as e:
+            return self._error_paths(path_variations, e, first_path_id)
+        
+        return [
+            self._build_path(path_id, variation, completion)
+            for path_id, (variation, completion) in enumerate(zip(path_variations, completions), start=first_path_id)
+        ]
+    
+    def generate_paths_for_tasks(self, tasks, prompt_template, num_paths=3, max_batch_size=8):
+        """Generate reasoning paths for many tasks through one shared generation batch
+        
+        Yields (task, paths) as soon as every path of a task has finished, so
+        tasks may complete out of order. With metrics enabled each task is
+        recorded as one call labeled with its category; its queue wait is the
+        time until its first path entered the batch.
+        """
+        tasks = list(tasks)
+        pairs = [(prompt_template, task) for task in tasks]
+        for index, paths in self.generate_paths_for_prompts(pairs, num_paths, max_batch_size):
+            yield tasks[index], paths
+    
+    def generate_paths_for_prompts(self, pairs, num_paths=3, max_batch_size=8):
+        """generate_paths_for_tasks over (prompt_template, task) pairs that may use different templates
+        
+        Every pair shares the one generation batch, so several prompts can be
+        scored on their tasks together. Yields (position in `pairs`, paths).
+        """
+        metrics = get_metrics()
+        with metrics.batch(component="reasoning_tree", strategy="continuous_batch") as batch:
+            yield from self._generate_paths_for_prompts(list(pairs), num_paths, max_batch_size, metrics, batch)
+    
+    def _generate_paths_for_prompts(self, pairs, num_paths, max_batch_size, metrics, batch):
+        # Every template is checked before anything is generated
+        store = get_template_store()
+        templates = {path: store.get(path, required=["problem"]) for path, _ in pairs}
+        
+        sampling = PATH_SAMPLING
+        cache = self.cache if cacheable(sampling, self.seed) else None
+        # Keyed by position in `pairs`, since task ids need not be unique
+        pending = {}
+        # (index, paths) ready without the batch: fully cached, or failed before generation
+        ready = []
+        costs = {}
+        submitted = [0]
+        started = time.perf_counter()
+        
+        def requests():
+            for index, (prompt_template, task) in enumerate(pairs):
+                submitted[0] = index + 1
+                try:
+                    path_variations, prompts, _ = self._build_path_prompts(task["problem"], templates[prompt_template], num_paths)
+                except Exception as e:
+                    # Like a failed generation, a task that cannot be prompted gets error paths
+                    ready.append((index, self._error_paths(self._path_variations(num_paths), e)))
+                    continue
+                completions = [None] * len(prompts)
+                keys = [None] * len(prompts)
                 
-                full_text = response[0]['generated_text']
-                reasoning = full_text[len(prompt):].strip()
+                if cache is not None:
+                    for path_id, prompt in enumerate(prompts):
+                        keys[path_id] = response_key(cache, self.backend, prompt, sampling, self.seed, path_id)
+                        completions[path_id] = cache.get(keys[path_id])
                 
-                # Extract final answer
-                final_answer = self._extract_final_answer(reasoning)
+                if batch is not None:
+                    cost = CallRecord({**batch.labels, "category": task.get("category", "")})
+                    cost.cache_misses = sum(1 for c in completions if c is None)
+                    cost.cache_hits = len(completions) - cost.cache_misses
+                    cost.prompt_tokens = sum(
+                        self.backend.count_tokens(prompt) for prompt, c in zip(prompts, completions) if c is None
+                    )
+                    cost.queue_wait = time.perf_counter() - started
+                    costs[index] = cost
                 
-                path_data = {
-                    "path_id": path_id + 1,
-                    "prompt_variation": variations[path_id % len(variations)],
-                    "full_reasoning": reasoning,
-                    "final_answer": final_answer,
-                    "confidence": self._estimate_confidence(reasoning)
-                }
+                if all(c is not None for c in completions):
+                    ready.append((index, self._build_paths(path_variations, completions)))
+                    continue
                 
-                paths.append(path_data)
+                pending[index] = (path_variations, completions, keys)
+                for path_id, prompt in enumerate(prompts):
+                    if completions[path_id] is None:
+                        yield (index, path_id), prompt
+        
+        def finish(index, paths):
+            """Record a finished task's cost and return its result; prefill was measured per path by the batch"""
+            cost = costs.pop(index, None)
+            if cost is not None:
+                cost.prefill = sum(batch.tag_prefill.pop((index, path_id), 0.0) for path_id in range(num_paths))
+                if cost.cache_misses:
+                    in_batch = time.perf_counter() - started - cost.queue_wait
+                    cost.decode = max(0.0, in_batch - cost.prefill)
+                else:
+                    cost.queue_wait = 0.0
+                metrics.add(cost)
+            return index, paths
+        
+        def drain_ready():
+            while ready:
+                yield finish(*ready.pop(0))
+        
+        try:
+            # Backends that support it keep the batch full as sequences finish
+            for (index, path_id), completion in self.backend.generate_many(requests(), max_batch_size, seed=self.seed, **sampling):
+                path_variations, completions, keys = pending[index]
+                completions[path_id] = completion
+                if cache is not None:
+                    cache.put(keys[path_id], completion)
+                if batch is not None:
+                    costs[index].generated_tokens += self.backend.count_tokens(completion)
+                
+                if all(c is not None for c in completions):
+                    del pending[index]
+                    yield finish(index, self._build_paths(path_variations, completions))
                 
-            except Exception as e:
-                paths.append({
-                    "path_id": path_id + 1,
-                    "prompt_variation": variations[path_id % len(variations)],
-                    "full_reasoning": f"Error: {str(e)}",
-                    "final_answer": "Error",
-                    "confidence": 0.0
-                })
-        
-        return paths
+                yield from drain_ready()
+        except Exception as e:
+            # The batch is gone: every task it held or had yet to admit gets error paths
+            yield from drain_ready()
+            for index, (path_variations, _, _) in sorted(pending.items()):
+                if index in costs:
+                    costs[index].errors += 1
+                yield finish(index, self._error_paths(path_variations, e))
+            for index in range(submitted[0], len(pairs)):
+                yield finish(index, self._error_paths(self._path_variations(num_paths), e))
+            return
+        
+        yield from drain_ready()
     
-    def _extract_final_answer(self, reasoning):
-        """Extract the final answer from reasoning text"""
-        # Look for common answer patterns
-        lines = reasoning.split('\n')
-        for line in lines:
-            line = line.strip().lower()
-            if any(keyword in line for keyword in ['answer:', 'final answer:', 'result:', 'solution:']):
-                # Extract the part after the keyword
-                for keyword in ['answer:', 'final answer:', 'result:', 'solution:']:
-                    if keyword in line:
-                        answer = line.split(keyword)[1].strip()
-                        return answer if answer else "No clear answer"
-        
-        # If no explicit answer found, try to get the last meaningful sentence
-        meaningful_lines = [line for line in lines if line.strip() and not line.strip().startswith(('Step', 'First', 'Next'))]
-        if meaningful_lines:
-            return meaningful_lines[-1].strip()
-        
-        return "No clear answer found"
+    def search_reasoning_paths(self, problem, prompt_template, beam_width=2, branching=2, max_depth=4,
+                               step_tokens=25, token_budget=200, scorer=None):
+        """Tree-of-Thought beam search over reasoning steps instead of independent full paths
+        
+        Returns (paths, tree): one path per finished branch, best first, and
+        the ThoughtTree of expanded and pruned nodes for evaluate_tree_quality.
+        """
+        from tree_search import BeamSearch
+        
+        # Every step of a branch has to fit in the completion room of the prompt
+        if max_depth * step_tokens > MAX_NEW_TOKENS:
+            raise ValueError(f"max_depth * step_tokens must not exceed {MAX_NEW_TOKENS} tokens")
+        
+        search = BeamSearch(self, beam_width, branching, max_depth, step_tokens, token_budget, scorer)
+        return search.run(problem, prompt_template)
     
-    def _estimate_confidence(self, reasoning):
-        """Estimate confidence based on reasoning quality"""
-        if not reasoning or "error" in reasoning.lower():
-            return 0.0
+    def generate_paths_sharded(self, tasks, prompt_template, num_paths=3, max_batch_size=8, workers=2,
+                               threads_per_worker=None):
+        """generate_paths_for_tasks with the tasks sharded across spawned worker processes
+        
+        Every worker rebuilds this tree's backend on this process's weights,
+        moved to shared memory, so workers add no model copies (int8 and
+        ONNX Runtime models are still loaded per worker). Yields (task,
+        paths) as workers finish them; per-worker throughput is in
+        `self.worker_stats` afterwards.
+        """
+        from common.sharding import ShardedRunner
         
-        confidence_indicators = [
-            "step by step", "therefore", "because", "so", "thus",
-            "final answer", "result", "solution"
+        # Fail here rather than in every worker when the template is unusable
+        get_template_store().get(prompt_template, required=["problem"])
+        
+        work = functools.partial(
+            _generate_shard, self.backend.spec(), self.backend.shared_model(), self.cache, self.seed,
+            prompt_template, num_paths, max_batch_size
+        )
+        runner = ShardedRunner(workers, threads_per_worker)
+        self.worker_stats = []
+        try:
+            yield from runner.run(tasks, work)
+        finally:
+            self.worker_stats = runner.worker_stats
+    
+    def _build_path_prompts(self, problem, template, num_paths, first_path_id=0):
+        """Create one varied prompt per path plus the prefix they all share"""
+        # Long problems are cut down so prompt and completion fit the context window
+        base_prompt, truncated = template.fit(self.backend, PROMPT_BUDGET, ["problem"], problem=problem)
+        if truncated:
+            print(f"⚠️  Problem truncated to fit the {CONTEXT_WINDOW}-token context window")
+        path_variations = self._path_variations(num_paths, first_path_id)
+        prompts = [base_prompt.replace("Think through this carefully:", variation) for variation in path_variations]
+        
+        # Everything before the varied line is shared by all paths
+        variation_start = base_prompt.find("Think through this carefully:")
+        prefix = base_prompt[:variation_start] if variation_start > 0 else base_prompt
+        
+        return path_variations, prompts, prefix
+    
+    def _path_variations(self, num_paths, first_path_id=0):
+        """The prompt variation of each path, rotating with the path id"""
+        return [
+            VARIATIONS[path_id % len(VARIATIONS)]
+            for path_id in range(first_path_id, first_path_id + num_paths)
+        ]
+    
+    def _error_paths(self, path_variations, error, first_path_id=0):
+        """Error records standing in for paths that could not be generated"""
+        return [
+            ReasoningPath(path_id + 1, variation, f"Error: {str(error)}", "Error", 0.0)
+            for path_id, variation in enumerate(path_variations, start=first_path_id)
+        ]
+    
+    def _build_paths(self, path_variations, completions):
+        """Build the path records of one task from its completions"""
+        return [
+            self._build_path(path_id, variation, completion)
+            for path_id, (variation, completion) in enumerate(zip(path_variations, completions))
         ]
+    
+    def _build_path(self, path_id, variation, completion):
+        """Turn a raw completion into a reasoning path record"""
+        reasoning = completion.strip()
         
-        score = 0
-        for indicator in confidence_indicators:
-            if indicator in reasoning.lower():
-                score += 1
+        # Answer and confidence come from one scan of the text
+        scan = SCANNER.scan(reasoning)
         
-        # Normalize to 0-1 range
-        return min(score / len(confidence_indicators), 1.0)
+        return ReasoningPath(path_id + 1, variation, reasoning, scan.final_answer, scan.confidence)
+    
+    def _extract_final_answer(self, reasoning):
+        """Extract the final answer from reasoning text"""
+        return SCANNER.extract_final_answer(reasoning)
     
-    def evaluate_tree_quality(self, paths):
-        """Evaluate the overall quality of the reasoning tree"""
+    def _estimate_confidence(self, reasoning):
+        """Estimate confidence based on reasoning quality"""
+        return SCANNER.confidence(reasoning)
+    
+    def evaluate_tree_quality(self, paths, tree=None):
+        """Evaluate the overall quality of the reasoning tree
+        
+        Pass the ThoughtTree of a beam search to include its node, pruning
+        and token statistics.
+        """
         if not paths:
             return {"diversity": 0, "avg_confidence": 0, "error_rate": 1}
         
@@ -126,9 +334,40 @@ class ReasoningTree:
         errors = sum(1 for path in paths if path["final_answer"] == "Error")
         error_rate = errors / len(paths)
         
-        return {
+        quality = {
             "diversity": diversity,
             "avg_confidence": avg_confidence,
             "error_rate": error_rate,
             "total_paths": len(paths)
-        } 
\ No newline at end of file
+        }
+        
+        if tree is not None:
+            stats = tree.stats()
+            quality["search"] = stats
+            quality["pruned_ratio"] = stats["pruned"] / stats["nodes"] if stats["nodes"] else 0
+        
+        return quality 
+
+
+def _round_seed(seed, first_path_id):
+    """Seed for paths drawn from `first_path_id` on
+    
+    Each generate call re-seeds and the prompt variations repeat every few
+    paths, so a later round reusing `seed` would replay earlier samples.
+    The first round keeps `seed` itself.
+    """
+    if seed is None or first_path_id == 0:
+        return seed
+    return zlib.crc32(f"{seed}|{first_path_id}".encode())
+
+
+def _generate_shard(backend_spec, shared_model, cache, seed, prompt_template, num_paths, max_batch_size, shard):
+    """Body of generate_paths_sharded in a worker process: a fresh tree over the parent's shared weights"""
+    if shared_model is not None:
+        get_registry().adopt(shared_model)
+    name, options = backend_spec
+    tree = ReasoningTree(cache=cache, seed=seed, backend=create_backend(name, **options))
+    try:
+        yield from tree.generate_paths_for_tasks(shard, prompt_template, num_paths, max_batch_size)
+    finally:
+        tree.close()
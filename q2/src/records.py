@@ -0,0 +1,173 @@
+"""Compact record types for reasoning paths, task results and optimization entries
+
+Records use __slots__ and can be read like the dicts they replace
+(`path["final_answer"]`, `result.get("confidence")`). Dicts are only built
+by `to_dict` when a record is serialized.
+"""
+import hashlib
+import json
+import sys
+
+
+class Record:
+    """Slotted record that reads like a dict of its FIELDS"""
+    __slots__ = ()
+    FIELDS = ()
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self.FIELDS else default
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def keys(self):
+        return self.FIELDS
+
+    def to_dict(self, names=None):
+        """Serialize to a dict, optionally renaming fields via `names`
+
+        With `names`, only the fields it maps are included.
+        """
+        if names is None:
+            return {field: getattr(self, field) for field in self.FIELDS}
+        return {key: getattr(self, field) for field, key in names.items()}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.FIELDS)
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS)
+        return f"{type(self).__name__}({values})"
+
+
+def _intern(value):
+    """Intern short repeated strings; other values pass through"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ReasoningPath(Record):
+    """One sampled reasoning path
+
+    The prompt variation is one of a few constant openings and the answer
+    often repeats across paths, so both are interned.
+    """
+    __slots__ = FIELDS = ("path_id", "prompt_variation", "full_reasoning", "final_answer", "confidence")
+
+    def __init__(self, path_id, prompt_variation, full_reasoning, final_answer, confidence):
+        self.path_id = path_id
+        self.prompt_variation = _intern(prompt_variation)
+        self.full_reasoning = full_reasoning
+        self.final_answer = _intern(final_answer)
+        self.confidence = confidence
+
+
+# Field names used for paths in the pipeline's result logs
+LOG_PATH_NAMES = {"path_id": "path_id", "prompt_variation": "approach", "final_answer": "answer", "confidence": "confidence"}
+
+
+class TaskResult(Record):
+    """Aggregated outcome of one task in the pipeline run"""
+    __slots__ = FIELDS = (
+        "task_id", "problem", "expected_answer", "reasoning_paths", "final_answer",
+        "confidence", "agreement", "is_correct", "timestamp"
+    )
+
+    def __init__(self, task_id, problem, expected_answer, reasoning_paths, final_answer,
+                 confidence, agreement, is_correct, timestamp):
+        self.task_id = task_id
+        self.problem = problem
+        self.expected_answer = expected_answer
+        self.reasoning_paths = tuple(reasoning_paths)
+        self.final_answer = _intern(final_answer)
+        self.confidence = confidence
+        self.agreement = agreement
+        self.is_correct = is_correct
+        self.timestamp = timestamp
+
+    def to_dict(self, names=None):
+        """Serialize to the pipeline log format, paths included"""
+        data = super().to_dict(names)
+        if "reasoning_paths" in data:
+            data["reasoning_paths"] = [
+                path.to_dict(LOG_PATH_NAMES) if isinstance(path, ReasoningPath) else path
+                for path in self.reasoning_paths
+            ]
+        return data
+
+
+class ContentStore:
+    """Content-addressed store: identical values are kept once under their digest"""
+
+    def __init__(self):
+        self._values = {}
+
+    @staticmethod
+    def digest(value):
+        """Digest of a JSON-serializable value"""
+        encoded = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()[:16]
+
+    def put(self, value):
+        """Store a value and return its digest"""
+        digest = self.digest(value)
+        self._values.setdefault(digest, value)
+        return digest
+
+    def get(self, digest):
+        return self._values[digest]
+
+    def __len__(self):
+        return len(self._values)
+
+
+class OptimizationEntry(Record):
+    """One prompt optimization step
+
+    Prompts and failed cases are kept as digests into a shared ContentStore,
+    so prompts carried over between iterations and cases that keep failing
+    are stored once.
+    """
+    __slots__ = (
+        "iteration", "timestamp", "original_digest", "improved_digest",
+        "failure_analysis", "case_digests", "optimization_strategy", "store"
+    )
+    FIELDS = (
+        "iteration", "timestamp", "original_prompt", "improved_prompt",
+        "failure_analysis", "failed_cases", "optimization_strategy"
+    )
+
+    def __init__(self, store, iteration, timestamp, original_prompt, improved_prompt,
+                 failure_analysis, failed_cases, optimization_strategy):
+        self.store = store
+        self.iteration = iteration
+        self.timestamp = timestamp
+        self.original_digest = store.put(original_prompt)
+        self.improved_digest = store.put(improved_prompt)
+        self.failure_analysis = failure_analysis
+        self.case_digests = tuple(store.put(case) for case in failed_cases or ())
+        self.optimization_strategy = tuple(_intern(strategy) for strategy in optimization_strategy)
+
+    @property
+    def original_prompt(self):
+        return self.store.get(self.original_digest)
+
+    @property
+    def improved_prompt(self):
+        return self.store.get(self.improved_digest)
+
+    @property
+    def failed_cases(self):
+        return [self.store.get(digest) for digest in self.case_digests]
+
+    def to_dict(self, names=None):
+        data = super().to_dict(names)
+        if "optimization_strategy" in data:
+            data["optimization_strategy"] = list(data["optimization_strategy"])
+        return data
@@ -0,0 +1,132 @@
+"""Append-only JSONL logs of task results
+
+Each completed task is written as one JSON line and flushed at once, with
+an fsync every few records, so a crash loses at most the last unsynced
+lines. `--resume` style reruns skip the task ids already in the log, and
+`summarize` rebuilds the pipeline metrics by streaming over it.
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.profiling import profiled
+
+
+class ResultLog:
+    """Appends JSON records to a file, one per line"""
+
+    def __init__(self, path, resume=False, fsync_every=10, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.written = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if resume:
+            _drop_partial_line(path)
+
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @profiled("log_io")
+    def append(self, record):
+        """Write one record; accepts dicts or records with to_dict"""
+        if hasattr(record, "to_dict"):
+            record = record.to_dict()
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.written += 1
+        self._unsynced += 1
+
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    @profiled("log_io")
+    def sync(self):
+        """Force written records to disk"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _drop_partial_line(path):
+    """Cut a final line left unfinished by a crash so appends start on a fresh line"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+
+        # Walk back to the last complete line
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+
+def read_records(path):
+    """Yield the records of a JSONL log, skipping an unfinished final line"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            if line.strip():
+                yield json.loads(line)
+
+
+def completed_ids(path, key="task_id"):
+    """Ids of the tasks already recorded in a log"""
+    return {record[key] for record in read_records(path) if key in record}
+
+
+def summarize(records):
+    """Pipeline performance metrics from a stream of task result records
+
+    Keeps running totals only, so memory stays constant however long the
+    log is.
+    """
+    total_tasks = correct_count = 0
+    confidence = agreement = 0.0
+    for record in records:
+        total_tasks += 1
+        correct_count += 1 if record.get("is_correct", False) else 0
+        confidence += record.get("confidence", 0)
+        agreement += record.get("agreement", 0)
+
+    return {
+        "accuracy": correct_count / total_tasks if total_tasks else 0,
+        "avg_confidence": confidence / total_tasks if total_tasks else 0,
+        "avg_agreement": agreement / total_tasks if total_tasks else 0,
+        "total_tasks": total_tasks,
+        "correct_answers": correct_count
+    }
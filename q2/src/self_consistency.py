@@ -1,11 +1,18 @@
 import json
+import math
+import os
+import sys
 from collections import Counter
-import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.profiling import profiled
+from answer_scanner import SCANNER
 
 class SelfConsistency:
     def __init__(self):
         pass
     
+    @profiled("aggregation")
     def aggregate_answers(self, reasoning_paths):
         """Aggregate multiple reasoning paths using self-consistency"""
         if not reasoning_paths:
@@ -36,6 +43,78 @@ class SelfConsistency:
         
         return best_result
     
+    @profiled("aggregation")
+    def aggregate_bulk(self, task_paths, methods=None, details=False):
+        """Aggregate many tasks at once from (task_id, paths) pairs
+        
+        Vectorized with NumPy; results match aggregate_answers plus
+        evaluate_consistency under a "consistency" key.
+        """
+        from bulk_aggregation import METHODS, PathColumns, aggregate_columns
+        
+        columns = PathColumns.from_tasks(task_paths)
+        return aggregate_columns(columns, methods=methods or METHODS, details=details)
+    
+    def aggregate_adaptive(self, reasoning_tree, problem, prompt_template, max_paths=10,
+                           paths_per_round=1, min_paths=2, margin=0.9, stopping_rule="beta"):
+        """Draw reasoning paths incrementally and stop once the leading answer is settled
+        
+        stopping_rule "beta" stops when the posterior probability that the
+        leading normalized answer holds the majority reaches `margin`;
+        "lead" stops only when the remaining budget can no longer overturn
+        the leader. Both stop at `max_paths`.
+        """
+        paths = []
+        
+        while len(paths) < max_paths:
+            draw = max(paths_per_round, min_paths - len(paths))
+            draw = min(draw, max_paths - len(paths))
+            paths.extend(reasoning_tree.generate_reasoning_paths(
+                problem, prompt_template, num_paths=draw, first_path_id=len(paths)
+            ))
+            
+            if len(paths) >= min_paths and self._should_stop(paths, max_paths, margin, stopping_rule):
+                break
+        
+        result = self.aggregate_answers(paths)
+        result["paths_used"] = len(paths)
+        result["max_paths"] = max_paths
+        result["stopped_early"] = len(paths) < max_paths
+        result["stopping_rule"] = stopping_rule
+        return result
+    
+    def _should_stop(self, paths, max_paths, margin, stopping_rule):
+        """Decide whether more paths could still change the leading answer"""
+        counts = Counter(
+            self._normalize_answer(path["final_answer"])
+            for path in paths if path["final_answer"] != "Error"
+        )
+        if not counts:
+            return False
+        
+        ranked = counts.most_common(2)
+        leader = ranked[0][1]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        remaining = max_paths - len(paths)
+        
+        # No remaining draw can overturn the leader
+        if leader - runner_up > remaining:
+            return True
+        
+        if stopping_rule == "lead":
+            return False
+        
+        others = sum(counts.values()) - leader
+        return self._majority_posterior(leader, others) >= margin
+    
+    def _majority_posterior(self, leader, others):
+        """P(p > 0.5) for p ~ Beta(1 + leader, 1 + others)
+        
+        For integer parameters this equals P(Binomial(leader + others + 1, 0.5) <= leader).
+        """
+        n = leader + others + 1
+        return sum(math.comb(n, k) for k in range(leader + 1)) / 2 ** n
+    
     def _majority_vote(self, paths):
         """Simple majority voting"""
         answers = [path["final_answer"] for path in paths]
@@ -115,28 +194,9 @@ class SelfConsistency:
     
     def _normalize_answer(self, answer):
         """Normalize answer for similarity comparison"""
-        if not answer:
-            return ""
-        
-        # Convert to lowercase and remove extra whitespace
-        normalized = answer.lower().strip()
-        
-        # Extract numbers if present
-        numbers = re.findall(r'\d+\.?\d*', normalized)
-        if numbers:
-            return f"number_{numbers[0]}"
-        
-        # Handle common answer patterns
-        if any(word in normalized for word in ['yes', 'true', 'correct']):
-            return "affirmative"
-        elif any(word in normalized for word in ['no', 'false', 'incorrect']):
-            return "negative"
-        
-        # Return first meaningful word
-        words = normalized.split()
-        meaningful_words = [w for w in words if len(w) > 2 and not w.isdigit()]
-        return meaningful_words[0] if meaningful_words else normalized
+        return SCANNER.normalize(answer)
     
+    @profiled("aggregation")
     def evaluate_consistency(self, reasoning_paths):
         """Evaluate how consistent the reasoning paths are"""
         if not reasoning_paths:
@@ -172,4 +232,9 @@ class SelfConsistency:
         return {
             "consistency_score": overall_consistency,
             "analysis": analysis
-        } 
\ No newline at end of file
+        }
+
+
+def matches_expected(answer, expected):
+    """Loose correctness check of a generated answer against the expected one"""
+    return expected.strip().lower() in str(answer).strip().lower()
@@ -0,0 +1,200 @@
+"""Budgeted beam search over partial reasoning steps
+
+Each node of the tree is one line of reasoning. Every round the best
+frontier nodes are extended with a few sampled next steps, the new nodes
+are scored, and only the top `beam_width` stay on the frontier; the rest
+are pruned. Steps holding an answer marker, or reaching `max_depth`, end a
+branch as a leaf. Generation stops once the token budget is spent.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.backends import generate_cached
+from common.metrics import get_metrics
+from common.stopping import StopCondition
+from common.templates import get_template_store
+from answer_scanner import ANSWER_KEYWORDS, SCANNER
+from records import ReasoningPath, Record
+
+# One reasoning step is one line; a line with an answer marker ends the branch
+STEP_STOP = StopCondition(stop_on_newline=True, answer_markers=ANSWER_KEYWORDS)
+
+
+class ThoughtNode(Record):
+    """One reasoning step in the search tree
+
+    status is "frontier" while waiting to be expanded, then "expanded",
+    "pruned" or "leaf".
+    """
+    __slots__ = FIELDS = ("node_id", "parent_id", "depth", "step", "score", "tokens", "status")
+
+    def __init__(self, node_id, parent_id, depth, step, score, tokens, status="frontier"):
+        self.node_id = node_id
+        self.parent_id = parent_id
+        self.depth = depth
+        self.step = step
+        self.score = score
+        self.tokens = tokens
+        self.status = status
+
+
+class ThoughtTree:
+    """Every node the search created, including pruned ones"""
+
+    def __init__(self, token_budget):
+        self.token_budget = token_budget
+        self.tokens_used = 0
+        self.nodes = [ThoughtNode(0, None, 0, "", 0.0, 0)]
+
+    @property
+    def root(self):
+        return self.nodes[0]
+
+    def add(self, parent, step, tokens):
+        """Create a child of `parent` and charge its tokens to the budget"""
+        node = ThoughtNode(len(self.nodes), parent.node_id, parent.depth + 1, step, 0.0, tokens)
+        self.nodes.append(node)
+        self.tokens_used += tokens
+        return node
+
+    def steps(self, node):
+        """The steps from the root down to `node`"""
+        steps = []
+        while node.parent_id is not None:
+            steps.append(node.step)
+            node = self.nodes[node.parent_id]
+        return steps[::-1]
+
+    def reasoning(self, node):
+        return "\n".join(self.steps(node))
+
+    def children(self, node):
+        return [child for child in self.nodes if child.parent_id == node.node_id]
+
+    def leaves(self):
+        """Finished branches, best score first"""
+        return sorted((node for node in self.nodes if node.status == "leaf"), key=lambda node: -node.score)
+
+    def stats(self):
+        counts = {"frontier": 0, "expanded": 0, "pruned": 0, "leaf": 0}
+        for node in self.nodes[1:]:
+            counts[node.status] += 1
+        return {
+            "nodes": len(self.nodes) - 1,
+            "expanded": counts["expanded"],
+            "pruned": counts["pruned"],
+            "leaves": counts["leaf"],
+            "max_depth": max(node.depth for node in self.nodes),
+            "tokens_used": self.tokens_used,
+            "token_budget": self.token_budget
+        }
+
+    def to_dict(self):
+        return {"stats": self.stats(), "nodes": [node.to_dict() for node in self.nodes]}
+
+
+class BeamSearch:
+    """Tree-of-Thought beam search for one ReasoningTree
+
+    `scorer(reasoning)` rates the reasoning from the root to a node; it
+    defaults to the scanner's confidence, whose scan of each node is kept
+    and reused for the answers of the leaves. At most
+    `token_budget` tokens are generated per problem, counting the tokens
+    the backend generated rather than the trimmed steps it returned.
+    """
+
+    def __init__(self, reasoning_tree, beam_width=2, branching=2, max_depth=4, step_tokens=25,
+                 token_budget=200, scorer=None):
+        self.reasoning_tree = reasoning_tree
+        self.beam_width = beam_width
+        self.branching = branching
+        self.max_depth = max_depth
+        self.step_tokens = step_tokens
+        self.token_budget = token_budget
+        self.scorer = scorer
+
+    def run(self, problem, prompt_template):
+        """Search one problem; returns (paths, tree) with one path per leaf, best first"""
+        reasoning_tree = self.reasoning_tree
+        template = get_template_store().get(prompt_template, required=["problem"])
+        _, prompts, prefix = reasoning_tree._build_path_prompts(problem, template, 1)
+        root_prompt = prompts[0]
+
+        tree = ThoughtTree(self.token_budget)
+        frontier = [tree.root]
+        scans = {}
+
+        while frontier:
+            # The best nodes are expanded first when the budget runs short
+            affordable = (self.token_budget - tree.tokens_used) // self.step_tokens
+            expansions = [(node, branch) for node in frontier for branch in range(self.branching)][:affordable]
+            if not expansions:
+                break
+
+            stats = {}
+            try:
+                with get_metrics().labels(component="reasoning_tree", strategy="beam_search"):
+                    completions = generate_cached(
+                        reasoning_tree.backend,
+                        [root_prompt + "".join(step + "\n" for step in tree.steps(node)) for node, _ in expansions],
+                        cache=reasoning_tree.cache,
+                        seed=reasoning_tree.seed,
+                        sample_ids=[branch for _, branch in expansions],
+                        max_new_tokens=self.step_tokens,
+                        do_sample=True,
+                        temperature=0.8,
+                        top_p=0.9,
+                        prefix=prefix,
+                        stop=STEP_STOP,
+                        stats=stats
+                    )
+            except Exception as e:
+                return [ReasoningPath(1, "beam_search", f"Error: {str(e)}", "Error", 0.0)], tree
+
+            candidates = []
+            seen = set()
+            for (parent, _), completion, tokens in zip(expansions, completions, stats["generated_tokens"]):
+                parent.status = "expanded"
+                step = completion.strip()
+                # Tokens decoded past the stop point were generated too
+                child = tree.add(parent, step, tokens)
+
+                # Empty steps and repeats of a sibling add nothing to the search
+                if not step or (parent.node_id, step) in seen:
+                    child.status = "pruned"
+                    continue
+                seen.add((parent.node_id, step))
+
+                reasoning = tree.reasoning(child)
+                if self.scorer is None:
+                    scan = scans[child.node_id] = SCANNER.scan(reasoning)
+                    child.score = scan.confidence
+                else:
+                    child.score = self.scorer(reasoning)
+                lowered = step.lower()
+                if child.depth >= self.max_depth or any(marker in lowered for marker in ANSWER_KEYWORDS):
+                    child.status = "leaf"
+                else:
+                    candidates.append(child)
+
+            # Nodes the budget did not reach stay on the frontier
+            expanded = len(expansions) // self.branching + (1 if len(expansions) % self.branching else 0)
+            candidates.extend(frontier[expanded:])
+
+            candidates.sort(key=lambda node: -node.score)
+            frontier = candidates[:self.beam_width]
+            for node in candidates[self.beam_width:]:
+                node.status = "pruned"
+
+        # Unfinished branches still count as answers once the budget is spent
+        for node in frontier:
+            if node.depth > 0:
+                node.status = "leaf"
+
+        paths = []
+        for path_id, leaf in enumerate(tree.leaves(), start=1):
+            reasoning = tree.reasoning(leaf)
+            scan = scans.get(leaf.node_id) or SCANNER.scan(reasoning)
+            paths.append(ReasoningPath(path_id, "beam_search", reasoning, scan.final_answer, scan.confidence))
+        return paths, tree
@@ -0,0 +1,85 @@
+import os
+import random
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from self_consistency import SelfConsistency
+
+# Distinct strings that share keys ("5" / "x = 5"), plus empty, None and failed answers
+ANSWERS = ["5", "x = 5", "5.0", "12", "yes", "Correct", "no", "incorrect", "", None, "Error", "the cat"]
+
+
+def random_tasks(seed, num_tasks=300):
+    rng = random.Random(seed)
+    tasks = []
+    for task_id in range(num_tasks):
+        pool = rng.sample(ANSWERS, rng.randint(1, 4))
+        paths = [
+            # Confidences on the scanner's 1/8 grid, so equal weights tie exactly
+            {"final_answer": rng.choice(pool), "confidence": rng.randint(0, 8) / 8}
+            for _ in range(rng.randint(0, 6))
+        ]
+        tasks.append((task_id, paths))
+    return tasks
+
+
+def expected_result(aggregator, paths, details):
+    expected = aggregator.aggregate_answers(paths)
+    if not details:
+        for key in ("all_answers", "vote_distribution", "weight_distribution", "similar_groups"):
+            expected.pop(key, None)
+    expected["consistency"] = aggregator.evaluate_consistency(paths)
+    return expected
+
+
+def assert_matches(actual, expected, where):
+    """Equal, with floats compared up to summation order"""
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict) and actual.keys() == expected.keys(), where
+        for key in expected:
+            assert_matches(actual[key], expected[key], (where, key))
+    elif isinstance(expected, float):
+        assert actual == pytest.approx(expected), where
+    else:
+        assert actual == expected, where
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("details", [False, True])
+def test_bulk_matches_per_task_aggregation(seed, details):
+    aggregator = SelfConsistency()
+    tasks = random_tasks(seed)
+    results = aggregator.aggregate_bulk(tasks, details=details)
+
+    assert [result.pop("task_id") for result in results] == [task_id for task_id, _ in tasks]
+    for (task_id, paths), result in zip(tasks, results):
+        assert_matches(result, expected_result(aggregator, paths, details), (task_id, paths))
+
+
+def test_ties_go_to_the_first_answer_seen():
+    paths = [
+        {"final_answer": "7", "confidence": 0.5},
+        {"final_answer": "8", "confidence": 0.5},
+        {"final_answer": "8", "confidence": 0.25},
+        {"final_answer": "7", "confidence": 0.25}
+    ]
+    result = SelfConsistency().aggregate_bulk([("tie", paths)])[0]
+    assert result["final_answer"] == "7"
+    assert result["method"] == "majority_vote"
+    assert result["final_answer"] == SelfConsistency().aggregate_answers(paths)["final_answer"]
+
+
+def test_empty_and_failed_tasks():
+    aggregator = SelfConsistency()
+    tasks = [("none", []), ("failed", [{"final_answer": "Error", "confidence": 0.0}]),
+             ("blank", [{"final_answer": "", "confidence": 0.0}, {"final_answer": None, "confidence": 0.0}])]
+    for (task_id, paths), result in zip(tasks, aggregator.aggregate_bulk(tasks, details=True)):
+        result.pop("task_id")
+        assert_matches(result, expected_result(aggregator, paths, details=True), task_id)
@@ -0,0 +1,64 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+from common.backends import StubBackend
+from evaluation_store import EvaluationStore
+from optimizer_loop import pipeline_evaluator
+from reasoning_tree import PATH_SAMPLING, ReasoningTree
+
+TASKS = [
+    {"id": 1, "problem": "What is 2 + 3?", "expected_answer": "5"},
+    {"id": 2, "problem": "What is 6 * 7?", "expected_answer": "42"}
+]
+
+
+class CountingEvaluate:
+    """evaluate(prompt_path, tasks) that records which tasks it was asked to score"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompt_path, tasks):
+        self.calls.append([task["id"] for task in tasks])
+        return [{"task_id": task["id"], "is_correct": True, "confidence": 0.5} for task in tasks]
+
+
+def test_results_are_kept_apart_per_sampling_config(tmp_path):
+    store = EvaluationStore(str(tmp_path / "evaluations.jsonl"))
+    evaluate = CountingEvaluate()
+    greedy, sampled = {"temperature": 0.0}, {"temperature": 0.8}
+
+    store.evaluate("prompt", "prompt.txt", TASKS, evaluate, greedy)
+    store.evaluate("prompt", "prompt.txt", TASKS, evaluate, greedy)
+    store.evaluate("prompt", "prompt.txt", TASKS[:1], evaluate, sampled)
+    assert evaluate.calls == [[1, 2], [1]]
+    assert store.totals("prompt", greedy)["total_tasks"] == 2
+    assert store.totals("prompt", sampled)["total_tasks"] == 1
+    store.close()
+
+    # Reloaded from its log, the store still tells the configs apart
+    reloaded = EvaluationStore(str(tmp_path / "evaluations.jsonl"))
+    reloaded.evaluate("prompt", "prompt.txt", TASKS, evaluate, sampled)
+    assert evaluate.calls[-1] == [2]
+    reloaded.close()
+
+
+def test_pipeline_evaluator_config_covers_every_sampling_setting():
+    config = pipeline_evaluator(ReasoningTree(backend=StubBackend(), seed=3), num_paths=4).config
+
+    assert config["seed"] == 3
+    assert config["num_paths"] == 4
+    assert config["model"] == StubBackend().model_id
+    for name in ("max_new_tokens", "do_sample", "temperature", "top_p"):
+        assert config[name] == PATH_SAMPLING[name]
+    assert config["stop"] == PATH_SAMPLING["stop"].as_key()
+
+    other_seed = pipeline_evaluator(ReasoningTree(backend=StubBackend(), seed=4), num_paths=4).config
+    store = EvaluationStore()
+    store.put("prompt", TASKS[0], config, {"task_id": 1})
+    assert store.lookup("prompt", TASKS[:1], config)[0] == {0: {"task_id": 1}}
+    assert store.lookup("prompt", TASKS[:1], other_seed)[1] == TASKS[:1]
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+from common.backends import StubBackend
+from common.metrics import get_metrics
+from evaluation_store import EvaluationStore
+from optimizer_loop import PromptOptimizer, pipeline_evaluator
+from reasoning_tree import ReasoningTree
+
+PROMPT = os.path.join(HERE, "..", "prompts", "initial_prompt.txt")
+TASKS = os.path.join(HERE, "..", "tasks", "problem_definitions.json")
+
+
+class CountingBackend(StubBackend):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def generate_many(self, requests, max_batch_size=8, **generation_kwargs):
+        prompts = []
+        self.batches.append(prompts)
+        for tag, completion in super().generate_many(self._collect(requests, prompts), max_batch_size, **generation_kwargs):
+            yield tag, completion
+
+    @staticmethod
+    def _collect(requests, prompts):
+        for tag, prompt in requests:
+            prompts.append(prompt)
+            yield tag, prompt
+
+
+def search(tmp_path, evaluation_store=None):
+    prompt_path = str(tmp_path / "prompt.txt")
+    shutil.copy(PROMPT, prompt_path)
+    with open(TASKS, 'r') as f:
+        tasks = json.load(f)["tasks"]
+    assert len(tasks) == 7
+
+    backend = CountingBackend()
+    optimizer = PromptOptimizer(backend=StubBackend(), seed=0, evaluation_store=evaluation_store)
+    with open(PROMPT, 'r') as f:
+        base = f.read()
+    optimizer.generate_candidates = lambda *args, **kwargs: [
+        f"Rewrite {k}.\n" + base for k in range(1, 4)
+    ]
+    evaluate = pipeline_evaluator(ReasoningTree(backend=backend, seed=0), num_paths=2)
+    optimizer.search_prompts(prompt_path, {}, [], tasks, evaluate, num_candidates=3, min_tasks=2, eta=2)
+    return backend, optimizer
+
+
+def test_each_round_scores_every_survivor_in_one_batch(tmp_path):
+    metrics = get_metrics()
+    metrics.enable()
+    metrics.clear()
+    try:
+        backend, _ = search(tmp_path)
+        series = metrics.summary()["series"]
+    finally:
+        metrics.enabled = False
+        metrics.clear()
+
+    # 4 prompts on 2 tasks, then 2 on the next 2, then the winner on the last 3
+    assert [len(prompts) // 2 for prompts in backend.batches] == [8, 4, 3]
+    # Generation stays on the calling thread, so every evaluated task is recorded
+    assert sum(s["calls"] for s in series if s["component"] == "reasoning_tree"
+               and s["strategy"] == "continuous_batch") == 15
+
+
+def test_store_hits_are_not_counted_as_evaluations(tmp_path, capsys):
+    store = EvaluationStore()
+    search(tmp_path, store)
+    assert "with 15 task evaluations" in capsys.readouterr().out
+
+    backend, _ = search(tmp_path, store)
+    assert backend.batches == []
+    assert "with 0 task evaluations" in capsys.readouterr().out
+
+
+def test_only_the_winner_is_tracked(tmp_path):
+    _, optimizer = search(tmp_path)
+
+    # Round scores stay in the search log, one entry per round
+    assert [(entry["tasks"], len(entry["scores"])) for entry in optimizer.search_log] == [(2, 4), (4, 2), (7, 1)]
+    [tracked] = optimizer.performance_tracking
+    assert tracked["prompt_version"].startswith("v1_c")
+    assert tracked["metrics"]["total_tasks"] == len(tracked["task_results"]) == 7
@@ -0,0 +1,56 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+from common.backends import StubBackend
+from reasoning_tree import ReasoningTree
+
+PROMPT = os.path.join(HERE, "..", "prompts", "initial_prompt.txt")
+
+
+class FailingBackend(StubBackend):
+    def generate(self, *args, **kwargs):
+        raise RuntimeError("out of memory")
+
+
+def test_failing_task_gets_error_paths_without_aborting_the_batch():
+    tree = ReasoningTree(backend=StubBackend())
+    build = tree._build_path_prompts
+
+    def build_or_fail(problem, *args, **kwargs):
+        if problem == "too long":
+            raise ValueError("does not fit")
+        return build(problem, *args, **kwargs)
+
+    tree._build_path_prompts = build_or_fail
+    tasks = [{"id": 1, "problem": "What is 2 + 3?"}, {"id": 2, "problem": "too long"}, {"id": 3, "problem": "What is 7 * 6?"}]
+    results = {task["id"]: paths for task, paths in tree.generate_paths_for_tasks(tasks, PROMPT, num_paths=3, max_batch_size=2)}
+
+    assert sorted(results) == [1, 2, 3]
+    assert [path.final_answer for path in results[2]] == ["Error"] * 3
+    assert results[2][0].full_reasoning == "Error: does not fit"
+    assert all(path.final_answer != "Error" for path in results[1] + results[3])
+
+
+def test_tasks_sharing_an_id_are_kept_apart():
+    tree = ReasoningTree(backend=StubBackend())
+    tasks = [{"id": 7, "problem": "What is 2 + 3?"}, {"id": 7, "problem": "What is 40 + 2?"}]
+    results = list(tree.generate_paths_for_tasks(tasks, PROMPT, num_paths=2, max_batch_size=4))
+
+    assert sorted(task["problem"] for task, _ in results) == sorted(task["problem"] for task in tasks)
+    for task, paths in results:
+        assert len(paths) == 2
+        assert paths[0].final_answer in task["problem"]
+
+
+def test_generation_failure_gives_every_task_error_paths():
+    tree = ReasoningTree(backend=FailingBackend())
+    tasks = [{"id": i, "problem": f"What is {i} + 1?"} for i in range(5)]
+    results = list(tree.generate_paths_for_tasks(tasks, PROMPT, num_paths=3, max_batch_size=2))
+
+    assert sorted(task["id"] for task, _ in results) == list(range(5))
+    for _, paths in results:
+        assert [path.full_reasoning for path in paths] == ["Error: out of memory"] * 3
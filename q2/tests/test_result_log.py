@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+from result_log import ResultLog, completed_ids, read_records
+
+
+def test_partly_written_final_line_is_ignored_and_dropped_on_resume(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with ResultLog(path) as log:
+        log.append({"task_id": 1})
+        log.append({"task_id": 2})
+    with open(path, 'a') as f:
+        f.write('{"task_id": 3, "answ')
+
+    assert completed_ids(path) == {1, 2}
+
+    with ResultLog(path, resume=True) as log:
+        log.append({"task_id": 3})
+    assert [record["task_id"] for record in read_records(path)] == [1, 2, 3]
+
+
+def test_log_without_a_single_complete_line_is_emptied_on_resume(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with open(path, 'w') as f:
+        f.write('{"task_id": 1')
+
+    assert completed_ids(path) == set()
+    ResultLog(path, resume=True).close()
+    assert os.path.getsize(path) == 0
+
+
+@pytest.fixture
+def demo(tmp_path, monkeypatch):
+    """The demo pipeline running in a scratch copy of its working directory"""
+    shutil.copytree(os.path.join(HERE, "..", "tasks"), tmp_path / "tasks")
+    (tmp_path / "prompts").mkdir()
+    monkeypatch.chdir(tmp_path)
+    import run_pipeline_demo
+    return run_pipeline_demo
+
+
+def test_resume_runs_only_the_tasks_missing_from_the_log(demo, capsys):
+    with open("tasks/problem_definitions.json") as f:
+        task_ids = [task["id"] for task in json.load(f)["tasks"]]
+    demo.main()
+
+    # Simulate a crash: the last task never got written, the one before only partly
+    with open(demo.RESULTS_LOG) as f:
+        lines = f.readlines()
+    with open(demo.RESULTS_LOG, 'w') as f:
+        f.writelines(lines[:-2])
+        f.write(lines[-2][:20])
+    capsys.readouterr()
+
+    demo.main(resume=True)
+    assert f"Running pipeline on 2 tasks" in capsys.readouterr().out
+    assert sorted(record["task_id"] for record in read_records(demo.RESULTS_LOG)) == sorted(task_ids)
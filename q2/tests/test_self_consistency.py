@@ -0,0 +1,48 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+from common.backends import StubBackend
+from reasoning_tree import ReasoningTree
+from self_consistency import SelfConsistency
+
+PROMPT = os.path.join(HERE, "..", "prompts", "initial_prompt.txt")
+
+
+class RecordingBackend(StubBackend):
+    """StubBackend that records the (prompt, seed, row) of every sample it draws"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.samples = []
+
+    def generate(self, prompts, seed=None, **kwargs):
+        self.samples.extend((prompt, seed, row) for row, prompt in enumerate(prompts))
+        return super().generate(prompts, seed=seed, **kwargs)
+
+
+def test_adaptive_rounds_draw_fresh_samples():
+    backend = RecordingBackend(agreement=0.0)
+    tree = ReasoningTree(seed=42, backend=backend)
+    result = SelfConsistency().aggregate_adaptive(
+        tree, "What is 12 + 30?", PROMPT, max_paths=9, paths_per_round=1, min_paths=1, margin=1.1,
+        stopping_rule="lead"
+    )
+
+    # A sample is fixed by (prompt, seed, row); later rounds must not repeat earlier ones
+    assert len(backend.samples) == result["paths_used"] > 4
+    assert len(set(backend.samples)) == len(backend.samples)
+    assert backend.samples[0][1] == 42
+
+
+def test_adaptive_sampling_is_reproducible_with_a_seed():
+    def run():
+        tree = ReasoningTree(seed=7, backend=StubBackend(agreement=0.0))
+        return SelfConsistency().aggregate_adaptive(
+            tree, "What is 12 + 30?", PROMPT, max_paths=6, paths_per_round=2, margin=1.1, stopping_rule="lead"
+        )["all_answers"]
+
+    assert run() == run()
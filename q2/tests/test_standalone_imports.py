@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+@pytest.mark.parametrize("module", ["answer_scanner", "self_consistency", "result_log", "evaluation_store", "tree_search"])
+def test_module_imports_from_src_alone(module):
+    # Scripts run from q2/src, where only the src directory is on the path
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONPATH"}
+    completed = subprocess.run([sys.executable, "-c", f"import {module}"], cwd=SRC, env=env,
+                               capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
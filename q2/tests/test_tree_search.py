@@ -0,0 +1,71 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", ".."))
+
+import pytest
+
+from common.backends import StubBackend
+from reasoning_tree import ReasoningTree
+
+PROMPT = os.path.join(HERE, "..", "prompts", "initial_prompt.txt")
+PROBLEM = "What is 12 + 30?"
+
+
+class CountingBackend(StubBackend):
+    """StubBackend that adds up the tokens it generates, stop overshoot included"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.generated = 0
+
+    def generate(self, prompts, stats=None, **kwargs):
+        stats = {} if stats is None else stats
+        completions = super().generate(prompts, stats=stats, **kwargs)
+        self.generated += sum(stats["generated_tokens"])
+        return completions
+
+
+@pytest.mark.parametrize("token_budget", [50, 100, 200])
+def test_search_stays_within_the_token_budget(token_budget):
+    backend = CountingBackend()
+    tree = ReasoningTree(seed=1, backend=backend)
+    paths, search = tree.search_reasoning_paths(PROBLEM, PROMPT, token_budget=token_budget)
+
+    assert paths
+    assert search.tokens_used == backend.generated <= token_budget
+
+
+def test_search_charges_tokens_generated_past_the_stop():
+    backend = CountingBackend()
+    tree = ReasoningTree(seed=1, backend=backend)
+    _, search = tree.search_reasoning_paths(PROBLEM, PROMPT)
+
+    # The word completing a step's newline is generated but cut from the step
+    assert all(node.tokens > backend.count_tokens(node.step) for node in search.nodes[1:])
+
+
+def test_search_prunes_and_generates_less_than_flat_paths():
+    search_backend = CountingBackend()
+    _, search = ReasoningTree(seed=1, backend=search_backend).search_reasoning_paths(PROBLEM, PROMPT)
+    flat_backend = CountingBackend()
+    ReasoningTree(seed=1, backend=flat_backend).generate_reasoning_paths(PROBLEM, PROMPT, num_paths=3)
+
+    assert search.stats()["pruned"] > 0
+    assert search_backend.generated < flat_backend.generated
+
+
+def test_default_scorer_scans_each_node_once(monkeypatch):
+    import tree_search
+
+    scanned = []
+    scan = tree_search.SCANNER.scan
+    monkeypatch.setattr(tree_search.SCANNER, "scan", lambda text: scanned.append(text) or scan(text))
+    paths, search = ReasoningTree(seed=1, backend=StubBackend()).search_reasoning_paths(PROBLEM, PROMPT)
+
+    # Every distinct non-empty step is scored once; leaves reuse that scan
+    scored = {(node.parent_id, node.step) for node in search.nodes[1:] if node.step}
+    assert paths
+    assert len(scanned) == len(set(scanned)) == len(scored)
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def _bytes_to_unicode():
+    """GPT-2's byte-to-character table, so every byte is one vocabulary entry"""
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    characters = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            characters.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, map(chr, characters)))
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory):
+    """Path of a randomly initialised two-layer GPT-2 with a byte-level vocabulary
+
+    Small enough to build offline in well under a second, so the
+    transformers code paths run without downloading a checkpoint.
+    """
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    import json
+
+    path = tmp_path_factory.mktemp("tiny-gpt2")
+    vocab = {character: byte for byte, character in _bytes_to_unicode().items()}
+    vocab["<|endoftext|>"] = 256
+    with open(path / "vocab.json", 'w') as f:
+        json.dump(vocab, f)
+    with open(path / "merges.txt", 'w') as f:
+        f.write("#version: 0.2\n")
+
+    tokenizer = transformers.GPT2Tokenizer(str(path / "vocab.json"), str(path / "merges.txt"))
+    tokenizer.save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = transformers.GPT2Config(vocab_size=257, n_embd=32, n_layer=2, n_head=2,
+                                     bos_token_id=256, eos_token_id=256)
+    transformers.GPT2LMHeadModel(config).save_pretrained(path)
+    return str(path)
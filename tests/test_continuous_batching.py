@@ -0,0 +1,53 @@
+import pytest
+
+from common.backends import TransformersBackend
+from common.continuous_batching import ContinuousBatcher
+from common.generation import generate_batch
+
+PROMPTS = ["What is 2 + 3?", "Solve 3x + 5 = 14 for x.", "A rectangle is 12cm by 7cm. Its perimeter is",
+           "Half of 84 is", "Ten percent of 250 is"]
+
+
+@pytest.fixture
+def backend(tiny_model):
+    backend = TransformersBackend(tiny_model, background_load=False)
+    yield backend
+    backend.close()
+
+
+def run(loaded, prompts, **options):
+    return dict(ContinuousBatcher(loaded, **options).run(enumerate(prompts)))
+
+
+def test_greedy_batch_matches_one_prompt_at_a_time(backend):
+    batched = run(backend.loaded, PROMPTS, max_batch_size=2, max_new_tokens=10, do_sample=False)
+    assert [batched[i] for i in range(len(PROMPTS))] == [
+        generate_batch(backend.loaded, [prompt], max_new_tokens=10, do_sample=False)[0] for prompt in PROMPTS
+    ]
+
+
+def test_seeded_runs_are_reproducible_whatever_the_batch_size(backend):
+    first = run(backend.loaded, PROMPTS, max_batch_size=2, max_new_tokens=10, seed=3)
+    assert run(backend.loaded, PROMPTS, max_batch_size=2, max_new_tokens=10, seed=3) == first
+    assert run(backend.loaded, PROMPTS, max_batch_size=5, max_new_tokens=10, seed=3) == first
+    assert run(backend.loaded, PROMPTS, max_batch_size=2, max_new_tokens=10, seed=4) != first
+
+
+def test_generate_many_passes_the_seed_through(backend):
+    def completions(seed):
+        return dict(backend.generate_many(enumerate(PROMPTS), max_batch_size=2, max_new_tokens=10, seed=seed))
+
+    assert completions(11) == completions(11)
+    assert completions(11) != completions(12)
+
+
+def test_prompts_are_checked_against_the_position_window_on_admission(backend):
+    window = backend.loaded.model.config.n_positions
+
+    # Close to the end of the window, generation is capped instead of overrunning it
+    near_the_end = run(backend.loaded, ["x" * (window - 3), PROMPTS[0]], max_new_tokens=10, do_sample=False)
+    assert backend.count_tokens(near_the_end[0]) <= 3
+    assert near_the_end[1]
+
+    with pytest.raises(ValueError, match="no room"):
+        run(backend.loaded, ["x" * window], max_new_tokens=10)
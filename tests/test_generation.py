@@ -0,0 +1,39 @@
+import pytest
+import torch
+
+from common.backends import TransformersBackend
+from common.generation import _generated_lengths
+
+
+@pytest.fixture
+def backend(tiny_model):
+    return TransformersBackend(tiny_model, background_load=False)
+
+
+def test_stream_yields_generated_text(backend):
+    stats = {}
+    pieces = list(backend.stream("Solve 2x = 4", max_new_tokens=5, seed=0, stats=stats))
+    assert pieces
+    assert stats["tokens"] == 5
+
+
+def test_stream_reraises_generate_errors_instead_of_hanging(backend, monkeypatch):
+    def generate(**kwargs):
+        raise RuntimeError("out of memory")
+
+    # The model is shared through the registry, so the patch must not outlive the test
+    monkeypatch.setattr(backend.loaded.model, "generate", generate)
+    with pytest.raises(RuntimeError, match="out of memory"):
+        list(backend.stream("Solve 2x = 4", max_new_tokens=5))
+
+
+def test_generate_reports_tokens_generated_per_row(backend):
+    stats = {}
+    backend.generate(["Solve 2x = 4", "x"], max_new_tokens=8, do_sample=False, stats=stats)
+    assert stats["generated_tokens"] == [8, 8]
+
+
+def test_generated_lengths_count_the_token_a_row_stopped_on():
+    # Rows that finished early are padded; pad doubles as EOS here
+    new_tokens = torch.tensor([[5, 6, 7, 0], [5, 0, 0, 0], [0, 0, 0, 0]])
+    assert _generated_lengths(new_tokens, 0) == [4, 2, 1]
@@ -0,0 +1,76 @@
+import re
+
+import pytest
+
+from common.metrics import COUNTERS, GenerationMetrics
+
+SAMPLE = re.compile(r'^(\w+)\{((?:\w+="(?:[^"\\]|\\.)*",?)*)\} (\S+)$')
+
+
+def record(metrics, prompt_tokens, **labels):
+    with metrics.labels(component="tutor"):
+        with metrics.call(**labels) as call:
+            call.prompt_tokens += prompt_tokens
+            call.generated_tokens += 2 * prompt_tokens
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = GenerationMetrics()
+    with metrics.call(strategy="zero_shot") as call:
+        assert call is None
+    assert metrics.summary()["series"] == []
+
+
+def test_textfile_is_valid_prometheus_text_format(tmp_path):
+    metrics = GenerationMetrics()
+    metrics.enable()
+    record(metrics, 10, strategy="zero_shot", category='say "hi"\\')
+    record(metrics, 5, strategy="few_shot")
+    path = tmp_path / "textfile" / "generation.prom"
+    metrics.write_textfile(str(path))
+
+    lines = path.read_text().splitlines()
+    samples = {}
+    for field, name, help_text in COUNTERS:
+        assert f"# HELP prompt_lab_{name} {help_text}" in lines
+        assert f"# TYPE prompt_lab_{name} counter" in lines
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        samples[(match.group(1), match.group(2))] = float(match.group(3))
+
+    assert samples[("prompt_lab_generation_prompt_tokens_total",
+                    'component="tutor",strategy="zero_shot",category="say \\"hi\\"\\\\"')] == 10
+    assert samples[("prompt_lab_generation_generated_tokens_total",
+                    'component="tutor",strategy="few_shot",category=""')] == 10
+    assert samples[("prompt_lab_generation_calls_total",
+                    'component="tutor",strategy="few_shot",category=""')] == 1
+    assert len(samples) == 2 * len(COUNTERS)
+    assert list(tmp_path.joinpath("textfile").iterdir()) == [path]
+
+
+def test_merge_adds_another_process_summary():
+    parent, worker = GenerationMetrics(), GenerationMetrics()
+    parent.enable()
+    worker.enable()
+    record(parent, 10, strategy="zero_shot")
+    record(worker, 4, strategy="zero_shot")
+    record(worker, 1, strategy="few_shot")
+
+    parent.merge(worker.summary()["series"])
+    series = {item["strategy"]: item for item in parent.summary()["series"]}
+    assert series["zero_shot"]["calls"] == 2
+    assert series["zero_shot"]["prompt_tokens"] == 14
+    assert series["few_shot"]["generated_tokens"] == 2
+    assert parent.summary()["totals"]["calls"] == 3
+
+
+def test_errors_are_counted_and_reraised():
+    metrics = GenerationMetrics()
+    metrics.enable()
+    with pytest.raises(RuntimeError):
+        with metrics.call(strategy="zero_shot"):
+            raise RuntimeError("out of memory")
+    assert metrics.summary()["totals"]["errors"] == 1
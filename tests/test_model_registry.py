@@ -0,0 +1,40 @@
+import pytest
+
+from common import model_registry
+from common.generation import generate_batch
+from common.model_registry import ModelRegistry, resolve_dtype
+
+
+def test_bf16_fallback_is_reported_once(monkeypatch, capsys):
+    monkeypatch.setattr(model_registry, "cpu_supports_bf16", lambda: False)
+    monkeypatch.setattr(model_registry, "_warned_bf16_fallback", False)
+    assert resolve_dtype("bfloat16") == "float32"
+    assert resolve_dtype("bfloat16") == "float32"
+    assert capsys.readouterr().out.count("falling back to float32") == 1
+
+
+def test_unknown_precision_is_rejected():
+    with pytest.raises(ValueError):
+        resolve_dtype("float8")
+
+
+@pytest.mark.parametrize("dtype", ["float32", "bfloat16", "int8"])
+def test_each_precision_loads_and_generates(tiny_model, dtype):
+    torch = pytest.importorskip("torch")
+    registry = ModelRegistry()
+    # acquire loads exactly the requested precision, without the CPU fallback
+    loaded = registry.acquire(tiny_model, dtype)
+    try:
+        if dtype == "int8":
+            from transformers.pytorch_utils import Conv1D
+
+            assert not any(isinstance(module, Conv1D) for module in loaded.model.modules())
+            assert any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in loaded.model.modules())
+        else:
+            assert loaded.model.dtype == getattr(torch, dtype)
+
+        completions = generate_batch(loaded, ["Solve 2x = 4", "Area of a square"], max_new_tokens=4, seed=0)
+        assert len(completions) == 2
+    finally:
+        registry.release(loaded)
+    assert registry.loaded_keys() == []
@@ -0,0 +1,38 @@
+import pytest
+
+from common.generation import generate_batch
+from common.model_registry import get_registry
+from common.prefix_cache import PrefixCache
+
+PREFIX = "Solve the following problem step by step and give the final answer.\nProblem: "
+PROMPTS = [PREFIX + "What is 2 + 3?", PREFIX + "What is 12 * 4?", PREFIX + "Solve 3x + 5 = 14"]
+
+
+@pytest.fixture
+def loaded(tiny_model):
+    registry = get_registry()
+    loaded = registry.acquire(tiny_model)
+    yield loaded
+    registry.release(loaded)
+
+
+def test_prefix_cached_generation_matches_uncached(loaded):
+    cache = PrefixCache()
+    uncached = generate_batch(loaded, PROMPTS, max_new_tokens=12, do_sample=False)
+    cached = generate_batch(loaded, PROMPTS, max_new_tokens=12, do_sample=False, prefix=PREFIX, prefix_cache=cache)
+
+    assert cached == uncached
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # The second batch forks the stored key/values instead of encoding the prefix again
+    again = generate_batch(loaded, PROMPTS[:2], max_new_tokens=12, do_sample=False, prefix=PREFIX, prefix_cache=cache)
+    assert again == uncached[:2]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_prompts_without_the_prefix_skip_the_cache(loaded):
+    cache = PrefixCache()
+    prompts = PROMPTS[:1] + ["A different opening. What is 7 - 2?"]
+    assert generate_batch(loaded, prompts, max_new_tokens=8, do_sample=False, prefix=PREFIX, prefix_cache=cache) == \
+        generate_batch(loaded, prompts, max_new_tokens=8, do_sample=False)
+    assert len(cache) == 0
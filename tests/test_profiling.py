@@ -0,0 +1,79 @@
+import cProfile
+import pstats
+import time
+
+from common.profiling import collapse_stacks
+
+
+class GraphStats:
+    """Stand-in for pstats.Stats built from a call graph
+
+    `calls` maps each function name to its own seconds and its callees;
+    each callee's cumulative time is split evenly between its callers.
+    """
+
+    def __init__(self, calls):
+        cumulative = {}
+
+        def total(name):
+            if name not in cumulative:
+                own, callees = calls[name]
+                cumulative[name] = own + sum(total(callee) / callers_of(callee) for callee in callees)
+            return cumulative[name]
+
+        def callers_of(name):
+            return sum(name in callees for _, callees in calls.values())
+
+        self.stats = {}
+        for name, (own, _) in calls.items():
+            callers = {
+                ("~", 0, caller): (1, 1, 0.0, total(name) / callers_of(name))
+                for caller, (_, callees) in calls.items() if name in callees
+            }
+            self.stats[("~", 0, name)] = (1, 1, own, total(name), callers)
+
+
+def diamonds(levels, own=1.0):
+    """top0 -> (left0, right0) -> top1 -> ... -> top{levels}: 2**levels paths from root to leaf"""
+    calls = {f"top{levels}": (own, [])}
+    for k in range(levels):
+        calls[f"top{k}"] = (own, [f"left{k}", f"right{k}"])
+        calls[f"left{k}"] = (own, [f"top{k + 1}"])
+        calls[f"right{k}"] = (own, [f"top{k + 1}"])
+    return GraphStats(calls)
+
+
+def test_a_diamond_is_split_between_both_paths():
+    assert collapse_stacks(diamonds(1)) == {
+        "top0": 1000000,
+        "top0;left0": 1000000,
+        "top0;right0": 1000000,
+        "top0;left0;top1": 500000,
+        "top0;right0;top1": 500000
+    }
+
+
+def test_a_deep_chain_of_diamonds_stays_bounded_and_keeps_its_time():
+    stats = diamonds(40, own=1000.0)
+    root_time = stats.stats[("~", 0, "top0")][3]
+
+    start = time.perf_counter()
+    stacks = collapse_stacks(stats, max_paths=20)
+    assert time.perf_counter() - start < 5
+
+    # 2**40 caller paths exist; each function is expanded along at most 20 of them
+    assert len(stacks) <= 20 * len(stats.stats)
+    assert abs(sum(stacks.values()) / 1e6 - root_time) / root_time < 1e-6
+
+
+def test_real_profile_collapses():
+    def leaf():
+        return sum(range(20000))
+
+    def branch():
+        return leaf() + leaf()
+
+    profile = cProfile.Profile()
+    profile.runcall(lambda: [branch() for _ in range(5)])
+    stacks = collapse_stacks(pstats.Stats(profile))
+    assert any("branch" in stack and stack.endswith(")") and "leaf" in stack for stack in stacks)
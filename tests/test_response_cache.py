@@ -0,0 +1,81 @@
+import time
+
+from common.backends import StubBackend, generate_cached
+from common.response_cache import ResponseCache
+
+
+class CountingBackend(StubBackend):
+    """StubBackend that counts the prompts it actually generated"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.generated = 0
+
+    def generate(self, prompts, **kwargs):
+        self.generated += len(prompts)
+        return super().generate(prompts, **kwargs)
+
+
+def test_key_covers_everything_that_determines_a_generation():
+    key = ResponseCache.make_key("model", "prompt", {"temperature": 0.7}, seed=1, sample_id=0)
+    assert key == ResponseCache.make_key("model", "prompt", {"temperature": 0.7}, seed=1, sample_id=0)
+    assert len({
+        key,
+        ResponseCache.make_key("other", "prompt", {"temperature": 0.7}, seed=1, sample_id=0),
+        ResponseCache.make_key("model", "prompt!", {"temperature": 0.7}, seed=1, sample_id=0),
+        ResponseCache.make_key("model", "prompt", {"temperature": 0.8}, seed=1, sample_id=0),
+        ResponseCache.make_key("model", "prompt", {"temperature": 0.7}, seed=2, sample_id=0),
+        ResponseCache.make_key("model", "prompt", {"temperature": 0.7}, seed=1, sample_id=1),
+    }) == 6
+
+
+def test_least_recently_used_entries_are_evicted_over_max_bytes(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=25)
+    cache.put("a", "x" * 10)
+    time.sleep(0.01)
+    cache.put("b", "y" * 10)
+    time.sleep(0.01)
+    assert cache.get("a") == "x" * 10
+    time.sleep(0.01)
+    cache.put("c", "z" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
+    assert cache.get("c") == "z" * 10
+    assert cache.stats()["bytes"] <= 25
+
+
+def test_bypass_misses_but_refreshes_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ResponseCache(path).put("key", "old")
+
+    bypassed = ResponseCache(path, bypass=True)
+    assert bypassed.get("key") is None
+    bypassed.put("key", "new")
+    assert ResponseCache(path).get("key") == "new"
+
+
+def test_seeded_samples_are_served_from_the_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    backend = CountingBackend()
+    first = generate_cached(backend, ["What is 2 + 3?"] * 3, cache=cache, seed=5, do_sample=True)
+    again = generate_cached(backend, ["What is 2 + 3?"] * 3, cache=cache, seed=5, do_sample=True)
+
+    assert again == first
+    assert backend.generated == 3
+    assert cache.stats()["entries"] == 3
+
+
+def test_unseeded_samples_are_never_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    backend = CountingBackend()
+    generate_cached(backend, ["What is 2 + 3?"] * 3, cache=cache, do_sample=True)
+    generate_cached(backend, ["What is 2 + 3?"] * 3, cache=cache, do_sample=True)
+
+    assert backend.generated == 6
+    assert cache.stats()["entries"] == 0
+
+    # Greedy decoding is reproducible without a seed
+    generate_cached(backend, ["What is 2 + 3?"], cache=cache, do_sample=False)
+    generate_cached(backend, ["What is 2 + 3?"], cache=cache, do_sample=False)
+    assert backend.generated == 7
@@ -0,0 +1,97 @@
+import functools
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "q2", "src"))
+
+from common.backends import StubBackend, TransformersBackend
+from common.metrics import get_metrics
+from common.model_registry import get_registry
+from common.sharding import ShardedRunner, shard
+from reasoning_tree import ReasoningTree
+
+TEMPLATE = os.path.join(ROOT, "q2", "prompts", "initial_prompt.txt")
+
+
+def load_tasks():
+    with open(os.path.join(ROOT, "q2", "tasks", "problem_definitions.json"), 'r') as f:
+        return json.load(f)["tasks"]
+
+
+def scaled(factor, items):
+    for item in items:
+        if item < 0:
+            raise ValueError(f"negative item {item}")
+        yield item * factor
+
+
+def weights_in_shared_memory(shared_model, items):
+    # Runs in a worker: whether each weight of the adopted model is a shared-memory mapping
+    get_registry().adopt(shared_model)
+    loaded = get_registry().acquire(*shared_model.key)
+    for _ in items:
+        yield {name: tensor.is_shared() for name, tensor in loaded.model.state_dict().items()}
+
+
+@pytest.fixture
+def metrics():
+    metrics = get_metrics()
+    metrics.clear()
+    metrics.enable()
+    yield metrics
+    metrics.enabled = False
+    metrics.clear()
+
+
+def test_shard_is_round_robin():
+    assert shard(list(range(7)), 3) == [[0, 3, 6], [1, 4], [2, 5]]
+
+
+def test_runner_yields_every_result_and_reports_each_worker():
+    runner = ShardedRunner(3, threads_per_worker=1)
+    assert sorted(runner.run(range(10), functools.partial(scaled, 2))) == [2 * i for i in range(10)]
+    assert [stats["items"] for stats in runner.worker_stats] == [4, 3, 3]
+    assert all(stats["threads"] == 1 for stats in runner.worker_stats)
+
+
+def test_worker_errors_are_raised_in_the_parent():
+    runner = ShardedRunner(2, threads_per_worker=1)
+    with pytest.raises(RuntimeError, match="negative item -1"):
+        list(runner.run([1, -1, 2], functools.partial(scaled, 2)))
+
+
+def test_worker_metrics_are_merged(metrics):
+    tasks = load_tasks()
+    tree = ReasoningTree(backend=StubBackend(), seed=0)
+    results = list(tree.generate_paths_sharded(tasks, TEMPLATE, num_paths=2, workers=2))
+
+    assert sorted(task["id"] for task, _ in results) == sorted(task["id"] for task in tasks)
+    totals = metrics.summary()["totals"]
+    assert totals["calls"] == len(tasks)
+    assert totals["cache_misses"] == 2 * len(tasks)
+
+
+def test_workers_map_the_parents_weights(tiny_model):
+    backend = TransformersBackend(tiny_model, background_load=False)
+    runner = ShardedRunner(1, threads_per_worker=1)
+    [weights] = list(runner.run([0], functools.partial(weights_in_shared_memory, backend.shared_model())))
+
+    assert weights and all(weights.values())
+    assert all(tensor.is_shared() for tensor in backend.loaded.model.state_dict().values())
+    backend.close()
+
+
+def test_workers_generate_on_the_shared_model(tiny_model, metrics):
+    tasks = load_tasks()[:4]
+    tree = ReasoningTree(backend=TransformersBackend(tiny_model, background_load=False), seed=0)
+    assert tree.worker_stats == []
+    results = list(tree.generate_paths_sharded(tasks, TEMPLATE, num_paths=2, workers=2, threads_per_worker=1))
+
+    assert len(results) == len(tasks)
+    assert all(path.final_answer != "Error" for _, paths in results for path in paths)
+    assert len({stats["pid"] for stats in tree.worker_stats} | {os.getpid()}) == 3
+    assert metrics.summary()["totals"]["generated_tokens"] > 0
@@ -0,0 +1,70 @@
+import pytest
+
+from common.stopping import FIRST_LINE, StopCondition, StopTracker, build_stopping_criteria
+
+
+def test_stop_on_newline_skips_leading_blank_lines():
+    assert FIRST_LINE.truncate("\n\n  x = 3\nBecause 3x = 9") == "\n\n  x = 3"
+    assert FIRST_LINE.find_stop("  \n") is None
+    assert FIRST_LINE.find_stop("x = 3") is None
+
+
+def test_answer_markers_cut_at_the_end_of_the_marked_line():
+    condition = StopCondition(answer_markers=["Final Answer:"])
+    text = "Add the numbers.\nFINAL ANSWER: 42\nThis can be checked."
+    assert condition.truncate(text) == "Add the numbers.\nFINAL ANSWER: 42"
+    # The line holding the answer may still be growing
+    assert condition.find_stop("Add the numbers.\nFinal answer: 4") is None
+
+
+def test_custom_strings_cut_before_the_earliest_match():
+    condition = StopCondition(stop_strings=["###", "Q:"])
+    assert condition.truncate("x = 3\nQ: next ### more") == "x = 3\n"
+    assert condition.truncate("no stop here") == "no stop here"
+
+
+def test_the_earliest_of_several_conditions_wins():
+    condition = StopCondition(stop_strings=["END"], stop_on_newline=True, answer_markers=["answer:"])
+    assert condition.truncate("answer: 5 END\nmore") == "answer: 5 "
+    assert condition.truncate("answer: 5\nEND") == "answer: 5"
+
+
+class ByteTokenizer:
+    """Decodes UTF-8 byte ids and records how many ids each call decoded"""
+
+    def __init__(self):
+        self.decoded = []
+
+    def decode(self, ids, skip_special_tokens=True):
+        ids = [int(i) for i in ids]
+        self.decoded.append(len(ids))
+        return bytes(ids).decode("utf-8", errors="replace")
+
+
+def test_tracker_decodes_only_new_tokens():
+    tokenizer = ByteTokenizer()
+    tracker = StopTracker(StopCondition(answer_markers=["answer:"]), tokenizer)
+    ids = list("Working…\nAnswer: 7\nmore".encode("utf-8"))
+
+    stopped_at = next(step for step in range(1, len(ids) + 1) if tracker.update(ids[:step]))
+    assert bytes(ids[:stopped_at]).decode("utf-8") == "Working…\nAnswer: 7\n"
+    assert tracker.text == "Working…\nAnswer: 7\n"
+    # One id per step, except the three bytes of "…" which are decoded together
+    assert sum(tokenizer.decoded) < 2 * stopped_at
+
+
+def test_stopping_criteria_finish_rows_separately():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+
+    prompt = list(b"Q? ")
+    rows = [prompt + list(b"x = 3\nmore"), prompt + list(b"no newline")]
+    criteria = build_stopping_criteria(FIRST_LINE, ByteTokenizer(), len(prompt))[0]
+
+    finished_at = {}
+    for length in range(len(prompt) + 1, len(prompt) + 11):
+        finished = criteria(torch.tensor([row[:length] for row in rows]), None)
+        for row in range(2):
+            if finished[row]:
+                finished_at.setdefault(row, length - len(prompt))
+    assert finished_at == {0: 6}
@@ -0,0 +1,72 @@
+import pytest
+
+from common.templates import PromptTemplate
+
+
+class CharBackend:
+    """Counts one token per four characters, so tokens merge across segment boundaries"""
+    model_id = "chars"
+
+    def count_tokens(self, text):
+        return len(text) // 4
+
+
+def test_fit_checks_the_joined_prompt_against_the_budget():
+    template = PromptTemplate("Problem: {problem}\nAnswer", required=["problem"])
+    backend = CharBackend()
+    values = {"problem": "x" * 203}
+    # Segments round down separately, so their sum underestimates the prompt
+    assert template.count_tokens(backend, **values) < backend.count_tokens(template.format(**values))
+
+    for budget in range(10, 54):
+        prompt, truncated = template.fit(backend, budget, ["problem"], problem="x" * 203)
+        assert backend.count_tokens(prompt) <= budget
+        assert truncated == ["problem"]
+
+
+def test_fit_leaves_prompts_within_budget_alone():
+    template = PromptTemplate("Q: {question}", required=["question"])
+    assert template.fit(CharBackend(), 100, ["question"], question="2 + 2") == ("Q: 2 + 2", [])
+
+
+def test_fit_raises_when_static_text_alone_is_too_long():
+    template = PromptTemplate("A long fixed instruction. {question}", required=["question"])
+    with pytest.raises(ValueError):
+        template.fit(CharBackend(), 3, ["question"], question="2 + 2")
+
+
+class RecordingBackend(CharBackend):
+    """CharBackend that remembers every string it tokenized"""
+
+    def __init__(self):
+        self.counted = []
+
+    def count_tokens(self, text):
+        self.counted.append(text)
+        return super().count_tokens(text)
+
+
+def test_fit_only_tokenizes_slot_values_well_within_budget():
+    template = PromptTemplate("Problem: {problem}\nAnswer", required=["problem"])
+    backend = RecordingBackend()
+    template.fit(backend, 100, ["problem"], problem="2 + 2")
+    backend.counted.clear()
+
+    prompt, truncated = template.fit(backend, 100, ["problem"], problem="3 + 3")
+    assert (prompt, truncated) == ("Problem: 3 + 3\nAnswer", [])
+    assert backend.counted == ["3 + 3"]
+
+
+def test_format_applies_conversions_and_format_specs():
+    template = PromptTemplate("[{name!r}] [{count:>4}] [{ratio:.2f}] [{name}]")
+    assert template.format(name="x", count=7, ratio=0.5) == "['x'] [   7] [0.50] [x]"
+    assert template.format(name="x", count=7, ratio=0.5) == "[{name!r}] [{count:>4}] [{ratio:.2f}] [{name}]".format(
+        name="x", count=7, ratio=0.5
+    )
+    assert template.count_tokens(CharBackend(), name="x", count=7, ratio=0.5) > 0
+
+
+@pytest.mark.parametrize("text", ["{0}", "{}", "{item.name}", "{items[0]}", "{value:{width}}", "{unclosed"])
+def test_unsupported_placeholders_are_rejected_when_compiling(text):
+    with pytest.raises(ValueError, match="Invalid template"):
+        PromptTemplate(text)